@@ -5,10 +5,12 @@ import warnings
 from t2wml.settings import t2wml_settings
 from t2wml.wikification.utility_functions import add_entities_from_file, kgtk_to_dict, dict_to_kgtk
 from t2wml.wikification.item_table import Wikifier
+from t2wml.wikification.sqlite_item_table import SQLiteWikifier
 from t2wml.spreadsheets.sheet import Sheet, SpreadsheetFile
 from t2wml.mapping.statement_mapper import YamlMapper, StatementMapper, AnnotationMapper
 from t2wml.wikification.wikidata_provider import SparqlProvider, DictionaryProvider, WikidataProvider
 from t2wml.knowledge_graph import KnowledgeGraph, create_output_from_files
+from t2wml.mapping.session import MappingSession
 from t2wml.project import Project
 from t2wml.input_processing.annotation_parsing import Annotation
 from t2wml.input_processing.node_creation import AnnotationNodeGenerator, get_Pnode, get_Qnode, create_nodes_from_selection
@@ -1,8 +1,19 @@
+import json
+import os
+import tempfile
+from hashlib import sha256
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
 from t2wml.input_processing.region import YamlRegion
 from t2wml.settings import t2wml_settings
 from t2wml.utils.t2wml_exceptions import ErrorInYAMLFileException
-from t2wml.parsing.cleaning_functions import cleaning_functions_dict
+from t2wml.parsing.cleaning_functions import cleaning_functions_dict, vectorized_cleaning_functions
 from t2wml.utils.bindings import update_bindings
+from t2wml.utils.lru_cache import LRUCache
+from t2wml.spreadsheets.cleaned_values import CleanedValues, with_columns
+from t2wml.spreadsheets.compact_values import CompactValues
+from t2wml.spreadsheets.sheet_cache import encode_cells, decode_cells
 
 def create_lambda(function_name, *args, **kwargs):
     """create a composable lambda function from a cleaning function name"""
@@ -19,12 +30,47 @@ def compose(*fs):
     return composition
 
 
+def apply_cleaning_functions(values, functions):
+    """apply a list of (function_name, kwargs) to a numpy object array of cell values. returns the same results
+    as calling the composed functions on each value, but each distinct value is only cleaned once"""
+    values = np.array(values, dtype=object)
+    present = _not_none(values) # None isn't modified
+    if present.any():
+        # the cleaning functions only see str(value), so the distinct strings are cleaned and the results scattered back
+        codes, uniques = pd.factorize(pd.Series(values[present], dtype=object).astype(str))
+        cleaned = _apply_to_distinct(np.asarray(uniques, dtype=object), functions)
+        values[present] = cleaned[codes]
+    return values
+
+
+def _not_none(values):
+    return np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+
+
+def _apply_to_distinct(values, functions):
+    #uses the vectorized version of each function where there is one
+    for function_name, kwargs in functions:
+        present = _not_none(values)
+        if not present.any():
+            continue
+        strings = pd.Series(values[present], dtype=object).astype(str)
+        result = vectorized_cleaning_functions.get(function_name, lambda *args, **kwargs: None)(strings, **kwargs)
+        if result is None:
+            function = cleaning_functions_dict[function_name]
+            cleaned = np.empty(len(strings), dtype=object)
+            cleaned[:] = [function(value, **kwargs) for value in strings]
+        else:
+            cleaned = result.to_numpy(dtype=object)
+        values[present] = cleaned
+    return values
+
+
 class DFCleaner:
     def __init__(self, cleaning_mappings, sheet):
         self.sheet=sheet
         validate_cleaning_yaml(cleaning_mappings)
         instructions = self.get_instruction_sets(cleaning_mappings, sheet)
-        self.df=self.clean_sheet(instructions, sheet)
+        self.columns=self.clean_sheet(instructions, sheet)
 
     
     def get_instruction_sets(self, cleaning_mappings, sheet):
@@ -34,6 +80,7 @@ class DFCleaner:
             region=YamlRegion(mapping["region"])
             functions=mapping["functions"]
             parsed_funcs=[]
+            function_args=[]
             for function in functions:
                 if isinstance(function, dict):
                     for function_name, kwargs in function.items():
@@ -43,29 +90,188 @@ class DFCleaner:
                     kwargs={}
                 parsed_func = create_lambda(function_name, **kwargs)
                 parsed_funcs.append(parsed_func)
+                function_args.append((function_name, kwargs))
             final_func=compose(*parsed_funcs) 
-            parsing_instructions.append({"region":region, "parsed_func":final_func})
+            parsing_instructions.append({"region":region, "parsed_func":final_func, "functions":function_args})
         return parsing_instructions
 
 
     def clean_sheet(self, parsing_instructions, sheet):
-        df=sheet.data.copy(deep=True)
+        """returns {column index: array of the column's cleaned values} for the columns cleaning changes,
+        the rest of the sheet isn't copied"""
+        values=sheet._data_values
+        columns={}
         for instruction in parsing_instructions:
-            region = instruction["region"]
-            parsed_func=instruction["parsed_func"]
-            for col, row in region:
-                col=col-1
-                row=row-1
-                new_val=parsed_func(df.iloc[row, col])
-                df.iat[row, col]=new_val
-                #output=df.apply(np.vectorize(my_func)) #a possibly faster way, but needs fiddling
-        return df
-
-
-def get_cleaned_dataframe(sheet, yaml_instructions):         
-    #TODO: handle caching somehow?   
-    sc=DFCleaner(yaml_instructions, sheet)
-    return sc.df
+            cols, rows = self.region_positions(instruction["region"], values.shape)
+            for col in np.unique(cols).tolist():
+                if col not in columns:
+                    columns[col]=np.array(values[:, col], dtype=object)
+            #a cell that appears in the region more than once is cleaned again for each time it appears
+            positions, counts = np.unique(rows*values.shape[1]+cols, return_counts=True)
+            for repeat in range(1, counts.max()+1 if len(counts) else 1):
+                cell_rows, cell_cols = np.divmod(positions[counts >= repeat], values.shape[1])
+                cell_values = np.empty(len(cell_rows), dtype=object)
+                by_column = [(cell_cols == col, col) for col in np.unique(cell_cols).tolist()]
+                for in_column, col in by_column:
+                    cell_values[in_column] = columns[col][cell_rows[in_column]]
+                cell_values = apply_cleaning_functions(cell_values, instruction["functions"])
+                for in_column, col in by_column:
+                    columns[col][cell_rows[in_column]] = cell_values[in_column]
+        return columns
+
+    @property
+    def df(self):
+        #the cleaned data as a dataframe, sharing the columns that weren't cleaned with the sheet's data
+        return with_columns(self.sheet.data, self.columns)
+
+    @staticmethod
+    def region_positions(region, shape):
+        """the 0-indexed (cols, rows) arrays of the cells in region, with negative indices normalized the way iloc does"""
+        cells = np.array(list(region), dtype=np.int64).reshape(-1, 2)-1
+        cols, rows = cells[:, 0], cells[:, 1]
+        if ((cols >= shape[1]) | (cols < -shape[1]) | (rows >= shape[0]) | (rows < -shape[0])).any():
+            raise IndexError("single positional indexer is out-of-bounds")
+        return cols % shape[1], rows % shape[0]
+
+
+class CleanedDataCache(LRUCache):
+    """a bounded LRU cache of cleaned data (the cleaned columns, see get_cleaned_columns), keyed by cleaned_data_cache_key.
+    if t2wml_settings.cache_folder is set, cleaned data is also saved there, and read from there on a miss in memory.
+    the cached columns are shared between sheets with the same data, they should not be edited in place
+
+    Args:
+        maxsize (int): the maximum number of cleaned sheets kept in memory
+
+    Attributes:
+        disk_hits (int): number of misses in memory that were read from the cache folder
+    """
+    def __init__(self, maxsize=8):
+        super().__init__(maxsize)
+        self.disk_hits = 0
+
+    def get(self, key):
+        columns = super().get(key)
+        if columns is None:
+            columns = self._load(key)
+            if columns is not None:
+                self.disk_hits += 1
+                super().put(key, columns)
+        return columns
+
+    def put(self, key, columns):
+        super().put(key, columns)
+        self._save(key, columns)
+
+    def stats(self):
+        stats = super().stats()
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+    @staticmethod
+    def _path(key):
+        if not t2wml_settings.cache_folder:
+            return None
+        return os.path.join(t2wml_settings.cache_folder, "cleaned_data", key+".npz")
+
+    def _load(self, key):
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            #plain arrays, never pickles, so reading a file from the cache folder can't run code
+            with np.load(path, allow_pickle=False) as arrays:
+                return decode_columns(**arrays)
+        except Exception: #an unreadable file is the same as a miss, it will be overwritten
+            return None
+
+    def _save(self, key, columns):
+        path = self._path(key)
+        if path is None:
+            return
+        arrays = encode_columns(columns)
+        if arrays is None: #values other than strings and None are only cached in memory
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            #write to a temporary file first, so other processes never read a partly written file
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+                np.savez(f, **arrays)
+                temp_path = f.name
+            os.replace(temp_path, path)
+        except OSError: #the cache is an optimization, not being able to write it isn't an error
+            pass
+
+
+def encode_columns(columns):
+    """the cleaned columns ({column index: array}) as numeric arrays for saving without pickle: the values encoded the
+    same way as ParsedSheetCache (see encode_cells), one column after another, with a mask of the None values.
+    returns None if there are values other than strings and None"""
+    indices = np.array(list(columns), dtype=np.int64)
+    lengths = np.array([len(column) for column in columns.values()], dtype=np.int64)
+    values = np.concatenate([np.asarray(column, dtype=object) for column in columns.values()]) if columns else np.zeros(0, dtype=object)
+    is_none = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    if not all(isinstance(value, str) for value in values[~is_none]):
+        return None
+    offsets, data = encode_cells(np.where(is_none, "", values))
+    return dict(columns=indices, lengths=lengths, offsets=offsets, data=np.frombuffer(data, dtype=np.uint8), is_none=is_none)
+
+
+def decode_columns(columns, lengths, offsets, data, is_none):
+    """the inverse of encode_columns"""
+    values = decode_cells(offsets, data)
+    values[is_none] = None
+    ends = np.cumsum(lengths)
+    return {int(col): values[end-length:end].copy() for col, length, end in zip(columns, lengths, ends)}
+
+
+cleaned_data_cache = CleanedDataCache()
+
+
+def clear_cleaned_data_cache():
+    """forget the cleaned data kept in memory (files in the cache folder are kept)"""
+    cleaned_data_cache.clear()
+
+
+def cleaned_data_cache_key(sheet, cleaning_mappings):
+    """returns the key for cleaned_data_cache, a hash of the sheet's data and the cleaningMapping.
+    returns None if the cleaning can't be cached, because its regions use item[] (which depends on the wikifier)"""
+    mappings = json.dumps(cleaning_mappings, sort_keys=True, default=str)
+    if "item[" in mappings:
+        return None
+    values = sheet._data_values
+    digest = sha256(sheet.fingerprint.encode('utf-8'))
+    digest.update(mappings.encode('utf-8'))
+    #the fingerprint hashes str(value), the kinds of values in each column also tell apart eg 1 from "1" and None from "None"
+    digest.update(str(_column_types(values)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _column_types(values):
+    #infer_dtype of each column. the columns of compact values are all strings, apart from edited cells
+    raw_values = values.raw_values if isinstance(values, CleanedValues) else values
+    if not isinstance(raw_values, CompactValues):
+        return [infer_dtype(values[:, col], skipna=False) for col in range(values.shape[1])]
+    decode = set(raw_values.edited_columns) | set(getattr(values, "columns", {}))
+    string_type = "string" if values.shape[0] else "empty"
+    return [infer_dtype(values[:, col], skipna=False) if col in decode else string_type for col in range(values.shape[1])]
+
+
+def get_cleaned_columns(sheet, yaml_instructions):
+    """returns the columns of the sheet's data that are changed by cleaning according to the cleaningMapping yaml_instructions,
+    as {column index: array of the column's cleaned values}, eg for Sheet.set_cleaned_columns.
+    the same sheet data and instructions are only cleaned once, see cleaned_data_cache"""
+    key = cleaned_data_cache_key(sheet, yaml_instructions)
+    columns = cleaned_data_cache.get(key) if key is not None else None
+    if columns is None:
+        columns = DFCleaner(yaml_instructions, sheet).columns
+        if key is not None:
+            cleaned_data_cache.put(key, columns)
+    return columns
+
+
+def get_cleaned_dataframe(sheet, yaml_instructions):
+    """returns the sheet's data cleaned according to the cleaningMapping yaml_instructions, as a dataframe"""
+    return with_columns(sheet.data, get_cleaned_columns(sheet, yaml_instructions))
 
 
 def validate_cleaning_yaml(input):
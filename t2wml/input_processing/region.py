@@ -1,23 +1,88 @@
-from collections import defaultdict
 from hashlib import sha256
+import numpy as np
 from t2wml.utils.bindings import bindings
 from t2wml.input_processing.yaml_parsing import CodeParser
+from t2wml.input_processing.region_index import RegionAxis, RegionIndex
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
 from t2wml.parsing.t2wml_parsing import iter_on_n, t2wml_parse, T2WMLCode, iter_on_n_for_code
+from t2wml.parsing.vectorized_evaluation import VectorizedPredicate
 from t2wml.spreadsheets.conversions import cell_range_str_to_tuples, cell_str_to_tuple
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.utils.dependency_tracking import DependencyRecorder, get_recorder, recording
+from t2wml.utils.lru_cache import LRUCache
 
-region_cache = {"cache":{}}
+class RegionCache(LRUCache):
+    """a bounded LRU cache of built regions, keyed by (region yaml, sheet fingerprint, context), so that switching
+    between projects/sheets doesn't throw away the other regions, and a region is never reused for different sheet contents
+
+    Args:
+        maxsize (int): the maximum number of regions kept
+
+    Attributes:
+        hits (int): number of lookups answered from the cache
+        misses (int): number of lookups that weren't
+        generation (int): incremented on every clear, CompiledRegion uses it to know when to drop its own instances
+    """
+    def __init__(self, maxsize=64):
+        super().__init__(maxsize)
+        self.generation = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+region_cache = RegionCache()
+
+
+def clear_region_cache():
+    """forget all the cached regions (including CompiledRegion instances), eg after editing the sheet's values"""
+    region_cache.clear()
+
+
+def uses_names(yaml_data, names):
+    """does any string or code (T2WMLCode) in a region definition contain one of names"""
+    if isinstance(yaml_data, dict):
+        return any(uses_names(value, names) for value in yaml_data.values())
+    if isinstance(yaml_data, list):
+        return any(uses_names(value, names) for value in yaml_data)
+    code_str = getattr(yaml_data, "code_str", "") #T2WMLCode
+    return any(name in str(yaml_data) or name in code_str for name in names)
+
+
+def uses_item_table(yaml_data):
+    """does a region definition use item[], whose results depend on the wikifier's entries, so it can't be cached"""
+    return uses_names(yaml_data, ("item[",))
+
+
+def region_cache_key(yaml_data, context):
+    """returns the key for region_cache, or None if the region can't be cached
+    (the context isn't hashable, or the region uses item[], which depends on the wikifier)"""
+    if uses_item_table(yaml_data):
+        return None
+    yaml_text = str(yaml_data)
+    sheet = bindings.excel_sheet
+    fingerprint = sheet.fingerprint if sheet is not None else None
+    yaml_hash = sha256(yaml_text.encode('utf-8')).hexdigest()
+    try:
+        context_key = tuple(sorted(context.items()))
+        hash(context_key)
+    except TypeError:
+        return None
+    return (yaml_hash, fingerprint, context_key)
 
 
 class Region:
     def __init__(self, index_dict):
         '''
         uses 1-indexed indices
-        index_dict: keys are row indexes, values are arrays of column indexes
+        index_dict: keys are row indexes, values are arrays of column indexes. either a RegionIndex or a dict
         '''
         if len(index_dict) == 0:
             raise ValueError("Defined region does not include any cells")
+        if not isinstance(index_dict, RegionIndex):
+            index_dict = RegionIndex.from_dict(index_dict)
         self.index_dict=index_dict
 
     def __iter__(self):
@@ -25,26 +90,61 @@ class Region:
             for col in self.index_dict[row]:
                 yield col, row
 
+    def __len__(self):
+        """the number of cells"""
+        return self.index_dict.cell_count()
+
+    def __contains__(self, cell):
+        col, row = cell
+        return self.index_dict.contains_cell(col, row)
+
+    @property
+    def last_row(self):
+        return self.index_dict.last_row()
+
+    def iter_rows(self, first_row, last_row):
+        """the cells in rows first_row to last_row (inclusive), going over the rows in ascending order"""
+        for row in self.index_dict.rows_between(first_row, last_row):
+            for col in self.index_dict[row]:
+                yield col, row
 
 
 class YamlRegion(CodeParser, Region):
     #@basic_debug
-    def __init__(self, yaml_data, context=None):
+    def __init__(self, yaml_data, context=None, use_cache=True):
         self.context= context or {}
         self.yaml_data=yaml_data
-        yaml_hash = sha256(str(yaml_data).encode('utf-8')).hexdigest()
-        cache = region_cache["cache"].get(yaml_hash)
-        if cache:
-            self.index_dict = cache
+        if not use_cache:
+            self.build()
+            return
+        key = region_cache_key(yaml_data, self.context)
+        cache = region_cache.get(key) if key is not None else None
+        recorder = get_recorder()
+        # when recording dependencies, the cells read while building the region are cached with it, and replayed on a cache hit
+        if cache and (recorder is None or cache[1] is not None):
+            self.index_dict, region_reads = cache
+            if recorder is not None:
+                recorder.merge(region_reads)
         else:
-            self.range_args = self.get_range_arguments(yaml_data)
-            self.check_range_boundaries(self.range_args)
-            self.columns, self.rows, self.cells = self.get_select_arguments(yaml_data)
-            self.skip_cols, self.skip_rows, self.skip_cells = self.get_skip_arguments(yaml_data)
-            self.row_set=set()
-            self.col_Set=set()
-            self.index_dict= self.build_pairs()
-            region_cache["cache"]={yaml_hash:self.index_dict}
+            region_reads = None
+            if recorder is not None:
+                region_reads = DependencyRecorder(recorder.row_len, recorder.col_len)
+            with recording(region_reads):
+                self.build()
+            if recorder is not None:
+                recorder.merge(region_reads)
+            if key is not None:
+                region_cache.put(key, (self.index_dict, region_reads))
+
+    def build(self):
+        yaml_data = self.yaml_data
+        self.range_args = self.get_range_arguments(yaml_data)
+        self.check_range_boundaries(self.range_args)
+        self.columns, self.rows, self.cells = self.get_select_arguments(yaml_data)
+        self.skip_cols, self.skip_rows, self.skip_cells = self.get_skip_arguments(yaml_data)
+        self.row_set=set()
+        self.col_Set=set()
+        self.index_dict= self.build_pairs()
 
 
     def check_range_boundaries(self, region):
@@ -144,6 +244,11 @@ class YamlRegion(CodeParser, Region):
                 code_arg=self.get_code_replacement(col_arg)
                 if "$row" in str(col_arg):
                     raise T2WMLExceptions.ErrorInYAMLFileException("Cannot use $row in columns or skip_columns")
+                cols = self._loop_positions(self.range_args["t_var_left"], self.range_args["t_var_right"])
+                mask = self._evaluate_predicate(code_arg, ("t_var_col",), cols, np.zeros_like(cols))
+                if mask is not None:
+                    new_columns.extend(cols[mask].tolist())
+                    continue
                 for col in range(self.range_args["t_var_left"], self.range_args["t_var_right"]+1):
                     context={"t_var_col":col}
                     context.update(self.range_args)
@@ -160,6 +265,11 @@ class YamlRegion(CodeParser, Region):
                 code_arg=self.get_code_replacement(row_arg)
                 if "$col" in str(row_arg):
                     raise T2WMLExceptions.ErrorInYAMLFileException("Cannot use $col in rows or skip_rows")
+                rows = self._loop_positions(self.range_args["t_var_top"], self.range_args["t_var_bottom"])
+                mask = self._evaluate_predicate(code_arg, ("t_var_row",), np.zeros_like(rows), rows)
+                if mask is not None:
+                    new_rows.extend(rows[mask].tolist())
+                    continue
                 for row in range(self.range_args["t_var_top"], self.range_args["t_var_bottom"]+1):
                     context={"t_var_row":row}
                     context.update(self.range_args)
@@ -174,6 +284,15 @@ class YamlRegion(CodeParser, Region):
                 if "->" not in cell_arg:
                     cell_arg+=" -> ($col, $row)"
                 code_arg=self.get_code_replacement(cell_arg)
+                cols = self._loop_positions(self.range_args["t_var_left"], self.range_args["t_var_right"])
+                rows = self._loop_positions(self.range_args["t_var_top"], self.range_args["t_var_bottom"])
+                if cols is not None and rows is not None:
+                    # the same order as the loops below, column by column
+                    cols, rows = np.repeat(cols, len(rows)), np.tile(rows, len(cols))
+                    mask = self._evaluate_predicate(code_arg, ("t_var_col", "t_var_row"), cols, rows)
+                    if mask is not None:
+                        new_cells.extend(zip(cols[mask].tolist(), rows[mask].tolist()))
+                        continue
                 for col in range(self.range_args["t_var_left"], self.range_args["t_var_right"]+1):
                     for row in range(self.range_args["t_var_top"], self.range_args["t_var_bottom"]+1):
                         context={"t_var_col":col, "t_var_row":row}
@@ -186,6 +305,25 @@ class YamlRegion(CodeParser, Region):
                 new_cells.append((col+1, row+1)) #switch to one-indexed
         return new_columns, new_rows, new_cells
     
+    @staticmethod
+    def _loop_positions(first, last):
+        if not (isinstance(first, int) and isinstance(last, int)):
+            return None
+        return np.arange(first, last+1, dtype=np.int64)
+
+    def _evaluate_predicate(self, code_arg, variables, cols, rows):
+        """evaluates code_arg for all the positions at once if it is a supported predicate (see VectorizedPredicate).
+        returns a boolean mask, or None if it needs to be evaluated one position at a time"""
+        if cols is None or rows is None:
+            return None
+        # the loop variable is overwritten if it's in the range arguments or the context, then eval is needed
+        if any(variable in self.range_args or variable in self.context for variable in variables):
+            return None
+        predicate = VectorizedPredicate.create(code_arg.code_str, variables)
+        if predicate is None:
+            return None
+        return predicate.evaluate(cols, rows, bindings.excel_sheet)
+
     def get_select_arguments(self, yaml_data):
         columns=yaml_data.get("columns", [])
         rows=yaml_data.get("rows", [])
@@ -201,39 +339,32 @@ class YamlRegion(CodeParser, Region):
         return skip_columns, skip_rows, skip_cells
 
     def build_pairs(self):
-        index_dict=defaultdict(list)
         #if we only specified cells, not any of the range args, don't build a range for pairs
         range_args=set(['range', 'top', 'bottom', 'right', 'left', 'columns', 'rows'])
+        rows, columns, skip_cells = RegionAxis([]), RegionAxis([]), ()
         if len(range_args.intersection(self.yaml_data)):
             if not self.columns:
                 try:
-                    self.columns=[col for col in range(self.range_args["t_var_left"], self.range_args["t_var_right"]+1)]
+                    self.columns=range(self.range_args["t_var_left"], self.range_args["t_var_right"]+1)
                 except Exception as e:
                     raise T2WMLExceptions.ErrorInYAMLFileException("You have not specified a valid set of arguments (left+right, range, or columns) for columns")
             if not self.rows:
                 try:
-                    self.rows=[row for row in range(self.range_args["t_var_top"], self.range_args["t_var_bottom"]+1)]
+                    self.rows=range(self.range_args["t_var_top"], self.range_args["t_var_bottom"]+1)
                 except Exception as e:
                     raise T2WMLExceptions.ErrorInYAMLFileException("You have not specified a valid set of arguments (top+bottom, range, or rows) for rows")
-                    
+            columns, rows = RegionAxis(self.columns), RegionAxis(self.rows)
+
             #get rid of any duplicates before removal
             self.skip_cols=set(self.skip_cols)
             self.skip_rows=set(self.skip_rows)
             for col in self.skip_cols:
-                self.columns.remove(col)
+                columns.remove(col)
             for row in self.skip_rows:
-                self.rows.remove(row)
-
-            skip_cells=set(self.skip_cells)
-            for row in self.rows:
-                for col in self.columns:
-                    if (col, row) not in skip_cells:
-                        index_dict[row].append(col)
+                rows.remove(row)
+            skip_cells=self.skip_cells
 
-        for (col, row) in self.cells:
-            index_dict[row].append(col)
-
-        
+        index_dict=RegionIndex(rows, columns, skip_cells, self.cells)
         if len(index_dict)<1:
              raise T2WMLExceptions.ErrorInYAMLFileException("No data cells specified")
 
@@ -243,3 +374,66 @@ class YamlRegion(CodeParser, Region):
         fixed = self.fix_code_string(input_str)
         compiled_statement = compile(fixed, "<string>", "eval")
         return T2WMLCode(compiled_statement, fixed, input_str)
+
+
+class CompiledRegion:
+    """a region definition from a template (eg a qualifier's region), parsed once and instantiated for each statement.
+    the definition is checked once for which of $row and $col it uses, and instances are cached by the values of just those,
+    so a region that uses neither is only built once per sheet, and one that uses $row once per row.
+    the cache is emptied whenever the sheet, its values, or the item table change, or clear_region_cache is called.
+    regions that use item[] aren't cached, since the item table's entries can be edited in place.
+
+    Args:
+        yaml_data (dict): the region definition
+    """
+    context_variables = {"t_var_row": ("$row", "t_var_row"), "t_var_col": ("$col", "t_var_col")}
+
+    def __init__(self, yaml_data):
+        self.yaml_data = yaml_data
+        self.variables = tuple(variable for variable, names in self.context_variables.items()
+                               if uses_names(yaml_data, names))
+        self.cacheable = not uses_item_table(yaml_data)
+        self._reset(None)
+
+    def _reset(self, state):
+        self._state = state
+        self._instances = {}  # values of self.variables: (Region, DependencyRecorder or None)
+
+    def _current_state(self):
+        sheet = bindings.excel_sheet
+        values = sheet._data_values if sheet is not None else None
+        return (region_cache.generation, sheet, values, bindings.item_table)
+
+    def instantiate(self, context):
+        """returns the Region for a statement with context (its $row and $col)"""
+        state = self._current_state()
+        if self._state is None or self._state[0] != state[0] \
+                or any(old is not new for old, new in zip(self._state[1:], state[1:])):
+            self._reset(state)
+        key = tuple(context.get(variable) for variable in self.variables)
+        recorder = get_recorder()
+        instance = self._instances.get(key)
+        if instance is None or (recorder is not None and instance[1] is None):
+            region_reads = None
+            if recorder is not None:
+                region_reads = DependencyRecorder(recorder.row_len, recorder.col_len)
+            with recording(region_reads):
+                region = YamlRegion(self.yaml_data, context=context, use_cache=False)
+            instance = (Region(region.index_dict), region_reads)
+            if self.cacheable:
+                self._instances[key] = instance
+        region, region_reads = instance
+        if recorder is not None:
+            recorder.merge(region_reads)
+        return region
+
+    def __getstate__(self):
+        # instances hold on to the sheet, and are rebuilt anyway in a new process
+        return dict(yaml_data=self.yaml_data, variables=self.variables, cacheable=self.cacheable)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset(None)
+
+    def __str__(self):
+        return str(self.yaml_data)
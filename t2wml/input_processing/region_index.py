@@ -0,0 +1,221 @@
+from collections import Counter
+from heapq import merge
+import numpy as np
+
+
+class RegionAxis:
+    """the (1-indexed) rows or columns of a region's rectangle: a range, or an array for lists from the yaml,
+    with an optional mask of the positions that are still included after skips are removed.
+    a range with no skips takes the same memory however long it is.
+
+    Args:
+        values (range or list): the rows/columns, in order (lists may contain duplicates)
+    """
+    def __init__(self, values):
+        if isinstance(values, range):
+            self.values = values
+        else:
+            try:
+                self.values = np.asarray(values, dtype=np.int64)
+            except (TypeError, ValueError):  # something other than numbers, keep it as-is
+                self.values = np.asarray(values, dtype=object)
+        self.keep = None
+
+    @property
+    def is_range(self):
+        return isinstance(self.values, range)
+
+    def __len__(self):
+        if self.keep is None:
+            return len(self.values)
+        return int(np.count_nonzero(self.keep))
+
+    def __iter__(self):
+        if self.keep is None:
+            if self.is_range:
+                yield from self.values
+            else:
+                yield from self.values.tolist()
+            return
+        for index in np.flatnonzero(self.keep).tolist():
+            value = self.values[index]
+            yield value if self.is_range else value.item() if hasattr(value, "item") else value
+
+    def __contains__(self, value):
+        if self.is_range and self.keep is None:
+            return value in self.values
+        return self.count(value) > 0
+
+    def count(self, value):
+        """how many times value is included"""
+        if self.is_range:
+            if value not in self.values:
+                return 0
+            if self.keep is None:
+                return 1
+            return int(self.keep[self.values.index(value)])
+        try:
+            return self._counts.get(value, 0)
+        except AttributeError:
+            self._counts = Counter(self)
+            return self._counts.get(value, 0)
+        except TypeError:  # unhashable
+            return 0
+
+    def remove(self, value):
+        """the same as list.remove: remove the first included occurrence of value, ValueError if there isn't one"""
+        if self.keep is None:
+            self.keep = np.ones(len(self.values), dtype=bool)
+        if self.is_range:
+            positions = [self.values.index(value)] if value in self.values else []
+        else:
+            positions = np.flatnonzero(self.values == value)
+        for position in positions:
+            if self.keep[position]:
+                self.keep[position] = False
+                self.__dict__.pop("_counts", None)
+                return
+        raise ValueError("list.remove(x): x not in list")
+
+    def unique(self):
+        """the included values without duplicates, in order of first appearance"""
+        if self.is_range:
+            return iter(self)
+        return iter(dict.fromkeys(self))
+
+    def descending(self):
+        """the included values from largest to smallest, without duplicates"""
+        if self.is_range and self.values.step == 1:
+            if self.keep is None:
+                return reversed(self.values)
+            return (self.values[index] for index in reversed(range(len(self.values))) if self.keep[index])
+        return iter(sorted(self.unique(), reverse=True))
+
+    def sorted_between(self, first, last):
+        """the included values from first to last (inclusive), sorted and without duplicates"""
+        if self.is_range and self.values.step == 1:
+            start = max(first, self.values.start)
+            stop = min(last+1, self.values.stop)
+            if self.keep is None:
+                return iter(range(start, stop))
+            return (value for value in range(start, stop) if self.keep[value-self.values.start])
+        return iter(sorted(value for value in self.unique() if first <= value <= last))
+
+
+class RegionIndex:
+    """the cells of a region, stored as the rows and columns of its rectangle (see RegionAxis), the skipped cells inside it,
+    and any individually listed cells, instead of as a list of columns for every row.
+
+    Behaves like the read-only dict {row: [columns]} (1-indexed, in the same order) that regions used to build,
+    and also supports counting, membership and iteration by row range for cells.
+
+    Args:
+        rows (RegionAxis): the rows of the rectangle part of the region
+        columns (RegionAxis): the columns of the rectangle part of the region
+        skip_cells (iterable): (col, row) cells to leave out of the rectangle
+        cells (iterable): (col, row) cells to add, after the rectangle
+    """
+    def __init__(self, rows, columns, skip_cells=(), cells=()):
+        self.rows = rows
+        self.columns = columns
+        self.skip_cells = {}  # row: set of columns, only for cells inside the rectangle
+        for col, row in set(skip_cells):
+            if row in rows and col in columns:
+                self.skip_cells.setdefault(row, set()).add(col)
+        self.extra_cells = {}  # row: [columns], in the order they were listed
+        for col, row in cells:
+            self.extra_cells.setdefault(row, []).append(col)
+
+    @classmethod
+    def from_dict(cls, index_dict):
+        cells = [(col, row) for row, cols in index_dict.items() for col in cols]
+        return cls(RegionAxis([]), RegionAxis([]), cells=cells)
+
+    def _rectangle_columns(self, row):
+        count = self.rows.count(row)
+        if not count:
+            return []
+        skipped = self.skip_cells.get(row, ())
+        columns = [col for col in self.columns if col not in skipped]
+        return columns*count
+
+    def _in_rectangle(self, row):
+        if row not in self.rows or not len(self.columns):
+            return False
+        skipped = self.skip_cells.get(row)
+        if not skipped:
+            return True
+        return any(col not in skipped for col in self.columns.unique())
+
+    def __getitem__(self, row):
+        columns = self._rectangle_columns(row) + self.extra_cells.get(row, [])
+        if not columns:
+            raise KeyError(row)
+        return columns
+
+    def __contains__(self, row):
+        return row in self.extra_cells or self._in_rectangle(row)
+
+    def get(self, row, default=None):
+        try:
+            return self[row]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        """the rows, in the same order as the dict"""
+        if len(self.columns):
+            for row in self.rows.unique():
+                if not self.skip_cells.get(row) or self._in_rectangle(row):
+                    yield row
+        for row in self.extra_cells:
+            if not self._in_rectangle(row):
+                yield row
+
+    def __len__(self):
+        """the number of rows, like the dict. see cell_count for the number of cells"""
+        if len(self.columns):
+            rectangle_rows = len(self.rows) if self.rows.is_range else len(set(self.rows.unique()))
+            empty_rows = sum(1 for row in self.skip_cells if not self._in_rectangle(row))
+            rectangle_rows -= empty_rows
+        else:
+            rectangle_rows = 0
+        return rectangle_rows + sum(1 for row in self.extra_cells if not self._in_rectangle(row))
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for row in self:
+            yield row, self[row]
+
+    def cell_count(self):
+        count = len(self.rows)*len(self.columns)
+        for row, skipped in self.skip_cells.items():
+            count -= self.rows.count(row)*sum(self.columns.count(col) for col in skipped)
+        return count + sum(len(columns) for columns in self.extra_cells.values())
+
+    def contains_cell(self, col, row):
+        if col in self.extra_cells.get(row, ()):
+            return True
+        return row in self.rows and col in self.columns and col not in self.skip_cells.get(row, ())
+
+    def rows_between(self, first, last):
+        """the rows from first to last (inclusive) that have cells, in ascending order"""
+        rectangle_rows = self.rows.sorted_between(first, last) if len(self.columns) else iter(())
+        extra_rows = iter(sorted(row for row in self.extra_cells if first <= row <= last))
+        previous = None
+        for row in merge(rectangle_rows, extra_rows):
+            if row != previous and row in self:
+                yield row
+            previous = row
+
+    def last_row(self):
+        """the largest row that has cells (the same as max(index_dict))"""
+        rows = list(self.extra_cells)
+        if len(self.columns):
+            for row in self.rows.descending():
+                if self._in_rectangle(row):
+                    rows.append(row)
+                    break
+        return max(rows)
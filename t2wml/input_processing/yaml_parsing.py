@@ -82,8 +82,20 @@ class TemplateParser(CodeParser):
     def create_eval_template(self, template):
         new_template = dict(template)
         self.recursive_get_code_replacement(new_template)
+        self.compile_qualifier_regions(new_template)
         return new_template
 
+    def compile_qualifier_regions(self, eval_template):
+        from t2wml.input_processing.region import CompiledRegion  # avoid circular import, region uses CodeParser
+        qualifiers = eval_template.get("qualifier")
+        if not isinstance(qualifiers, list):
+            return
+        for index, qualifier in enumerate(qualifiers):
+            if isinstance(qualifier, dict) and isinstance(qualifier.get("region"), dict):
+                qualifier = dict(qualifier)
+                qualifier["region"] = CompiledRegion(qualifier["region"])
+                qualifiers[index] = qualifier
+
 
 class Template:
     #@basic_debug
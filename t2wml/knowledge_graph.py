@@ -1,11 +1,15 @@
 import json
+from functools import partial
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
 from t2wml.wikification.item_table import Wikifier
 from t2wml.spreadsheets.sheet import Sheet
 from t2wml.spreadsheets.conversions import to_excel
 from t2wml.mapping.statement_mapper import YamlMapper, StatementMapper
+from t2wml.mapping.statements import StatementError
 from t2wml.outputs.canonical_spreadsheet import create_canonical_spreadsheet
-from t2wml.outputs.kgtk import create_kgtk
+from t2wml.outputs.kgtk import create_kgtk, KgtkStreamWriter
+from t2wml.outputs.jsonl import JsonLinesStreamWriter
+from t2wml.utils.execution_context import execution_context, iterate_in_context
 
 
 class KnowledgeGraph:
@@ -30,24 +34,83 @@ class KnowledgeGraph:
     @classmethod
     def get_single_cell(cls, statement_mapper:StatementMapper, sheet:Sheet, wikifier:Wikifier, row:int, col:int):
         """get result for a single cell. does not create a KnowledgeGraph instance"""
-        statement, errors = statement_mapper.get_cell_statement(col, row, True, sheet, wikifier)
+        with execution_context():
+            statement, errors = statement_mapper.get_cell_statement(col, row, True, sheet, wikifier)
         return statement, errors
 
     @classmethod
-    def generate(cls, statement_mapper:StatementMapper, sheet:Sheet, wikifier:Wikifier, start=0, end=None, count=None):
+    def generate(cls, statement_mapper:StatementMapper, sheet:Sheet, wikifier:Wikifier, start=0, end=None, count=None, workers=None):
         """create a KnowledgeGraph instance from API classes
 
         Args:
             statement_mapper (StatementMapper): a statement_mapper, eg a YamlMapper
             sheet (Sheet): the sheet being used to create the knowledge graph
             wikifier (Wikifier): the wikifier used for creating an item table
+            workers (int, optional): number of processes to shard the rows across. Defaults to None (run serially).
 
         Returns:
             KnowledgeGraph: an initialized KnowledgeGraph instance
         """
-        statements, errors, metadata = statement_mapper.get_statements(sheet, wikifier, start, end, count)
+        # each generate call gets its own bindings (sharing the current settings), so several can run at once in different threads
+        with execution_context():
+            if workers:
+                statements, errors, metadata = statement_mapper.get_statements(sheet, wikifier, start, end, count, workers=workers)
+            else:
+                statements, errors, metadata = statement_mapper.get_statements(sheet, wikifier, start, end, count)
         return cls(statements, errors, metadata, sheet)
 
+    @classmethod
+    def iter_statements(cls, statement_mapper:StatementMapper, sheet:Sheet, wikifier:Wikifier, start=0, end=None):
+        """a generator that yields statements one at a time instead of creating a KnowledgeGraph instance,
+        for sheets with too many statements to hold in memory
+
+        Args:
+            statement_mapper (StatementMapper): a statement_mapper, eg a YamlMapper
+            sheet (Sheet): the sheet being used to create the statements
+            wikifier (Wikifier): the wikifier used for creating an item table
+
+        Yields:
+            tuple: (cell, statement, errors) for each cell with a statement or errors. statement is None if there are only errors.
+        """
+        return iterate_in_context(statement_mapper.iter_statements(sheet, wikifier, start, end))
+
+    @classmethod
+    def stream_to_file(cls, statement_mapper:StatementMapper, sheet:Sheet, wikifier:Wikifier, output_filename:str, filetype:str="tsv", start=0, end=None):
+        """create statements and write them to a file as they are created, without holding them all in memory
+
+        Args:
+            statement_mapper (StatementMapper): a statement_mapper, eg a YamlMapper
+            sheet (Sheet): the sheet being used to create the statements
+            wikifier (Wikifier): the wikifier used for creating an item table
+            output_filename (str): location to save output
+            filetype (str, optional): accepts "tsv" (or "kgtk") and "jsonl". Defaults to "tsv".
+
+        Returns:
+            dict: the errors, in the same format as KnowledgeGraph.errors, including statements that couldn't be
+                  converted to kgtk
+        """
+        #check the filetype before opening (and truncating) the output file
+        if filetype in ["kgtk", "tsv"]:
+            create_writer = partial(KgtkStreamWriter, file_path=sheet.data_file_name, sheet_name=sheet.name)
+        elif filetype == "jsonl":
+            create_writer = JsonLinesStreamWriter
+        else:
+            raise T2WMLExceptions.FileTypeNotSupportedException(
+                "No support for "+filetype+" format")
+        errors = {}
+        with open(output_filename, 'w', encoding="utf-8", newline="") as f:
+            writer = create_writer(f)
+            for cell, statement, cell_errors in cls.iter_statements(statement_mapper, sheet, wikifier, start, end):
+                if statement is not None:
+                    writer.write_statement(cell, statement)
+                if cell_errors:
+                    errors[cell] = cell_errors
+        if filetype in ["kgtk", "tsv"]:
+            #statements that couldn't be converted to kgtk (any rows created before the error are still written)
+            for cell, message in writer.errors.items():
+                errors.setdefault(cell, []).append(StatementError(message=message, field="fatal", level="Major").__dict__)
+        return errors
+
     @classmethod
     def generate_from_files(cls, data_file_path: str, sheet_name: str, yaml_file_path: str, wikifier_filepath:str):
         """create a KnowledgeGraph instance from file paths
@@ -0,0 +1,81 @@
+import numpy as np
+from t2wml.parsing.t2wml_parsing import T2WMLCode, PrecomputedCode, MemoizedCode
+from t2wml.parsing.code_analysis import CONSTANT, ROW, COL
+from t2wml.parsing.vectorized_evaluation import VectorizedExpression
+
+
+class PreparedTemplate:
+    """An eval template prepared for evaluating every cell of a region during a single get_statements run.
+    Expressions that can be evaluated for the whole region at once are calculated up front,
+    and their results are substituted into the template returned for each cell.
+    Expressions that only depend on $row, only on $col, or on neither are evaluated once per row/column/run,
+    and the result is reused for the other cells (see MemoizedCode).
+    Anything else is left as-is for the regular per-cell evaluation.
+
+    Args:
+        eval_template (dict): the template, as created by TemplateParser
+    """
+    def __init__(self, eval_template):
+        self.eval_template = eval_template
+        self.slots = self.find_code_slots(eval_template)
+        self.results = {}  # slot index: {(col, row): result}
+        self.memos = {}  # slot index: (dependency, {memo key: memoized result})
+
+    @staticmethod
+    def find_code_slots(eval_template):
+        """returns a list of (list_key, list_index, key, code) for all code in the template.
+        list_key and list_index are None for top-level keys, and otherwise locate the qualifier/reference the key is in"""
+        slots = []
+        for key, entry in eval_template.items():
+            if isinstance(entry, T2WMLCode):
+                slots.append((None, None, key, entry))
+            elif key in ("qualifier", "reference") and isinstance(entry, list):
+                for index, node in enumerate(entry):
+                    if isinstance(node, dict):
+                        for node_key, node_entry in node.items():
+                            if isinstance(node_entry, T2WMLCode):
+                                slots.append((key, index, node_key, node_entry))
+        return slots
+
+    def prepare(self, cells, sheet, item_table):
+        """cells is a list of (col, row) 1-indexed tuples"""
+        if not cells:
+            return
+        cols = np.fromiter((cell[0] for cell in cells), dtype=np.int64, count=len(cells))
+        rows = np.fromiter((cell[1] for cell in cells), dtype=np.int64, count=len(cells))
+        for slot_index, (list_key, list_index, key, code) in enumerate(self.slots):
+            vectorized = VectorizedExpression.create(code)
+            if vectorized is not None:
+                self.results[slot_index] = vectorized.evaluate(cols, rows, sheet, item_table)
+            elif code.dependency in (CONSTANT, ROW, COL):
+                self.memos[slot_index] = (code.dependency, {})
+
+    def for_cell(self, col, row):
+        """returns the template to evaluate for the cell, with any precalculated results substituted in"""
+        replacements = []
+        for slot_index, cell_results in self.results.items():
+            result = cell_results.get((col, row), missing)
+            if result is not missing:
+                replacements.append((slot_index, PrecomputedCode(self.slots[slot_index][3], result)))
+        for slot_index, (dependency, memo) in self.memos.items():
+            key = row if dependency == ROW else col if dependency == COL else None
+            replacements.append((slot_index, MemoizedCode(self.slots[slot_index][3], memo, key)))
+        if not replacements:
+            return self.eval_template
+        template = dict(self.eval_template)
+        copied_nodes = set()
+        for slot_index, replacement in replacements:
+            list_key, list_index, key, code = self.slots[slot_index]
+            if list_key is None:
+                template[key] = replacement
+            else:
+                if list_key not in copied_nodes:
+                    template[list_key] = list(template[list_key])
+                    copied_nodes.add(list_key)
+                node = dict(template[list_key][list_index])
+                node[key] = replacement
+                template[list_key][list_index] = node
+        return template
+
+
+missing = object()
@@ -0,0 +1,199 @@
+from collections import defaultdict
+from itertools import islice
+from t2wml.input_processing.region import clear_region_cache
+from t2wml.knowledge_graph import KnowledgeGraph
+from t2wml.mapping.statement_mapper import BATCH_SIZE
+from t2wml.spreadsheets.cleaned_values import changed_cells
+from t2wml.utils.bindings import update_bindings
+from t2wml.utils.dependency_tracking import DependencyRecorder, recording
+from t2wml.utils.execution_context import ExecutionContext, execution_context, get_execution_context
+from t2wml.wikification.utility_functions import property_type_table
+
+
+class MappingSession:
+    """Keeps the statements created for a sheet, together with the sheet cells each statement read while it was being evaluated.
+    After editing some cells (or the wikifier entries for some cells), only the statements that read those cells are evaluated again,
+    instead of running get_statements on the whole sheet.
+
+    The session runs in its own ExecutionContext (sharing the settings that were current when it was created).
+
+    Args:
+        statement_mapper (StatementMapper): a statement_mapper, eg a YamlMapper
+        sheet (Sheet): the sheet being edited
+        wikifier (Wikifier): the wikifier used for creating an item table
+
+    Attributes:
+        statements (dict): the same as KnowledgeGraph.statements
+        errors (dict): the same as KnowledgeGraph.errors
+    """
+    def __init__(self, statement_mapper, sheet, wikifier):
+        self.statement_mapper = statement_mapper
+        self.sheet = sheet
+        self.wikifier = wikifier
+        self.context = ExecutionContext(settings=get_execution_context().settings)
+        self.refresh()
+
+    @property
+    def metadata(self):
+        return {
+            "data_file": self.sheet.data_file_name,
+            "sheet_name": self.sheet.name,
+        }
+
+    def knowledge_graph(self):
+        """returns a KnowledgeGraph with (a copy of) the current statements"""
+        return KnowledgeGraph(dict(self.statements), dict(self.errors), self.metadata, self.sheet)
+
+    def refresh(self):
+        """evaluate all the statements from scratch, eg after changing the yaml"""
+        with execution_context(self.context):
+            self._init_mapper()
+            self.region = list(self.statement_mapper.iterator())
+            self.statements = {}
+            self.errors = {}
+            self._reads = {} # statement cell: DependencyRecorder
+            self._cell_dependents = defaultdict(set) # sheet cell: statement cells
+            self._range_dependents = defaultdict(dict) # sheet column: {statement cell: [(row_start, row_stop)]}
+            self._evaluate(self.region)
+
+    def update_cells(self, values):
+        """edit cells in the sheet and update the statements that are affected
+
+        Args:
+            values (dict): (col, row): new value, 0-indexed
+
+        Returns:
+            set: the (0-indexed) cells of the statements that were evaluated again
+        """
+        with execution_context(self.context):
+            if self.sheet.is_cleaned:
+                old_values = self.sheet._data_values
+            else:
+                old_values = None
+            for (col, row), value in values.items():
+                self.sheet.set_value(row, col, value)
+            self._init_mapper()
+            changed = set(values)
+            if old_values is not None and self.sheet.is_cleaned:
+                # cleaning may change cells other than the ones edited, compare the new cleaned values with the old ones
+                new_values = self.sheet._data_values
+                if new_values.shape == old_values.shape:
+                    changed.update(changed_cells(old_values, new_values))
+                else:
+                    return self._refresh_all()
+            clear_region_cache() # the cached regions may depend on the old values
+            return self._update(changed)
+
+    def update_wikifier(self, cells=None):
+        """update the statements after changing the wikifier entries for cells
+
+        Args:
+            cells (iterable, optional): the (col, row) 0-indexed cells whose entries were changed. Defaults to None, for re-evaluating everything
+
+        Returns:
+            set: the (0-indexed) cells of the statements that were evaluated again
+        """
+        with execution_context(self.context):
+            clear_region_cache() # the cached regions may depend on the old wikifier entries
+            if cells is None:
+                return self._refresh_all()
+            return self._update(set(cells))
+
+    def _refresh_all(self):
+        self.refresh()
+        return {(col-1, row-1) for col, row in self.region}
+
+    def _init_mapper(self):
+        update_bindings(item_table=self.wikifier.item_table, sheet=self.sheet)
+        self.statement_mapper.do_init(self.sheet, self.wikifier)
+
+    def _dependents(self, cells):
+        dependents = set()
+        for cell in cells:
+            dependents.update(self._cell_dependents.get(cell, ()))
+            col, row = cell
+            for statement_cell, ranges in self._range_dependents.get(col, {}).items():
+                for row_start, row_stop in ranges:
+                    if row_start <= row < row_stop:
+                        dependents.add(statement_cell)
+                        break
+        return dependents
+
+    def _update(self, changed):
+        old_region = set(self.region)
+        new_region = list(self.statement_mapper.iterator())
+        new_region_set = set(new_region)
+        dependents = self._dependents(changed)
+        for col, row in old_region - new_region_set:
+            self._forget((col-1, row-1))
+        to_evaluate = [(col, row) for col, row in new_region
+                       if (col-1, row-1) in dependents or (col, row) not in old_region]
+        self.region = new_region
+        existing_statements, existing_errors = set(self.statements), set(self.errors)
+        self._evaluate(to_evaluate)
+        if set(self.statements) - existing_statements or set(self.errors) - existing_errors:
+            self._reorder() # keep the statements in region order, like get_statements
+        return {(col-1, row-1) for col, row in to_evaluate}
+
+    def _evaluate(self, cells):
+        cells = iter(cells)
+        with property_type_table(self.statement_mapper.create_property_type_table()):
+            while True:
+                batch = list(islice(cells, BATCH_SIZE))
+                if not batch:
+                    return
+                self.statement_mapper.prepare_cells(batch)
+                try:
+                    for col, row in batch:
+                        self._evaluate_cell(col, row)
+                finally:
+                    self.statement_mapper.release_cells()
+
+    def _evaluate_cell(self, col, row):
+        key = (col-1, row-1)
+        self._forget_reads(key)
+        recorder = DependencyRecorder(self.sheet.row_len, self.sheet.col_len)
+        recorder.add_cell(col-1, row-1) #empty cells are skipped, so the statement always depends on its own cell
+        with recording(recorder):
+            result = self.statement_mapper._evaluate_cell(col, row)
+        self._remember(key, recorder)
+        statement, errors = None, None
+        if result is not None:
+            cell, statement, errors = result
+        # existing entries are replaced in place, so they keep their position
+        if statement is not None:
+            self.statements[key] = statement
+        else:
+            self.statements.pop(key, None)
+        if errors:
+            self.errors[key] = errors
+        else:
+            self.errors.pop(key, None)
+
+    def _remember(self, key, recorder):
+        self._reads[key] = recorder
+        for cell in recorder.cells:
+            self._cell_dependents[cell].add(key)
+        for col_start, col_stop, row_start, row_stop in recorder.ranges:
+            for col in range(col_start, col_stop):
+                self._range_dependents[col].setdefault(key, []).append((row_start, row_stop))
+
+    def _forget(self, key):
+        self.statements.pop(key, None)
+        self.errors.pop(key, None)
+        self._forget_reads(key)
+
+    def _forget_reads(self, key):
+        recorder = self._reads.pop(key, None)
+        if recorder is None:
+            return
+        for cell in recorder.cells:
+            self._cell_dependents[cell].discard(key)
+        for col_start, col_stop, row_start, row_stop in recorder.ranges:
+            for col in range(col_start, col_stop):
+                self._range_dependents[col].pop(key, None)
+
+    def _reorder(self):
+        keys = [(col-1, row-1) for col, row in self.region]
+        self.statements = {key: self.statements[key] for key in keys if key in self.statements}
+        self.errors = {key: self.errors[key] for key in keys if key in self.errors}
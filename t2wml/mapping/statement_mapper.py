@@ -1,16 +1,22 @@
 from abc import ABC, abstractmethod
+import contextvars
 import json
 import yaml
 import multiprocessing as mp
+from itertools import islice
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
 from t2wml.mapping.statements import EvaluatedStatement, PartialStatement, StatementError
 from t2wml.utils.bindings import update_bindings, bindings
 from t2wml.input_processing.yaml_parsing import validate_yaml, Template
 from t2wml.input_processing.region import YamlRegion
-from t2wml.input_processing.clean_yaml_parsing import get_cleaned_dataframe
+from t2wml.input_processing.clean_yaml_parsing import get_cleaned_columns
 from t2wml.input_processing.annotation_parsing import Annotation
 from t2wml.input_processing.utils import string_is_valid
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.mapping.prepared_template import PreparedTemplate
+from t2wml.utils.execution_context import get_execution_context, set_execution_context, ExecutionContext
+from t2wml.wikification.utility_functions import PropertyTypeTable, property_type_table
+from t2wml.settings import t2wml_settings
 
 class StatementMapper(ABC):
     """an abstract class for creating statementmapper classes. refer to the api documentation for more details.
@@ -26,39 +32,162 @@ class StatementMapper(ABC):
     def do_init(self, sheet, wikifier):
         pass
 
+    def prepare_cells(self, cells):
+        """called with each batch of (col, row) cells from the iterator before they are evaluated, for precalculating anything that can be"""
+        pass
+
+    def release_cells(self):
+        """called after evaluating the batch, for freeing anything prepare_cells created"""
+        pass
+
+    def constant_properties(self):
+        """properties that are known before evaluating any cells, for looking up all their types at the start of the run"""
+        return []
+
+    def create_property_type_table(self):
+        """a PropertyTypeTable for a single run, with the types of constant_properties already fetched"""
+        table = PropertyTypeTable()
+        if not t2wml_settings.no_wikification:
+            table.prefetch(self.constant_properties())
+        return table
+
     #@basic_debug
-    def get_statements(self, sheet, wikifier, start_index=0, end_index=None, count=None):
+    def get_statements(self, sheet, wikifier, start_index=0, end_index=None, count=None, workers=None):
+        if workers is not None and workers > 1 and count is None:
+            return self.get_statements_parallel(sheet, wikifier, start_index, end_index, workers)
+        update_bindings(item_table=wikifier.item_table, sheet=sheet) #_get_statements reads the sheet from the bindings
+        self.do_init(sheet, wikifier)
+        statements, cell_errors = self._get_statements(start_index, end_index, count)
+        metadata = {
+            "data_file": sheet.data_file_name,
+            "sheet_name": sheet.name,
+        }
+        return statements, cell_errors, metadata
+
+    def iter_statements(self, sheet, wikifier, start_index=0, end_index=None):
+        """a generator version of get_statements. yields (cell, statement, errors) for each cell with a statement or errors,
+        without holding all the statements in memory. statement is None for cells that only have errors."""
+        update_bindings(item_table=wikifier.item_table, sheet=sheet)
         self.do_init(sheet, wikifier)
+        yield from self._iter_statements(start_index, end_index)
+
+    def get_statements_parallel(self, sheet, wikifier, start_index=0, end_index=None, workers=2):
+        """shards the rows between start_index and end_index across a pool of worker processes.
+        each worker runs do_init once and then evaluates its shards with the serial code path.
+        results are merged back in shard order, so statements keep the same order as the serial version.
+        the iterator must respect start_index and end_index for sharding to divide up the work.
+        """
+        if end_index is None:
+            last_row = sheet.row_len-1
+        else:
+            last_row = end_index
+        shards = split_rows(start_index, last_row, workers*4)
+        if not shards:
+            return self.get_statements(sheet, wikifier, start_index, end_index)
+        # the last shard keeps the original end_index, so rows the iterator yields beyond the sheet behave as before
+        shards[-1] = (shards[-1][0], end_index)
+
+        wikifier.item_table.commit() #so workers reading a stored item table see the latest changes
+        initargs = (self, sheet, wikifier, get_execution_context().settings)
+        with mp.Pool(processes=workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = pool.map(_get_statements_for_shard, shards)
+
         statements = {}
         cell_errors = {}
+        for shard_statements, shard_errors in results:
+            statements.update(shard_statements)
+            cell_errors.update(shard_errors)
         metadata = {
             "data_file": sheet.data_file_name,
             "sheet_name": sheet.name,
         }
+        return statements, cell_errors, metadata
 
-        i=0
-        for col, row in self.iterator(start_index, end_index):
-            errors=[]
-            cell = (col-1, row-1)
-            if string_is_valid(str(bindings.excel_sheet[row-1, col-1])):
+    def _get_statements(self, start_index=0, end_index=None, count=None):
+        statements = {}
+        cell_errors = {}
+        for cell, statement, errors in self._iter_statements(start_index, end_index, count):
+            if statement is not None:
+                statements[cell] = statement
+            if errors:
+                cell_errors[cell] = errors
+        return statements, cell_errors
+
+    def _iter_statements(self, start_index=0, end_index=None, count=None):
+        with property_type_table(self.create_property_type_table()):
+            cells = self.iterator(start_index, end_index)
+            if count is not None: #count+1 cells, the same as the loop always did
+                for col, row in islice(cells, count+1):
+                    result = self._evaluate_cell(col, row)
+                    if result is not None:
+                        yield result
+                return
+            # cells are evaluated in batches, so anything precalculated in prepare_cells only needs to be held for one batch at a time
+            while True:
+                batch = list(islice(cells, BATCH_SIZE))
+                if not batch:
+                    return
+                self.prepare_cells(batch)
                 try:
-                    statement, inner_errors = self.get_cell_statement(col, row, do_init=False)
-                    if "value" in statement: #exclude empty statements
-                        statements[cell] = statement
-                    if inner_errors:
-                        errors = inner_errors
-                except T2WMLExceptions.TemplateDidNotApplyToInput as e:
-                    errors = e.errors
-                except Exception as e:
-                    errors = [StatementError(message=str(e),
-                                                       field="fatal",
-                                                       level="Major")]
-                if errors:
-                    cell_errors[cell] = [error.__dict__ if isinstance(error, StatementError) else error for error in errors ]
-            if i == count:
-                break
-            i+=1
-        return statements, cell_errors, metadata
+                    for col, row in batch:
+                        result = self._evaluate_cell(col, row)
+                        if result is not None:
+                            yield result
+                finally:
+                    self.release_cells()
+
+    def _evaluate_cell(self, col, row):
+        """returns (cell, statement, errors), or None if the cell is empty or has no statement or errors"""
+        statement=None
+        errors=[]
+        cell = (col-1, row-1)
+        if not string_is_valid(str(bindings.excel_sheet[row-1, col-1])):
+            return None
+        try:
+            cell_statement, inner_errors = self.get_cell_statement(col, row, do_init=False)
+            if "value" in cell_statement: #exclude empty statements
+                statement = cell_statement
+            if inner_errors:
+                errors = inner_errors
+        except T2WMLExceptions.TemplateDidNotApplyToInput as e:
+            errors = e.errors
+        except Exception as e:
+            errors = [StatementError(message=str(e),
+                                               field="fatal",
+                                               level="Major")]
+        if statement is None and not errors:
+            return None
+        errors = [error.__dict__ if isinstance(error, StatementError) else error for error in errors]
+        return cell, statement, errors
+
+
+BATCH_SIZE = 10000
+
+
+def split_rows(start_index, end_index, shard_count):
+    """split the (inclusive, 0-indexed) row range into at most shard_count contiguous (start, end) pairs"""
+    total = end_index - start_index + 1
+    if total < 1:
+        return []
+    size = max(1, -(-total // shard_count))
+    return [(start, min(start+size-1, end_index)) for start in range(start_index, end_index+1, size)]
+
+
+_worker_state = {}
+
+def _init_worker(statement_mapper, sheet, wikifier, settings):
+    set_execution_context(ExecutionContext(sheet=sheet, item_table=wikifier.item_table, settings=settings))
+    statement_mapper.do_init(sheet, wikifier)
+    _worker_state["statement_mapper"] = statement_mapper
+
+def _get_statements_for_shard(shard):
+    start_index, end_index = shard
+    return _worker_state["statement_mapper"]._get_statements(start_index, end_index)
+
+
+# the templates prepare_cells created for the batch being evaluated, {mapper: PreparedTemplate}.
+# kept in a contextvar rather than on the mapper, so threads sharing a mapper each evaluate with their own
+_prepared_templates = contextvars.ContextVar("t2wml_prepared_templates", default=None)
 
 
 class YamlMapper(StatementMapper):
@@ -70,27 +199,55 @@ class YamlMapper(StatementMapper):
 
     def do_init(self, sheet, wikifier):
         if self.yaml_data.get("cleaningMapping"):
-            new_df=get_cleaned_dataframe(sheet, self.yaml_data["cleaningMapping"])
-            sheet.cleaned_data=new_df
+            sheet.cleaned_data=None #clean the raw data, not the results of a previous cleaning
+            sheet.set_cleaned_columns(get_cleaned_columns(sheet, self.yaml_data["cleaningMapping"]))
         update_bindings(item_table=wikifier.item_table, sheet=sheet)
-        
+        self.release_cells()
+
+    def prepare_cells(self, cells):
+        #evaluate whatever expressions can be evaluated for all the cells at once with numpy
+        prepared_template = PreparedTemplate(self.template.eval_template)
+        prepared_template.prepare(cells, bindings.excel_sheet, bindings.item_table)
+        prepared_templates = dict(_prepared_templates.get() or {})
+        prepared_templates[self] = prepared_template
+        _prepared_templates.set(prepared_templates)
+
+    def release_cells(self):
+        prepared_templates = _prepared_templates.get()
+        if prepared_templates and self in prepared_templates:
+            prepared_templates = dict(prepared_templates)
+            del prepared_templates[self]
+            _prepared_templates.set(prepared_templates)
+
+    def constant_properties(self):
+        properties = []
+        template = self.template.eval_template
+        nodes = [template] + list(template.get("qualifier", [])) + list(template.get("reference", []))
+        for node in nodes:
+            if isinstance(node, dict) and isinstance(node.get("property"), str):
+                properties.append(node["property"])
+        return properties
+
+    def cell_template(self, col, row):
+        """the eval template for the cell, with any results precalculated by prepare_cells filled in"""
+        prepared_template = (_prepared_templates.get() or {}).get(self)
+        if prepared_template is None:
+            return self.template.eval_template
+        return prepared_template.for_cell(col, row)
 
     def get_cell_statement(self, col, row, do_init=False, sheet=None, wikifier=None):
         if do_init:
             self.do_init(sheet, wikifier)
         context = {"t_var_row": row, "t_var_col": col}
         statement = EvaluatedStatement(
-            context=context, **self.template.eval_template)
+            context=context, **self.cell_template(col, row))
         return statement.serialize(), statement.errors
 
     def iterator(self, start_index=0, end_index=None):
         region=YamlRegion(self.yaml_data['statementMapping']['region'])
         if end_index is None:
-            end_index=max(region.index_dict)-1
-        for row in range(start_index+1, end_index+2): #switch to 1-indexed...
-            if row in region.index_dict:
-                for col in region.index_dict[row]:
-                    yield col, row
+            end_index=region.last_row-1
+        yield from region.iter_rows(start_index+1, end_index+1) #switch to 1-indexed...
 
     @property
     def template(self):
@@ -142,7 +299,7 @@ class PartialAnnotationMapper(AnnotationMapper):
         if do_init:
             self.do_init(sheet, wikifier)
         context = {"t_var_row": row, "t_var_col": col}
-        statement = PartialStatement(context=context, **self.template.eval_template)
+        statement = PartialStatement(context=context, **self.cell_template(col, row))
         serialized_statement=statement.serialize()
         if "value" not in serialized_statement: #circumvent the check against empty values
             serialized_statement["value"]=""
@@ -1,6 +1,6 @@
 from copy import deepcopy
 from collections import defaultdict
-from t2wml.input_processing.region import YamlRegion
+from t2wml.input_processing.region import YamlRegion, CompiledRegion
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
 from t2wml.parsing.t2wml_parsing import iter_on_n_for_code, T2WMLCode
 from t2wml.parsing.classes import ReturnClass
@@ -329,7 +329,9 @@ class EvaluatedStatement(Statement, NodeForEval):
             new_qualifiers = []
             for i, q in enumerate(self.qualifier):
                 region = q.get("region", None)
-                if region:
+                if isinstance(region, CompiledRegion):
+                    iterator = region.instantiate(self.context)
+                elif region:
                     iterator = YamlRegion(region, context=self.context)
                 else:
                     iterator = fake_iter()
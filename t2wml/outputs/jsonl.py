@@ -0,0 +1,17 @@
+import json
+from t2wml.spreadsheets.conversions import to_excel
+
+
+class JsonLinesStreamWriter:
+    """writes statements straight to an open (text) file as json lines, one statement per line:
+    {"cell": "B3", "statement": {...}}
+
+    Args:
+        stream (file object): where to write the output
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write_statement(self, cell, statement):
+        line = json.dumps({"cell": to_excel(*cell), "statement": statement})
+        self.stream.write(line + "\n")
@@ -7,7 +7,7 @@ from t2wml.outputs.datamart_edges import (clean_id, create_metadata_for_custom_q
                 create_metadata_for_qualifier_property, link_statement_to_dataset)
 from t2wml.input_processing.utils import VALID_PROPERTY_TYPES
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
-from t2wml.wikification.utility_functions import get_property_type
+from t2wml.wikification.utility_functions import get_property_type, property_type_table, PropertyTypeTable
 from t2wml.wikification.utility_functions import kgtk_to_dict
 from t2wml.utils.debug_logging import basic_debug
 
@@ -164,8 +164,24 @@ def handle_additional_edges(project, statements):
             result_dict["node2;kgtk:symbol"] = value
     return tsv_data
 
-#@basic_debug
-def create_kgtk(statements, file_path, sheet_name, project=None):
+kgtk_fieldnames = ["id", "node1", "label", "node2", "node2;kgtk:data_type",
+                  "node2;kgtk:number", "node2;kgtk:low_tolerance", "node2;kgtk:high_tolerance", "node2;kgtk:units_node",
+                  "node2;kgtk:date_and_time", "node2;kgtk:precision", "node2;kgtk:calendar",
+                  "node2;kgtk:truth",
+                  "node2;kgtk:symbol",
+                  "node2;kgtk:latitude", "node2;kgtk:longitude", "node2;kgtk:globe",
+                  "node2;kgtk:text", "node2;kgtk:language", ]
+
+
+def get_kgtk_writer(stream):
+    # quotechar/escapechar None (rather than '') means no quoting or escaping at all. newer pythons reject ''
+    return csv.DictWriter(stream, kgtk_fieldnames,
+                            restval="", delimiter="\t", lineterminator="\n",
+                            escapechar=None, quotechar=None,
+                            dialect=csv.unix_dialect, quoting=csv.QUOTE_NONE)
+
+
+def get_id_prefix(file_path, sheet_name):
     file_name = Path(file_path).name
 
     file_extension = Path(file_path).suffix
@@ -173,67 +189,95 @@ def create_kgtk(statements, file_path, sheet_name, project=None):
         sheet_name = ""
     else:
         sheet_name = "."+sheet_name
+    return file_name + sheet_name + ";"
 
-    tsv_data = []
-
-    if project:
-        tsv_data+=handle_additional_edges(project, statements)
-    
-    error_cells={}
 
-    for cell, statement in statements.items():
-        try:
-            id = file_name + sheet_name + ";" + to_excel(cell[0], cell[1])
+def add_statement_kgtk_rows(rows, cell, statement, id_prefix, project=None):
+    """appends the kgtk rows for a single statement to rows"""
+    id = id_prefix + to_excel(cell[0], cell[1])
 
-            if project:
-                tsv_data.append(link_statement_to_dataset(project, id))
+    if project:
+        rows.append(link_statement_to_dataset(project, id))
 
-            cell_result_dict = dict(
-                id=id, node1=statement["subject"], label=statement["property"])
-            kgtk_add_property_type_specific_fields(statement, cell_result_dict)
-            tsv_data.append(cell_result_dict)
+    cell_result_dict = dict(
+        id=id, node1=statement["subject"], label=statement["property"])
+    kgtk_add_property_type_specific_fields(statement, cell_result_dict)
+    rows.append(cell_result_dict)
 
-            qualifiers = statement.get("qualifier", [])
-            for qualifier in qualifiers:
-                qualifier_result_dict = dict(id=id+"-"+qualifier["property"],
-                    node1=id, label=qualifier["property"])
+    qualifiers = statement.get("qualifier", [])
+    for qualifier in qualifiers:
+        qualifier_result_dict = dict(id=id+"-"+qualifier["property"],
+            node1=id, label=qualifier["property"])
 
-                try:
-                    kgtk_add_property_type_specific_fields(
-                        qualifier, qualifier_result_dict)
-                    tsv_data.append(qualifier_result_dict)
-                except EmptyValueException:
-                    # Allow missing qualifier values
-                    pass
+        try:
+            kgtk_add_property_type_specific_fields(
+                qualifier, qualifier_result_dict)
+            rows.append(qualifier_result_dict)
+        except EmptyValueException:
+            # Allow missing qualifier values
+            pass
 
+    references = statement.get("reference", [])
+    # todo: handle references
 
 
-            references = statement.get("reference", [])
-            # todo: handle references
-        except Exception as e:
-            error_cells[cell]=str(e)
+#@basic_debug
+def create_kgtk(statements, file_path, sheet_name, project=None):
+    id_prefix = get_id_prefix(file_path, sheet_name)
 
     string_stream = StringIO("", newline="")
-    fieldnames = ["id", "node1", "label", "node2", "node2;kgtk:data_type",
-                  "node2;kgtk:number", "node2;kgtk:low_tolerance", "node2;kgtk:high_tolerance", "node2;kgtk:units_node",
-                  "node2;kgtk:date_and_time", "node2;kgtk:precision", "node2;kgtk:calendar",
-                  "node2;kgtk:truth",
-                  "node2;kgtk:symbol",
-                  "node2;kgtk:latitude", "node2;kgtk:longitude", "node2;kgtk:globe",
-                  "node2;kgtk:text", "node2;kgtk:language", ]
-
-    writer = csv.DictWriter(string_stream, fieldnames,
-                            restval="", delimiter="\t", lineterminator="\n",
-                            escapechar='', quotechar='',
-                            dialect=csv.unix_dialect, quoting=csv.QUOTE_NONE)
+    writer = get_kgtk_writer(string_stream)
     writer.writeheader()
-    for entry in tsv_data:
-        writer.writerow(entry)
+
+    if project:
+        writer.writerows(handle_additional_edges(project, statements))
+    
+    error_cells={}
+
+    with property_type_table():
+        for cell, statement in statements.items():
+            rows = []
+            try:
+                add_statement_kgtk_rows(rows, cell, statement, id_prefix, project)
+            except Exception as e:
+                error_cells[cell]=str(e)
+            writer.writerows(rows) #rows added before an error are still written
 
     output = string_stream.getvalue()
     string_stream.close()
     return output
 
+
+class KgtkStreamWriter:
+    """writes kgtk rows for statements straight to an open (text) file, one statement at a time,
+    for outputs too large to create in memory with create_kgtk.
+    project metadata edges need all the statements up front, so they are not supported here.
+
+    Args:
+        stream (file object): where to write the output
+        file_path (str): the data file the statements are from (used for the ids)
+        sheet_name (str): the sheet the statements are from (used for the ids)
+
+    Attributes:
+        errors (dict): cell: error message, for statements that could not be converted to kgtk
+    """
+    def __init__(self, stream, file_path, sheet_name):
+        self.id_prefix = get_id_prefix(file_path, sheet_name)
+        self.writer = get_kgtk_writer(stream)
+        self.writer.writeheader()
+        self.errors = {}
+        self.property_types = PropertyTypeTable()
+
+    def write_statement(self, cell, statement):
+        rows = []
+        with property_type_table(self.property_types):
+            try:
+                add_statement_kgtk_rows(rows, cell, statement, self.id_prefix)
+            except Exception as e:
+                self.errors[cell] = str(e)
+        self.writer.writerows(rows)
+
+
 #@basic_debug
 def get_all_variables(project, statements, validate_for_datamart=False):
     tsv_data=[]
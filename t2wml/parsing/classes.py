@@ -1,5 +1,6 @@
 from t2wml.utils.t2wml_exceptions import ModifyingItemsIsForbiddenException
 from t2wml.utils.bindings import bindings
+from t2wml.utils.dependency_tracking import record_cell_read, record_range_read
 from t2wml.spreadsheets.conversions import to_excel
 from t2wml.settings import t2wml_settings
 
@@ -96,6 +97,7 @@ class RangeClass:
 class Item(ReturnClass): 
     def __init__(self, col, row, context):
         super().__init__(col, row)
+        record_cell_read(col, row)
         item_table = bindings.item_table
         
         if t2wml_settings.no_wikification:
@@ -145,6 +147,7 @@ class ItemExpression:
 class Cell(ReturnClass):
     def __init__(self, col, row):
         super().__init__(col, row)
+        record_cell_read(col, row)
         data_sheet = bindings.excel_sheet
         self._value = data_sheet[row, col]
 
@@ -162,6 +165,7 @@ class CellRange(RangeClass):
         data_sheet = bindings.excel_sheet
         self.col_args = col_args
         self.row_args = row_args
+        record_range_read(col_args, row_args)
         data = data_sheet[row_args, col_args]
         ndim = data.ndim
         data = data.tolist()
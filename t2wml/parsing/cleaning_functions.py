@@ -1,6 +1,7 @@
 #please note that cleaning functions are documented pretty extensively in grammar.md
 
 import math
+import numpy as np
 import re
 import string
 import ftfy as FTFY
@@ -46,6 +47,7 @@ def string_modifier(func):
             except:
                 return res_string
         return input
+    wrapper.is_string_modifier = True
     return wrapper
 
 @string_modifier
@@ -260,3 +262,141 @@ cleaning_functions_dict=dict(
     fill_empty=fill_empty, #v
 )
 
+
+
+# vectorized versions of the cleaning functions, used by DFCleaner to clean a whole region at once.
+# each one takes a pandas Series of strings (the cells that aren't None) and the same arguments as the function,
+# and returns the cleaned Series, or None for arguments it doesn't handle, in which case the function is called for each cell.
+# the results must be exactly the same as calling the function on each cell.
+
+float_like = re.compile(r"[ \t\n\r\f\v]*[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?[ \t\n\r\f\v]*")
+regex_non_alphanumeric = re.compile(r"[\W_]+")
+regex_non_printable = re.compile("[^"+re.escape(string.printable)+"]+")
+regex_whitespace = re.compile(r"\s+")
+
+def _vectorized_strip_whitespace(series, char=None, where=start_and_end):
+    if char is not None and not (isinstance(char, str) and char):
+        return None
+    if where == everywhere:
+        if char is None:
+            return series.str.replace(regex_whitespace, "", regex=True)
+        return series.str.replace(char, "", regex=False)
+    if where == start:
+        return series.str.lstrip(char)
+    if where == end:
+        return series.str.rstrip(char)
+    if where == start_and_end:
+        return series.str.strip(char)
+    return None
+
+def _vectorized_replace_regex(series, to_replace, replacement="", count=0):
+    if not (isinstance(to_replace, str) and isinstance(replacement, str)):
+        return None
+    if type(count) != int or count < 0:
+        return None
+    return series.str.replace(re.compile(to_replace), replacement, n=count or -1, regex=True)
+
+def _vectorized_remove_numbers(series, where=everywhere):
+    if where == everywhere:
+        return series.str.translate(remove_digits).str.strip()
+    if where == start_and_end:
+        return series.str.strip('0123456789.-').str.strip()
+    if where == start:
+        return series.str.lstrip('0123456789.-').str.strip()
+    if where == end:
+        return series.str.rstrip('0123456789.-').str.strip()
+    return None
+
+def _vectorized_remove_letters(series, where=everywhere):
+    if where not in [start, end, start_and_end, everywhere]:
+        return None
+    regex=r"\D*"
+    if where == everywhere:
+        series = series.str.replace(regex, "", regex=True)
+    if where == start or where == start_and_end:
+        series = series.str.replace("^"+regex, "", regex=True)
+    if where == end or where == start_and_end:
+        series = series.str.replace(regex+"$", "", regex=True)
+    return series
+
+def _vectorized_truncate(series, length):
+    if type(length) != int:
+        return None
+    return series.str.slice(0, length)
+
+def _vectorized_normalize_whitespace(series, tab=False):
+    return series.str.replace(regex_normalize_whitespace, "\t" if tab else " ", regex=True)
+
+def _vectorized_change_case(series, case="sentence"):
+    if case == "sentence":
+        return series.str.capitalize()
+    if case == "lower":
+        return series.str.lower()
+    if case == "upper":
+        return series.str.upper()
+    if case == "title":
+        return series.str.title()
+    return None
+
+def _vectorized_pad(series, length, pad_text, where=start):
+    #padding with more than one character is done cell by cell
+    pad_text=str(pad_text)
+    if type(length) != int or len(pad_text) != 1 or where not in [start, end]:
+        return None
+    padded = series.str.pad(length, side="left" if where == start else "right", fillchar=pad_text)
+    return padded.where(series.str.len() > 0, series) #don't pad empty strings
+
+def _converts_to_float(series):
+    #float_like strings always convert, only the others that might (with digits, inf or nan) are tried with float
+    converts = series.str.fullmatch(float_like).to_numpy(dtype=bool)
+    maybe = ~converts & series.str.contains(r"\d|[nN]").to_numpy(dtype=bool)
+    values = series.to_numpy()
+    for index in np.flatnonzero(maybe):
+        try:
+            float(values[index])
+            converts[index] = True
+        except ValueError:
+            pass
+    return converts
+
+def _vectorized_make_numeric(series, decimal=".", latex=False):
+    if not isinstance(decimal, str):
+        return None
+    numeric = _converts_to_float(series)
+    processed = series.str.replace(regex_whitespace, "", regex=True)
+    if decimal!=".":
+        processed = processed.str.replace(".", "", regex=False).str.replace(decimal, ".", regex=False)
+    processed = processed.str.replace(",", "", regex=False)
+    processed = processed.str.replace(non_numeric_beginning, "", regex=True)
+    processed = processed.str.replace(non_numeric_ending, "", regex=True)
+    processed = processed.where(_converts_to_float(processed), "") #if it's not numeric, return an empty cell
+    return processed.where(~numeric, series.str.strip())
+
+def _vectorized_make_alphanumeric(series):
+    return series.str.replace(regex_non_alphanumeric, "", regex=True)
+
+def _vectorized_make_ascii(series, translate=False):
+    if translate:
+        return None
+    return series.str.replace(regex_non_printable, "", regex=True)
+
+def _vectorized_fill_empty(series, replacement):
+    if not isinstance(replacement, (str, int, float)):
+        return None
+    return series.where(series.str.strip() != "", replacement)
+
+
+vectorized_cleaning_functions=dict(
+    strip_whitespace=_vectorized_strip_whitespace,
+    remove_numbers=_vectorized_remove_numbers,
+    remove_letters=_vectorized_remove_letters,
+    replace_regex=_vectorized_replace_regex,
+    truncate=_vectorized_truncate,
+    normalize_whitespace=_vectorized_normalize_whitespace,
+    change_case=_vectorized_change_case,
+    pad=_vectorized_pad,
+    make_numeric=_vectorized_make_numeric,
+    make_alphanumeric=_vectorized_make_alphanumeric,
+    make_ascii=_vectorized_make_ascii,
+    fill_empty=_vectorized_fill_empty,
+)
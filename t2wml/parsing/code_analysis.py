@@ -0,0 +1,211 @@
+#static analysis of t2wml code strings (after fix_code_string), for recognizing expressions
+#that can be evaluated with something faster than a call to eval per cell
+
+import ast
+import sys
+import numpy as np
+from t2wml.parsing.constants import char_dict
+from t2wml.parsing.template_functions import functions_dict
+from t2wml.parsing.cleaning_functions import cleaning_functions_dict
+
+known_functions = dict(functions_dict)
+known_functions.update(cleaning_functions_dict)
+
+row_var = "t_var_row"
+col_var = "t_var_col"
+n_var = "t_var_n"
+
+# what the result of a code depends on, within a single get_statements run
+CONSTANT = "constant"
+ROW = "row"
+COL = "col"
+CELL = "cell"
+
+
+class IndexExpression:
+    """an index argument inside value[] or item[], of the form constant, $col+k, or $row+k (1-indexed),
+    optionally plus or minus $n"""
+    def __init__(self, variable, offset, n_sign=0):
+        self.variable = variable  # None, t_var_col, or t_var_row
+        self.offset = offset
+        self.n_sign = n_sign  # 1 for +$n, -1 for -$n, 0 if there is no $n. not included by evaluate
+
+    def evaluate(self, cols, rows):
+        """cols and rows are numpy arrays of the 1-indexed cells being evaluated"""
+        if self.variable == col_var:
+            return cols + self.offset
+        if self.variable == row_var:
+            return rows + self.offset
+        return np.full(len(cols), self.offset, dtype=np.int64)
+
+    def evaluate_at(self, col, row):
+        """the same as evaluate, for a single (1-indexed) cell"""
+        if self.variable == col_var:
+            return col + self.offset
+        if self.variable == row_var:
+            return row + self.offset
+        return self.offset
+
+
+class CellReference:
+    """a value[col, row] or item[col, row, context] expression with simple index arguments"""
+    def __init__(self, kind, col, row, context=''):
+        self.kind = kind  # "value" or "item"
+        self.col = col
+        self.row = row
+        self.context = context
+
+
+class StringModifierCall:
+    """a call to a string_modifier function whose extra arguments are all literals"""
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, input):
+        return self.function(input, *self.args, **self.kwargs)
+
+
+def parse_code(code_str):
+    try:
+        return ast.parse(code_str, mode="eval").body
+    except SyntaxError:
+        return None
+
+
+def get_code_dependency(code_str):
+    """classifies code by the variables it uses: CONSTANT if its result is the same for every cell,
+    ROW/COL if it only depends on $row/$col, CELL otherwise (both, or any $q variable).
+    $n doesn't count, it's iterated on inside the evaluation. sheet variables ($end etc) are constant for the run."""
+    node = parse_code(code_str)
+    if node is None:
+        return CELL
+    names = {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+    if any(name.startswith("t_var_q") for name in names):
+        return CELL
+    uses_row = row_var in names
+    uses_col = col_var in names
+    if uses_row and uses_col:
+        return CELL
+    if uses_row:
+        return ROW
+    if uses_col:
+        return COL
+    return CONSTANT
+
+
+def constant_value(node):
+    """the value of a number or string literal node, otherwise None.
+    python 3.7 parses literals as ast.Num and ast.Str rather than ast.Constant"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if sys.version_info < (3, 8):
+        if isinstance(node, ast.Num):
+            return node.n
+        if isinstance(node, ast.Str):
+            return node.s
+    return None
+
+
+def _int_constant(node):
+    value = constant_value(node)
+    if type(value) == int:
+        return value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _int_constant(node.operand)
+        if value is not None:
+            return -value
+    return None
+
+
+def get_index_expression(node):
+    constant = _int_constant(node)
+    if constant is not None:
+        return IndexExpression(None, constant)
+    if isinstance(node, ast.Name):
+        if node.id in char_dict:
+            return IndexExpression(None, char_dict[node.id])
+        if node.id in (row_var, col_var):
+            return IndexExpression(node.id, 0)
+        if node.id == n_var:
+            return IndexExpression(None, 0, 1)
+        return None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = get_index_expression(node.operand)
+        if operand is None or operand.variable is not None:
+            return None
+        return IndexExpression(None, -operand.offset, -operand.n_sign)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        sign = 1 if isinstance(node.op, ast.Add) else -1
+        left = get_index_expression(node.left)
+        right = get_index_expression(node.right)
+        if left is None or right is None:
+            return None
+        n_sign = left.n_sign + sign*right.n_sign
+        if abs(n_sign) > 1:
+            return None
+        if right.variable is None:
+            return IndexExpression(left.variable, left.offset + sign*right.offset, n_sign)
+        if left.variable is None and sign == 1:
+            return IndexExpression(right.variable, left.offset + right.offset, n_sign)
+    return None
+
+
+def _subscript_arguments(node):
+    arguments = node.slice
+    if hasattr(ast, "Index") and isinstance(arguments, ast.Index):  # python<3.9
+        arguments = arguments.value
+    if isinstance(arguments, ast.Tuple):
+        return arguments.elts
+    return None
+
+
+def get_cell_reference(node):
+    """returns a CellReference if node is value[...] or item[...] with simple index arguments, otherwise None"""
+    if not (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)):
+        return None
+    kind = node.value.id
+    if kind not in ("value", "item"):
+        return None
+    arguments = _subscript_arguments(node)
+    if arguments is None:
+        return None
+    context = ''
+    if kind == "item" and len(arguments) == 3:
+        context = constant_value(arguments[2])
+        if not isinstance(context, str):
+            return None
+    elif len(arguments) != 2:
+        return None
+    col = get_index_expression(arguments[0])
+    row = get_index_expression(arguments[1])
+    if col is None or row is None:
+        return None
+    return CellReference(kind, col, row, context)
+
+
+def get_string_modifier_chain(node):
+    """recognizes value[...], or string_modifier functions with literal arguments wrapped around value[...]
+    returns the CellReference and the list of calls to apply to it (innermost first), or None, None"""
+    calls = []
+    while isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or not node.args:
+            return None, None
+        function = known_functions.get(node.func.id)
+        if not getattr(function, "is_string_modifier", False):
+            return None, None
+        try:
+            args = [ast.literal_eval(arg) for arg in node.args[1:]]
+            kwargs = {keyword.arg: ast.literal_eval(keyword.value) for keyword in node.keywords}
+        except (ValueError, TypeError, SyntaxError):
+            return None, None
+        if None in kwargs:  # **kwargs unpacking
+            return None, None
+        calls.append(StringModifierCall(function, args, kwargs))
+        node = node.args[0]
+    reference = get_cell_reference(node)
+    if reference is None or (calls and reference.kind != "value"):
+        return None, None
+    calls.reverse()
+    return reference, calls
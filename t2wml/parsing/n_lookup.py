@@ -0,0 +1,117 @@
+import ast
+from t2wml.utils.bindings import bindings
+from t2wml.parsing.classes import Cell
+from t2wml.parsing.code_analysis import parse_code, get_cell_reference, constant_value
+from t2wml.utils.dependency_tracking import record_range_read
+
+
+class _Unresolved:
+    pass
+
+unresolved = _Unresolved()
+
+
+def _strip_not_empty_check(node):
+    """value[...] != "" -> value[...] is common in yamls and returns the same thing as value[...] in iter_on_n
+    (an empty or whitespace cell is falsy either way), so treat it as just value[...]"""
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) and len(node.values) == 2:
+        check, result = node.values
+        if isinstance(check, ast.Compare) and len(check.ops) == 1 and isinstance(check.ops[0], ast.NotEq) \
+                and constant_value(check.comparators[0]) == "" \
+                and ast.dump(check.left) == ast.dump(result):
+            return result
+    return node
+
+
+class NLookup:
+    """a value[...] expression where one of the indices is offset by +$n or -$n, eg value[A, $row-$n].
+    iter_on_n returns the first non-empty cell in that direction, so instead of evaluating the expression
+    for every n, this finds it with the sheet's NonEmptyIndex.
+
+    Args:
+        reference (CellReference): the value[] being read
+        axis (int): 0 if $n is in the row index, 1 if it is in the column index
+        direction (int): 1 for +$n, -1 for -$n
+    """
+    def __init__(self, reference, axis, direction):
+        self.reference = reference
+        self.axis = axis
+        self.direction = direction
+
+    @staticmethod
+    def create(t2wml_code):
+        """returns an NLookup for the code, or None if the code is not a supported pattern"""
+        if not t2wml_code.has_n or t2wml_code.has_q_var:
+            return None
+        node = parse_code(t2wml_code.code_str)
+        if node is None:
+            return None
+        node = _strip_not_empty_check(node)
+        reference = get_cell_reference(node)
+        if reference is None or reference.kind != "value":
+            return None
+        col_sign, row_sign = reference.col.n_sign, reference.row.n_sign
+        if row_sign and not col_sign:
+            return NLookup(reference, 0, row_sign)
+        if col_sign and not row_sign:
+            return NLookup(reference, 1, col_sign)
+        return None
+
+    def evaluate(self, context, upper_limit):
+        """returns the same result as iter_on_n, or unresolved for the (rare) cases that need to be
+        evaluated one n at a time, such as when the lookup would run out of the bounds of the sheet"""
+        sheet = bindings.excel_sheet
+        col = context.get("t_var_col")
+        row = context.get("t_var_row")
+        if col is None or row is None:
+            return unresolved
+        col_index = self.reference.col.evaluate_at(col, row) - 1
+        row_index = self.reference.row.evaluate_at(col, row) - 1
+        if self.axis == 0:
+            start, fixed = row_index, col_index
+        else:
+            start, fixed = col_index, row_index
+        length = sheet._data_values.shape[self.axis]
+        fixed_length = sheet._data_values.shape[1-self.axis]
+        if not (-fixed_length <= fixed < fixed_length and -length <= start < length):
+            return unresolved
+        if upper_limit < 1:
+            return None
+
+        # the indices checked are start, start+direction, ..., last. like regular numpy indexing,
+        # negative indices wrap around, so split them into the negative and non-negative parts
+        last = start + self.direction*(upper_limit-1)
+        segments = []
+        if self.direction < 0:
+            stop = max(last, -length)
+            if start >= 0:
+                segments.append((start, max(stop, 0)))
+            if stop < 0:
+                segments.append((min(start, -1), stop))
+        else:
+            stop = min(last, length-1)
+            if start < 0:
+                segments.append((start, min(stop, -1)))
+            if stop >= 0:
+                segments.append((max(start, 0), stop))
+
+        index = sheet.non_empty_index
+        for segment_start, segment_stop in segments:
+            offset = length if segment_start < 0 else 0
+            found = index.find(self.axis, fixed, segment_start+offset, segment_stop+offset, self.direction)
+            self._record_scan(fixed, segment_start+offset, segment_stop+offset if found is None else found)
+            if found is not None:
+                found -= offset
+                if self.axis == 0:
+                    return Cell(fixed, found)
+                return Cell(found, fixed)
+        if not -length <= last < length:
+            return unresolved  # iterating one by one would run out of bounds and raise
+        return None
+
+    def _record_scan(self, fixed, first, last):
+        scanned = slice(min(first, last), max(first, last)+1)
+        if self.axis == 0:
+            record_range_read(fixed, scanned)
+        else:
+            record_range_read(scanned, fixed)
@@ -4,7 +4,10 @@ from t2wml.parsing.classes import (CellExpression, ItemExpression,
 from t2wml.parsing.constants import char_dict
 from t2wml.parsing.template_functions import functions_dict
 from t2wml.parsing.cleaning_functions import cleaning_functions_dict
+from t2wml.parsing.n_lookup import NLookup, unresolved
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.parsing.code_analysis import get_code_dependency
+from t2wml.utils.dependency_tracking import DependencyRecorder, get_recorder, record_cell_read, recording
 
 
 eval_globals = dict()
@@ -44,6 +47,97 @@ class T2WMLCode:
     def __str__(self):
         return self.unmodified_str
 
+    @property
+    def n_lookup(self):
+        """an NLookup if the code is a $n lookup that can be answered with the sheet's non-empty index, otherwise None"""
+        try:
+            return self._n_lookup
+        except AttributeError:
+            self._n_lookup = NLookup.create(self)
+            return self._n_lookup
+
+    @property
+    def dependency(self):
+        """what the result depends on: "constant", "row", "col" (only on $row/$col) or "cell", see get_code_dependency"""
+        try:
+            return self._dependency
+        except AttributeError:
+            self._dependency = get_code_dependency(self.code_str)
+            return self._dependency
+
+    def __getstate__(self):
+        # compiled code objects can't be pickled (eg when sending a mapper to worker processes), recompile instead
+        state = dict(self.__dict__)
+        state.pop("code")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.code = compile(self.code_str, "<string>", "eval")
+
+
+class CodeWrapper(T2WMLCode):
+    """Base class for T2WMLCode stand-ins that wrap an existing T2WMLCode.
+    Behaves like the original T2WMLCode (eg for error messages), but is evaluated differently by iter_on_n_for_code.
+    """
+    def __init__(self, t2wml_code):
+        self.t2wml_code = t2wml_code
+
+    def __getattr__(self, name):
+        try:
+            t2wml_code = self.__dict__["t2wml_code"]
+        except KeyError:  # not initialized yet, eg while copying
+            raise AttributeError(name)
+        return getattr(t2wml_code, name)
+
+    def __getstate__(self):
+        return dict(self.__dict__)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class PrecomputedCode(CodeWrapper):
+    """A T2WMLCode whose result for the current cell has already been calculated.
+    iter_on_n_for_code returns the result without evaluating.
+    """
+    def __init__(self, t2wml_code, result):
+        super().__init__(t2wml_code)
+        self.result = result
+
+
+class MemoizedCode(CodeWrapper):
+    """A T2WMLCode whose result is shared by many cells (eg it only depends on $row).
+    The first evaluation stores the result (or exception) in memo under key, later ones with the same memo and key reuse it.
+    When dependencies are being recorded, the cells read by the first evaluation are recorded again for every reuse.
+    """
+    def __init__(self, t2wml_code, memo, key):
+        super().__init__(t2wml_code)
+        self.memo = memo
+        self.key = key
+
+    def evaluate(self, context):
+        recorder = get_recorder()
+        entry = self.memo.get(self.key)
+        if entry is None or (recorder is not None and entry[2] is None):
+            reads = None
+            if recorder is not None:
+                reads = DependencyRecorder(recorder.row_len, recorder.col_len)
+            result, exception = None, None
+            with recording(reads):
+                try:
+                    result = iter_on_n_for_code(self.t2wml_code, context)
+                except Exception as e:
+                    exception = e
+            entry = (result, exception, reads)
+            self.memo[self.key] = entry
+        result, exception, reads = entry
+        if recorder is not None:
+            recorder.merge(reads)
+        if exception is not None:
+            raise exception.with_traceback(None)
+        return result
+
 
 #@basic_debug
 def t2wml_parse(e_str, context={}):
@@ -77,12 +171,24 @@ def iter_on_n_for_code(input, context={}):
     """poorly named. a general purpose wrapper function to either parse, iter, or return as ReturnClass code instances and strings"""
     if isinstance(input, str):
         return ReturnClass(None, None, input)
+    if isinstance(input, PrecomputedCode):
+        result = input.result
+        record_cell_read(result.col, result.row)
+        return result
+    if isinstance(input, MemoizedCode):
+        return input.evaluate(context)
     if isinstance(input, T2WMLCode):
         if input.has_q_var:
             test=context.get("t_var_qrow", None)
             if test is None:
                 raise ValueError("qcol/qrow not defined- did you mean to specify a qualifier region? is your qualifier value cell-dependent?")
         if input.has_n:
+            n_lookup = input.n_lookup
+            if n_lookup is not None:
+                upper_limit = max(bindings.excel_sheet.row_len, bindings.excel_sheet.col_len)
+                result = n_lookup.evaluate(context, upper_limit)
+                if result is not unresolved:
+                    return result
             return iter_on_n(input.code, context)
         return t2wml_parse(input.code, context)
     return t2wml_parse(input, context)
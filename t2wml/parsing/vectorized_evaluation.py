@@ -0,0 +1,286 @@
+import ast
+import numpy as np
+import pandas as pd
+from t2wml.parsing.classes import ReturnClass
+from t2wml.parsing.code_analysis import parse_code, get_string_modifier_chain, get_cell_reference, constant_value
+from t2wml.utils.dependency_tracking import record_range_read
+from t2wml.settings import t2wml_settings
+
+
+class VectorizedExpression:
+    """evaluates a simple cell-relative expression (value[...], item[...], or string_modifier functions
+    with literal arguments applied to value[...]) for a whole region at once,
+    with numpy gathers over the sheet's values instead of a call to eval per cell.
+
+    Args:
+        reference (CellReference): the value[] or item[] being read
+        calls (list): StringModifierCalls to apply to the value, innermost first
+    """
+    def __init__(self, reference, calls):
+        self.reference = reference
+        self.calls = calls
+
+    @staticmethod
+    def create(t2wml_code):
+        """returns a VectorizedExpression for the code, or None if the code is not a supported pattern"""
+        if t2wml_code.has_n or t2wml_code.has_q_var:
+            return None
+        node = parse_code(t2wml_code.code_str)
+        if node is None:
+            return None
+        reference, calls = get_string_modifier_chain(node)
+        if reference is None:
+            return None
+        return VectorizedExpression(reference, calls)
+
+    def evaluate(self, cols, rows, sheet, item_table):
+        """cols and rows are numpy arrays of the (1-indexed) cells to evaluate.
+        returns a dictionary of (col, row): ReturnClass, the same result eval would have returned.
+        cells that would have raised an error are left out, so that the per-cell path can create the error."""
+        n_rows, n_cols = sheet.row_len, sheet.col_len
+        col_indices = self.reference.col.evaluate(cols, rows) - 1
+        row_indices = self.reference.row.evaluate(cols, rows) - 1
+        # negative indices wrap around, the same as when indexing the sheet one cell at a time
+        in_bounds = (col_indices >= -n_cols) & (col_indices < n_cols) & (row_indices >= -n_rows) & (row_indices < n_rows)
+        if not in_bounds.any():
+            return {}
+        cols, rows = cols[in_bounds], rows[in_bounds]
+        col_indices, row_indices = col_indices[in_bounds], row_indices[in_bounds]
+
+        # many cells often read the same cell (eg item[A, $row]), so only read each position once
+        positions, inverse = np.unique(np.stack([row_indices, col_indices], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        position_rows = positions[:, 0]
+        position_cols = positions[:, 1]
+        values = sheet._data_values[position_rows, position_cols]
+        position_rows = position_rows.tolist()
+        position_cols = position_cols.tolist()
+
+        if self.reference.kind == "item" and not t2wml_settings.no_wikification:
+            context = self.reference.context
+            values = [item_table.get_item(c, r, sheet, context=context, value=str(v))
+                      for r, c, v in zip(position_rows, position_cols, values)]
+        else:
+            values = self.apply_calls(values)
+
+        results = {}
+        for col, row, index in zip(cols.tolist(), rows.tolist(), inverse.tolist()):
+            value = values[index]
+            if value is failed:
+                continue
+            results[(col, row)] = ReturnClass(position_cols[index], position_rows[index], value)
+        return results
+
+    def apply_calls(self, values):
+        """apply the string modifier functions once per distinct value"""
+        if not self.calls:
+            return list(values)
+        codes, uniques = pd.factorize(values)
+        cleaned_uniques = [self._apply_calls_to_value(value) for value in uniques]
+        # factorize gives missing values (NaN/None) the code -1, apply to those separately
+        return [cleaned_uniques[code] if code != -1 else self._apply_calls_to_value(value)
+                for code, value in zip(codes, values)]
+
+    def _apply_calls_to_value(self, value):
+        try:
+            for call in self.calls:
+                # string modifiers receive a Cell, which they convert with str() before each call
+                value = call(str(value))
+        except Exception:
+            return failed
+        return value
+
+
+class _Failed:
+    pass
+
+failed = _Failed()
+
+
+class VectorizedPredicate:
+    """evaluates a region argument of the form `condition -> $col` (or `-> $row`, or `-> ($col, $row)` for cells)
+    for all the columns/rows/cells of the region at once, instead of with a call to eval for each one.
+    supported conditions compare value[...] with a literal (== and !=), call contains/starts_with/ends_with on value[...]
+    with a literal string, test a value[...] for emptiness with not, and combine those with and/or/not.
+
+    Args:
+        condition (_PredicateNode): the condition
+        variables (tuple): the loop variables, eg ("t_var_col",)
+    """
+    def __init__(self, condition, variables):
+        self.condition = condition
+        self.variables = variables
+
+    @staticmethod
+    def create(code_str, variables):
+        """returns a VectorizedPredicate, or None if the code is not a supported pattern.
+        variables are the names the region loops over, the code must return them (a tuple, for more than one)"""
+        node = parse_code(code_str)
+        if not (isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) and len(node.values) > 1):
+            return None
+        target = node.values[-1]
+        if len(variables) == 1:
+            if not (isinstance(target, ast.Name) and target.id == variables[0]):
+                return None
+        elif not (isinstance(target, ast.Tuple) and
+                  [getattr(element, "id", None) for element in target.elts] == list(variables)):
+            return None
+        conditions = [_create_predicate_node(value, variables) for value in node.values[:-1]]
+        if None in conditions:
+            return None
+        condition = conditions[0] if len(conditions) == 1 else _BooleanNode(all, conditions)
+        return VectorizedPredicate(condition, variables)
+
+    def evaluate(self, cols, rows, sheet):
+        """cols and rows are numpy arrays of the 1-indexed positions to test.
+        returns a boolean array, or None if the per-position path needs to be used instead (eg to raise an error)"""
+        try:
+            return self.condition.evaluate(cols, rows, sheet)
+        except _Unsupported:
+            return None
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _create_predicate_node(node, variables):
+    if isinstance(node, ast.BoolOp):
+        operands = [_create_predicate_node(value, variables) for value in node.values]
+        if None in operands:
+            return None
+        return _BooleanNode(all if isinstance(node.op, ast.And) else any, operands)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        reference = _value_reference(node.operand, variables)
+        if reference is not None:
+            return _EmptyNode(reference)
+        operand = _create_predicate_node(node.operand, variables)
+        if operand is None:
+            return None
+        return _NotNode(operand)
+    if isinstance(node, ast.Compare):
+        if len(node.ops) != 1 or not isinstance(node.ops[0], (ast.Eq, ast.NotEq)):
+            return None
+        left, right = node.left, node.comparators[0]
+        reference = _value_reference(left, variables)
+        literal = right
+        if reference is None:
+            reference, literal = _value_reference(right, variables), left
+        if reference is None:
+            return None
+        try:
+            literal = ast.literal_eval(literal)
+        except (ValueError, TypeError, SyntaxError):
+            return None
+        if isinstance(literal, (list, dict, set, tuple)):
+            return None
+        return _CompareNode(reference, literal, isinstance(node.ops[0], ast.NotEq))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _string_tests \
+            and len(node.args) == 2 and not node.keywords:
+        reference = _value_reference(node.args[0], variables)
+        if reference is None or not isinstance(constant_value(node.args[1]), str):
+            return None
+        return _StringTestNode(reference, _string_tests[node.func.id], constant_value(node.args[1]))
+    return None
+
+
+def _value_reference(node, variables):
+    reference = get_cell_reference(node)
+    if reference is None or reference.kind != "value":
+        return None
+    for index in (reference.col, reference.row):
+        if index.n_sign or (index.variable is not None and index.variable not in variables):
+            return None
+    return reference
+
+
+_string_tests = {
+    "contains": lambda value, section: section in value,
+    "starts_with": lambda value, section: value.startswith(section),
+    "ends_with": lambda value, section: value.endswith(section),
+}
+
+
+class _PredicateNode:
+    def evaluate(self, cols, rows, sheet):
+        raise NotImplementedError
+
+
+class _ReferenceNode(_PredicateNode):
+    def __init__(self, reference):
+        self.reference = reference
+
+    def positions(self, cols, rows, sheet):
+        """the 0-indexed (row, col) positions read. anything that would raise an error (or wrap around) is left to eval"""
+        col_indices = self.reference.col.evaluate(cols, rows) - 1
+        row_indices = self.reference.row.evaluate(cols, rows) - 1
+        if len(col_indices):
+            if col_indices.min() < 0 or col_indices.max() >= sheet.col_len \
+                    or row_indices.min() < 0 or row_indices.max() >= sheet.row_len:
+                raise _Unsupported()
+            record_range_read(slice(int(col_indices.min()), int(col_indices.max())+1),
+                              slice(int(row_indices.min()), int(row_indices.max())+1))
+        return row_indices, col_indices
+
+    def values(self, cols, rows, sheet):
+        row_indices, col_indices = self.positions(cols, rows, sheet)
+        return sheet._data_values[row_indices, col_indices].astype(object)
+
+
+class _CompareNode(_ReferenceNode):
+    def __init__(self, reference, literal, negate):
+        super().__init__(reference)
+        self.literal = literal
+        self.negate = negate
+
+    def evaluate(self, cols, rows, sheet):
+        values = self.values(cols, rows, sheet)
+        equal = np.fromiter((value == self.literal for value in values), dtype=bool, count=len(values))
+        return ~equal if self.negate else equal
+
+
+class _EmptyNode(_ReferenceNode):
+    def evaluate(self, cols, rows, sheet):
+        row_indices, col_indices = self.positions(cols, rows, sheet)
+        return ~sheet.non_empty_index.non_empty[row_indices, col_indices]
+
+
+class _StringTestNode(_ReferenceNode):
+    def __init__(self, reference, test, section):
+        super().__init__(reference)
+        self.test = test
+        self.section = section
+
+    def evaluate(self, cols, rows, sheet):
+        row_indices, col_indices = self.positions(cols, rows, sheet)
+        non_empty = sheet.non_empty_index.non_empty[row_indices, col_indices]
+        values = sheet._data_values[row_indices, col_indices]
+        # like the boolean_modifier functions: empty cells are False, the rest are tested as strings, once per distinct value
+        codes, uniques = pd.factorize(values)
+        tested = np.fromiter((self.test(str(value), self.section) for value in uniques), dtype=bool, count=len(uniques))
+        result = np.zeros(len(values), dtype=bool)
+        found = codes != -1
+        result[found] = tested[codes[found]]
+        for index in np.flatnonzero(~found).tolist():  # factorize gives missing values (NaN/None) the code -1
+            result[index] = self.test(str(values[index]), self.section)
+        return result & non_empty
+
+
+class _NotNode(_PredicateNode):
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, cols, rows, sheet):
+        return ~self.operand.evaluate(cols, rows, sheet)
+
+
+class _BooleanNode(_PredicateNode):
+    def __init__(self, combine, operands):
+        self.combine = combine  # all or any
+        self.operands = operands
+
+    def evaluate(self, cols, rows, sheet):
+        results = [operand.evaluate(cols, rows, sheet) for operand in self.operands]
+        if self.combine is all:
+            return np.logical_and.reduce(results)
+        return np.logical_or.reduce(results)
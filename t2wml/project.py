@@ -1,6 +1,6 @@
 import json
 from typing import DefaultDict
-from t2wml.wikification.item_table import Wikifier, convert_old_df_to_dict, convert_old_wikifier_to_new
+from t2wml.wikification.item_table import Wikifier, convert_old_df_to_dict, convert_old_wikifier_to_new, read_old_wikifier
 from t2wml.outputs.datamart_edges import clean_id
 import yaml
 import os
@@ -452,9 +452,15 @@ class Project:
 
 
     def add_old_style_wikifier_to_project(self, wikifier_file):
+        df = read_old_wikifier(wikifier_file) #read once, not for every sheet
         for datafile in self.data_files:
             sf = SpreadsheetFile(self.get_full_path(datafile))
+            file_dict = DefaultDict(dict) #the sheets of a file share a wikifier file, which is saved once
+            sheet = None
             for sheet_name in sf:
                 sheet=sf[sheet_name]
-                wiki_dict = convert_old_wikifier_to_new(wikifier_file, sheet)
-                self.add_dict_to_wikifier_file(sheet, wiki_dict, overwrite_existing=True)
\ No newline at end of file
+                wiki_dict = convert_old_wikifier_to_new(df, sheet)
+                for context in wiki_dict:
+                    file_dict[context].update(wiki_dict[context])
+            if sheet is not None:
+                self.add_dict_to_wikifier_file(sheet, file_dict, overwrite_existing=True)
\ No newline at end of file
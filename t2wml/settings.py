@@ -1,10 +1,11 @@
 import os
+from t2wml.utils.execution_context import get_execution_context
 # DEFAULT_SPARQL_ENDPOINT ='https://dsbox02.isi.edu:8888/bigdata/namespace/wdq/sparql'
 DEFAULT_SPARQL_ENDPOINT= 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
 
 class T2WMLSettings:
-    """like utils.bindings, this is a class that is made globally accesible and used in many places for calculations.
-    It is therefore highly likely to be problematic in a multi-user server and an alternative should be found
+    """like utils.bindings, these settings are used in many places for calculations.
+    The settings in use are the ones in the current ExecutionContext, and are accessed through t2wml_settings
 
     Attributes:
         sparql_endpoint (str): endpoint used to make sparql queries to get property type. note that with pre-cached properties this is less relevant
@@ -12,6 +13,7 @@ class T2WMLSettings:
         warn_for_empty_cells (bool): block coordinate dictionary. taken from dictionary and then "normalized" (relabeled as necessary so that x1, y1 coordinates are upper left and x2, y2 lower right)
         handle_calendar (str): when receiving a non-Gregorian calendar, should the statement generator: a. "leave" the original value as-is b. "replace" the value with the gregorian value c. "add" the gregorian as an additional dictionary
         no_wikification (bool): treat item[] cells as value[], and do not run property validation
+        cache_folder (str): folder for on-disk caches (eg of cleaned data), so they're kept between runs. None to only cache in memory
     """
     def __init__(self):
         self.sparql_endpoint=DEFAULT_SPARQL_ENDPOINT
@@ -19,11 +21,23 @@ class T2WMLSettings:
         self.warn_for_empty_cells=False
         self.handle_calendar="leave"
         self.no_wikification=False
+        self.cache_folder=None
 
     def update_from_dict(self, **kwargs):
         for key in self.__dict__:
             if key in kwargs:
                 self.__dict__[key]=kwargs[key]
 
-t2wml_settings=T2WMLSettings()
+
+class ContextSettings:
+    """gets and sets attributes on the settings of the current ExecutionContext.
+    without an active context, that is the process-wide default settings"""
+    def __getattr__(self, name):
+        return getattr(get_execution_context().settings, name)
+
+    def __setattr__(self, name, value):
+        setattr(get_execution_context().settings, name, value)
+
+
+t2wml_settings=ContextSettings()
 
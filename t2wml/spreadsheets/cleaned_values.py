@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+
+class CleanedValues:
+    """the values of a sheet after cleaning, as an overlay on top of the raw values:
+    only the columns that cleaning changed are stored, every other column is read from the raw values.
+    memory use scales with the number of cleaned columns, not with the size of the sheet.
+
+    supports the parts of the numpy array interface that are used for sheet values: shape, and indexing with
+    (row, col) where each is an int, a slice, or an array of indices (arrays are paired elementwise, as in numpy).
+
+    Args:
+        raw_values (numpy array): the sheet's raw values (not copied, edits to it show in columns that weren't cleaned)
+        columns (dict): column index: object array with the cleaned values of the whole column
+    """
+    def __init__(self, raw_values, columns):
+        self.raw_values = raw_values
+        self.columns = columns
+
+    @property
+    def shape(self):
+        return self.raw_values.shape
+
+    @property
+    def size(self):
+        return self.raw_values.size
+
+    @property
+    def ndim(self):
+        return 2
+
+    def column(self, col):
+        """the values of column col (non-negative), as an array. don't edit it in place"""
+        try:
+            return self.columns[col]
+        except KeyError:
+            return self.raw_values[:, col]
+
+    def _normalize_col(self, col):
+        n_cols = self.shape[1]
+        if -n_cols <= col < n_cols:
+            return col % n_cols
+        raise IndexError("index {} is out of bounds for axis 1 with size {}".format(col, n_cols))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        if isinstance(cols, (int, np.integer)):
+            return self.column(self._normalize_col(int(cols)))[rows]
+        if isinstance(cols, slice):
+            result = np.array(self.raw_values[rows, cols], dtype=object)
+            for index, col in enumerate(range(*cols.indices(self.shape[1]))):
+                if col in self.columns:
+                    result[..., index] = self.columns[col][rows]
+            return result
+        # arrays of positions
+        rows, cols = np.broadcast_arrays(rows, np.asarray(cols))
+        result = np.array(self.raw_values[rows, cols], dtype=object)
+        if self.columns and cols.size:
+            cols = cols % self.shape[1]
+            for col, column in self.columns.items():
+                mask = cols == col
+                if mask.any():
+                    result[mask] = column[rows[mask]]
+        return result
+
+    def __array__(self, dtype=None):
+        return self.to_array() if dtype is None else self.to_array().astype(dtype)
+
+    def to_array(self):
+        """the full 2d array of cleaned values (this copies the whole sheet)"""
+        values = np.array(self.raw_values, dtype=object)
+        for col, column in self.columns.items():
+            values[:, col] = column
+        return values
+
+    def map(self, function):
+        """apply function (which takes a 1d array of values and returns an array of the same length) to all the values,
+        returns a 2d array of the results. only the cleaned columns are processed separately, without copying the sheet"""
+        result = function(self.raw_values.ravel()).reshape(self.shape)
+        for col, column in self.columns.items():
+            result[:, col] = function(column)
+        return result
+
+    def to_dataframe(self, raw_data):
+        """the cleaned values as a DataFrame with the same index and columns as raw_data"""
+        return with_columns(raw_data, self.columns)
+
+
+def with_columns(df, columns):
+    """returns a copy of df with the columns (column index: array of values) replaced.
+    built positionally from arrays, which works with duplicate column names and on older pandas (no isetitem),
+    and never writes into df's blocks (assigning to a shallow copy can, before pandas 1.5)"""
+    arrays = {index: columns[index] if index in columns else df.iloc[:, index].to_numpy() for index in range(df.shape[1])}
+    result = pd.DataFrame(arrays, index=df.index)
+    result.columns = df.columns
+    return result
+
+
+def map_values(values, function):
+    """like CleanedValues.map, for either CleanedValues or a numpy array"""
+    if isinstance(values, CleanedValues):
+        return values.map(function)
+    return function(values.ravel()).reshape(values.shape)
+
+
+def changed_cells(old_values, new_values):
+    """returns the (col, row) cells whose values differ between old_values and new_values (same shape).
+    when both are CleanedValues over the same raw values, only the cleaned columns are compared"""
+    if isinstance(old_values, CleanedValues) and isinstance(new_values, CleanedValues) \
+            and old_values.raw_values is new_values.raw_values:
+        cells = set()
+        for col in set(old_values.columns) | set(new_values.columns):
+            for row in np.flatnonzero(old_values.column(col) != new_values.column(col)).tolist():
+                cells.add((col, row))
+        return cells
+    old_values, new_values = np.asarray(old_values), np.asarray(new_values)
+    return {(int(col), int(row)) for row, col in zip(*(old_values != new_values).nonzero())}
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+from t2wml.spreadsheets.sheet_cache import encode_cells, decode_cells
+
+CHUNK_CELLS = 2**20 #cells processed at a time by the methods that go over the whole buffer
+
+#the bytes str.strip() removes, in ascii
+_ASCII_WHITESPACE = np.zeros(256, dtype=bool)
+_ASCII_WHITESPACE[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+
+def _from_arrays(shape, offsets, data, edits):
+    #used for unpickling CompactValues, see CompactValues.__reduce__
+    values = CompactValues(shape, offsets, data)
+    values._edits = edits
+    return values
+
+
+def _open_mapped(shape, offsets_path, data_path, edits):
+    offsets = np.load(offsets_path, mmap_mode="r")
+    data = np.memmap(data_path, dtype=np.uint8, mode="r")
+    return _from_arrays(shape, offsets, data, edits)
+
+
+class CompactValues:
+    """the values of a sheet stored compactly: all the cells' text as one UTF-8 buffer and an int64 array of where each
+    cell starts in it (row by row, the same layout as ParsedSheetCache), instead of a python str object per cell.
+    a cell's str is only created when the cell is read.
+
+    the arrays can be memory-mapped from the parsed sheet cache (see PandasLoader.load_compact_values), in which case
+    the sheet's text isn't loaded into memory at all, and pickling only pickles the paths of the files, so sending
+    the values to another process doesn't copy them (the files need to still be there when they're unpickled).
+
+    supports the parts of the numpy array interface that are used for sheet values: shape, and indexing with
+    (row, col) where each is an int, a slice, or an array of indices (arrays are paired elementwise, as in numpy,
+    slices give the same 2d results as numpy). indexing returns str for a single cell and object arrays otherwise.
+
+    Args:
+        shape (tuple): (rows, columns)
+        offsets (numpy array): int64, rows*columns+1 long, cell i is data[offsets[i]:offsets[i+1]]
+        data (numpy array): uint8, the UTF-8 text of all the cells
+    """
+    def __init__(self, shape, offsets, data):
+        self._shape = tuple(int(length) for length in shape)
+        self.offsets = offsets
+        self.data = data
+        self._edits = {} #flat index: value, for cells edited with __setitem__
+
+    @classmethod
+    def from_array(cls, values):
+        """compact values with the same contents as a 2d array. cells that aren't strings are kept as they are"""
+        values = np.asarray(values, dtype=object)
+        flat = values.ravel()
+        is_str = np.fromiter((isinstance(value, str) for value in flat), dtype=bool, count=len(flat))
+        offsets, data = encode_cells(np.where(is_str, flat, ""))
+        compact = cls(values.shape, offsets, np.frombuffer(data, dtype=np.uint8))
+        compact._edits = {int(index): flat[index] for index in np.flatnonzero(~is_str)}
+        return compact
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def size(self):
+        return self._shape[0]*self._shape[1]
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return self._shape[0]
+
+    def _axis_index(self, index, axis):
+        #returns (array of non-negative indices, kind), where kind is "int", "slice" or "array"
+        length = self._shape[axis]
+        if isinstance(index, slice):
+            return np.arange(*index.indices(length), dtype=np.int64), "slice"
+        if isinstance(index, (int, np.integer)):
+            index = int(index)
+            if not -length <= index < length:
+                raise IndexError("index {} is out of bounds for axis {} with size {}".format(index, axis, length))
+            return np.int64(index % length), "int"
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = index.astype(np.int64, copy=False)
+        if index.size and ((index < -length) | (index >= length)).any():
+            raise IndexError("index out of bounds for axis {} with size {}".format(axis, length))
+        return index % length if length else index, "array"
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        rows, row_kind = self._axis_index(rows, 0)
+        cols, col_kind = self._axis_index(cols, 1)
+        if row_kind == "int" and col_kind == "int":
+            return self._cell(int(rows)*self._shape[1]+int(cols))
+        if "slice" in (row_kind, col_kind):
+            #numpy's result for slices: the outer product, without the axes that were indexed with an int
+            flat = np.atleast_1d(rows)[:, None]*self._shape[1] + np.atleast_1d(cols)[None, :]
+            if row_kind == "int":
+                flat = flat[0]
+            elif col_kind == "int":
+                flat = flat[:, 0]
+        else:
+            rows, cols = np.broadcast_arrays(rows, cols)
+            flat = rows*self._shape[1] + cols
+        return self._decode(flat)
+
+    def _cell(self, index):
+        try:
+            return self._edits[index]
+        except KeyError:
+            pass
+        start, end = int(self.offsets[index]), int(self.offsets[index+1])
+        return self.data[start:end].tobytes().decode('utf-8', 'surrogatepass')
+
+    def _decode(self, flat):
+        #the values of the cells at the flat indices (any shape), as an object array of the same shape
+        shape = np.shape(flat)
+        flat = np.asarray(flat, dtype=np.int64).ravel()
+        starts = self.offsets[flat]
+        lengths = self.offsets[flat+1]-starts
+        offsets = np.zeros(len(flat)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        #the positions in data of every byte of the cells, in order
+        positions = np.repeat(starts-offsets[:-1], lengths) + np.arange(offsets[-1])
+        values = decode_cells(offsets, self.data[positions])
+        if self._edits:
+            edited = np.flatnonzero(np.isin(flat, np.fromiter(self._edits, dtype=np.int64, count=len(self._edits))))
+            for position in edited.tolist():
+                values[position] = self._edits[int(flat[position])]
+        return values.reshape(shape)
+
+    @property
+    def has_non_string_cells(self):
+        """whether any cell was set to something other than a string (eg NaN), which the buffer can't hold"""
+        return any(not isinstance(value, str) for value in self._edits.values())
+
+    @property
+    def edited_columns(self):
+        """the columns with cells that were edited with __setitem__"""
+        return sorted({index % self._shape[1] for index in self._edits}) if self._shape[1] else []
+
+    def update_digest(self, digest):
+        """add the values to a hashlib digest, from the buffers, without creating a str for every cell"""
+        digest.update(str(self._shape).encode('utf-8'))
+        for start in range(0, len(self.offsets), CHUNK_CELLS):
+            digest.update(np.ascontiguousarray(self.offsets[start:start+CHUNK_CELLS]).tobytes())
+        for start in range(0, len(self.data), CHUNK_CELLS*16):
+            digest.update(np.ascontiguousarray(self.data[start:start+CHUNK_CELLS*16]).tobytes())
+        if self._edits:
+            indices = sorted(self._edits)
+            digest.update(np.array(indices, dtype=np.int64).tobytes())
+            edits = np.empty(len(indices), dtype=object)
+            edits[:] = [self._edits[index] for index in indices]
+            digest.update(pd.util.hash_array(edits).tobytes())
+
+    def non_empty(self, is_non_empty):
+        """a 2d bool array of which cells are non-empty, from the buffers. a cell is empty if it's only whitespace
+        (as str.strip removes it). cells with non-ascii bytes and no other text are decoded and tested with
+        is_non_empty(value), as are edited cells"""
+        count = self.size
+        result = np.zeros(count, dtype=bool)
+        for start in range(0, count, CHUNK_CELLS):
+            stop = min(start+CHUNK_CELLS, count)
+            offsets = np.asarray(self.offsets[start:stop+1])
+            data = np.asarray(self.data[offsets[0]:offsets[-1]])
+            lengths = np.diff(offsets)
+            has_bytes = lengths > 0
+            #per cell: whether it has an ascii byte that isn't whitespace, and whether it has non-ascii bytes
+            text = (data < 0x80) & ~_ASCII_WHITESPACE[data]
+            non_ascii = data >= 0x80
+            starts = (offsets[:-1]-offsets[0])[has_bytes]
+            non_empty = np.zeros(stop-start, dtype=bool)
+            unclear = np.zeros(stop-start, dtype=bool)
+            if len(starts):
+                non_empty[has_bytes] = np.add.reduceat(text, starts) > 0
+                unclear[has_bytes] = np.add.reduceat(non_ascii, starts) > 0
+            unclear &= ~non_empty
+            for index in (np.flatnonzero(unclear)+start).tolist():
+                non_empty[index-start] = is_non_empty(self._cell(index))
+            result[start:stop] = non_empty
+        for index, value in self._edits.items():
+            result[index] = is_non_empty(value)
+        return result.reshape(self._shape)
+
+    def __setitem__(self, key, value):
+        """edit a single cell, key is (row, col)"""
+        row, col = key
+        row, _ = self._axis_index(row, 0)
+        col, _ = self._axis_index(col, 1)
+        self._edits[int(row)*self._shape[1]+int(col)] = value
+
+    def __array__(self, dtype=None):
+        return self.to_array() if dtype is None else self.to_array().astype(dtype)
+
+    def to_array(self):
+        """all the values as a 2d object array (this creates a str for every cell)"""
+        values = decode_cells(self.offsets, self.data)
+        for index, value in self._edits.items():
+            values[index] = value
+        return values.reshape(self._shape)
+
+    def ravel(self):
+        return self.to_array().ravel()
+
+    def __reduce__(self):
+        offsets_path = getattr(self.offsets, "filename", None)
+        data_path = getattr(self.data, "filename", None)
+        if offsets_path and data_path:
+            return _open_mapped, (self._shape, offsets_path, data_path, self._edits)
+        return _from_arrays, (self._shape, np.asarray(self.offsets), np.asarray(self.data), self._edits)
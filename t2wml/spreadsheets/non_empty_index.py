@@ -0,0 +1,81 @@
+import numpy as np
+from t2wml.spreadsheets.cleaned_values import CleanedValues, map_values
+from t2wml.spreadsheets.compact_values import CompactValues
+
+
+def is_non_empty(value):
+    #the same test ReturnClass.__bool__ uses for cells
+    if value is None:
+        return False
+    return len(str(value).strip()) > 0
+
+
+def non_empty_array(values):
+    return np.fromiter((is_non_empty(value) for value in values), dtype=bool, count=len(values))
+
+
+def non_empty_cells(values):
+    """is_non_empty for every cell of values (a numpy array, CompactValues or CleanedValues), as a 2d bool array.
+    compact values are tested from their buffers, without creating a str for every cell"""
+    raw_values = values.raw_values if isinstance(values, CleanedValues) else values
+    if not isinstance(raw_values, CompactValues):
+        return map_values(values, non_empty_array)
+    non_empty = raw_values.non_empty(is_non_empty)
+    if isinstance(values, CleanedValues):
+        for col, column in values.columns.items():
+            non_empty[:, col] = non_empty_array(column)
+    return non_empty
+
+
+class NonEmptyIndex:
+    """for every cell of a sheet, the nearest non-empty cell before/after it in its column (axis 0) or row (axis 1).
+    arrays for each direction are only calculated the first time they're needed.
+
+    Args:
+        values (numpy array or CleanedValues): the sheet's values
+    """
+    def __init__(self, values):
+        self.values = values
+        self._nearest = {}
+
+    @property
+    def non_empty(self):
+        try:
+            return self._non_empty
+        except AttributeError:
+            self._non_empty = non_empty_cells(self.values)
+            return self._non_empty
+
+    def nearest(self, axis, direction):
+        """returns an array with, for each cell, the index along axis of the nearest non-empty cell
+        at or before it (direction -1, -1 if there is none) or at or after it (direction 1, length if there is none)"""
+        key = (axis, direction)
+        if key not in self._nearest:
+            length = self.values.shape[axis]
+            positions = np.arange(length)
+            positions = positions.reshape(-1, 1) if axis == 0 else positions.reshape(1, -1)
+            if direction < 0:
+                nearest = np.where(self.non_empty, positions, -1)
+                nearest = np.maximum.accumulate(nearest, axis=axis)
+            else:
+                nearest = np.where(self.non_empty, positions, length)
+                nearest = np.flip(np.minimum.accumulate(np.flip(nearest, axis=axis), axis=axis), axis=axis)
+            self._nearest[key] = nearest
+        return self._nearest[key]
+
+    def cell_changed(self, row, col):
+        """update after the value of a cell was edited in place"""
+        try:
+            self._non_empty[row, col] = is_non_empty(self.values[row, col])
+        except AttributeError:
+            return
+        self._nearest = {}
+
+    def find(self, axis, fixed, start, stop, direction):
+        """returns the index of the first non-empty cell scanning along axis from start to stop (both inclusive,
+        non-negative), in the row/column fixed, or None if they're all empty"""
+        nearest = self.nearest(axis, direction)
+        index = nearest[start, fixed] if axis == 0 else nearest[fixed, start]
+        if direction < 0:
+            return int(index) if index >= stop else None
+        return int(index) if index <= stop else None
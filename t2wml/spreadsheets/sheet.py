@@ -1,46 +1,71 @@
 from pathlib import Path
+from hashlib import sha256
+import numpy as np
 import pandas as pd   
 from t2wml.spreadsheets.utilities import PandasLoader, post_process_data
 from t2wml.spreadsheets.conversions import to_excel
+from t2wml.spreadsheets.non_empty_index import NonEmptyIndex
+from t2wml.spreadsheets.cleaned_values import CleanedValues, map_values
+from t2wml.spreadsheets.compact_values import CompactValues
 import t2wml.utils.t2wml_exceptions as T2WMLExceptions
 from collections.abc import Mapping
 from io import StringIO
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.utils.lru_cache import LRUCache
 
 
 class SpreadsheetFile(Mapping):
     """ A mapping class (immutable dict) for accessing sheets within a single file.
     All immutable dict methods are available (access by key, iteration, len, etc)
     Keys are sheet names, values are initialized Sheet instances.
+    Only the sheet names are read when it's created, each sheet is loaded the first time it is accessed.
+
+    Args:
+        file_path (str): location of the data file
+        max_loaded_sheets (int, optional): keep at most this many loaded sheets (the least recently used are dropped,
+                                           and loaded again if they're accessed again). Defaults to None, keep all of them.
+        compact (bool, optional): load the sheets with compact storage, see Sheet. Defaults to False.
     """
     #@basic_debug
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, max_loaded_sheets=None, compact=False):
         self.file_path = file_path
-        self.dict = {}
-        pandas_loader = PandasLoader(file_path)
-        pandas_data = pandas_loader.load_file()
-        for sheet_name in pandas_data:
-            self.dict[sheet_name] = Sheet(
-                self.file_path, sheet_name, pandas_data[sheet_name])
+        self.compact = compact
+        self._sheet_names = PandasLoader(file_path).get_sheet_names()
+        if max_loaded_sheets is None:
+            self._sheets = {}
+        else:
+            self._sheets = LRUCache(max_loaded_sheets)
 
     @property
     def sheet_names(self):
-        return list(self.dict.keys())
+        return list(self._sheet_names)
 
     def __iter__(self):
-        return iter(self.dict)
+        return iter(self._sheet_names)
 
     def __getitem__(self, sheet_name):
-        return self.dict[sheet_name]
+        if sheet_name not in self._sheet_names:
+            raise KeyError(sheet_name)
+        sheet = self._sheets.get(sheet_name)
+        if sheet is None:
+            sheet = Sheet(self.file_path, sheet_name, compact=self.compact)
+            if isinstance(self._sheets, dict):
+                self._sheets[sheet_name] = sheet
+            else:
+                self._sheets.put(sheet_name, sheet)
+        return sheet
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self._sheet_names
 
     def __len__(self):
-        return len(self.dict)
+        return len(self._sheet_names)
 
 
 class Sheet:
     # all access to spreadsheet goes through here
     #@basic_debug
-    def __init__(self, data_file_path: str, sheet_name: str, data=None):
+    def __init__(self, data_file_path: str, sheet_name: str, data=None, compact=False):
         """[summary]
 
         Args:
@@ -48,6 +73,9 @@ class Sheet:
             sheet_name (str): name of sheet. for csv files, name of sheet file
             data (dataframe, optional): dataframe of contents of sheet. For creating a sheet from already loaded data.
                                         Defaults to None.
+            compact (bool, optional): store the values as CompactValues (memory-mapped from the parsed sheet cache, if
+                                      t2wml_settings.cache_folder is set) instead of as a dataframe. raw_data is then only
+                                      created if it's asked for. Defaults to False.
         """
         self.data_file_path = str(data_file_path)
         self.data_file_name = Path(data_file_path).name
@@ -55,32 +83,138 @@ class Sheet:
 
         self.cleaned_data=None #this is set from outside the class, if cleaning is run
 
-        if data is not None:
+        if compact:
+            self._raw_data = None
+            if data is not None:
+                self._raw_data_values = CompactValues.from_array(data.values)
+            else:
+                self._raw_data_values = PandasLoader(self.data_file_path).load_compact_values(self.name)
+        elif data is not None:
             self.raw_data = data
         else:
             self.raw_data = PandasLoader(self.data_file_path).load_sheet(self.name)
+
+    @property
+    def raw_data(self):
+        if self._raw_data is None: #a compact sheet
+            self._raw_data = pd.DataFrame(self._raw_data_values.to_array())
+        return self._raw_data
+
+    @raw_data.setter
+    def raw_data(self, raw_data):
+        self._raw_data = raw_data
+        self.__dict__.pop("_raw_data_values", None)
+
+    @property
+    def is_compact(self):
+        return isinstance(self._raw_values, CompactValues)
     
+    @property
+    def cleaned_data(self):
+        #cleaned values set with set_cleaned_columns are only turned into a dataframe if it's asked for
+        if self._cleaned_data is None and self._cleaned_values is not None:
+            self._cleaned_data = self._cleaned_values.to_dataframe(self.raw_data)
+        return self._cleaned_data
+
+    @cleaned_data.setter
+    def cleaned_data(self, cleaned_data):
+        self._cleaned_data = cleaned_data
+        self._cleaned_values = None
+        self.__dict__.pop("_cleaned_data_values", None) #otherwise _data_values would keep returning the old values
+
+    def set_cleaned_columns(self, columns):
+        """set the results of cleaning as an overlay on the raw data (see CleanedValues), without copying the sheet
+
+        Args:
+            columns (dict): 0-indexed column: array of the cleaned values of the whole column
+        """
+        self.cleaned_data = None
+        self._cleaned_values = CleanedValues(self._raw_values, columns)
+
+    @property
+    def is_cleaned(self):
+        return self._cleaned_data is not None or self._cleaned_values is not None
+
     @property
     def data(self):
-        if self.cleaned_data is not None:
+        if self.is_cleaned:
             return self.cleaned_data
         return self.raw_data
+
+    @property
+    def _raw_values(self):
+        try:
+            return self._raw_data_values
+        except AttributeError:
+            self._raw_data_values = self.raw_data.values
+            return self._raw_data_values
     
     @property
     def _data_values(self): #added this property because creating .values takes too long
-        if self.cleaned_data is not None:
+        if self._cleaned_values is not None:
+            return self._cleaned_values
+        if self._cleaned_data is not None:
             try:
                 return self._cleaned_data_values
-            except:
-                self._cleaned_data_values = self.cleaned_data.values
+            except AttributeError:
+                self._cleaned_data_values = self._cleaned_data.values
                 return self._cleaned_data_values
+        return self._raw_values
+
+    @property
+    def non_empty_index(self):
+        #used for $n lookups. rebuilt if the values changed (eg cleaned data was set)
+        values = self._data_values
+        try:
+            if self._non_empty_index.values is values:
+                return self._non_empty_index
+        except AttributeError:
+            pass
+        self._non_empty_index = NonEmptyIndex(values)
+        return self._non_empty_index
+
+    @property
+    def fingerprint(self):
+        """a hash of the sheet's current values (the cleaned ones, if cleaning was run), for keying caches of anything calculated from them.
+        compact sheets are hashed from their buffers, without reading every cell"""
+        values = self._data_values
+        try:
+            if self._fingerprint[0] is values:
+                return self._fingerprint[1]
+        except AttributeError:
+            pass
+        digest = sha256(str(values.shape).encode('utf-8'))
+        raw_values = values.raw_values if isinstance(values, CleanedValues) else values
+        if isinstance(raw_values, CompactValues):
+            #hashed from the buffers, so it isn't the same as the fingerprint of a regular sheet with the same values
+            raw_values.update_digest(digest)
+            for col, column in sorted(getattr(values, "columns", {}).items()):
+                digest.update(str(col).encode('utf-8'))
+                digest.update(pd.util.hash_array(np.asarray(column, dtype=object)).tobytes())
         else:
+            digest.update(map_values(values, pd.util.hash_array).tobytes())
+        self._fingerprint = (values, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def set_value(self, row, col, value):
+        """edit the raw value of a single cell. does not change cleaned data, cleaning needs to be run again for that
+        (if cleaning was set with set_cleaned_columns, the edit does show in the columns cleaning didn't change)"""
+        if self._raw_data is not None:
+            self._raw_data.iat[row, col] = value
+        try:
+            self._raw_data_values[row, col] = value
+        except AttributeError:
+            pass
+        self.__dict__.pop("_fingerprint", None)
+        if self._cleaned_values is not None:
+            shows_edit = col not in self._cleaned_values.columns
+        else:
+            shows_edit = self._cleaned_data is None
+        if shows_edit:
             try:
-                return self._raw_data_values
-            except:
-                self._raw_data_values = self.raw_data.values
-                return self._raw_data_values
-
+                self._non_empty_index.cell_changed(row, col)
+            except AttributeError:
+                pass
 
     def __getitem__(self, params):
         try:
@@ -92,12 +226,12 @@ class Sheet:
     @property
     def row_len(self): 
         # number of rows
-        return self.data.shape[0]
+        return self._data_values.shape[0]
 
     @property
     def col_len(self):
         # number of columns
-        return self.data.shape[1]
+        return self._data_values.shape[1]
 
     @classmethod
     def load_sheet_from_csv_string(cls, csv_string, data_file_path="", sheet_name="", **pandas_options):
@@ -0,0 +1,196 @@
+import json
+import os
+import tempfile
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+import numpy as np
+import pandas as pd
+from t2wml.settings import t2wml_settings
+
+FORMAT_VERSION = 1
+
+
+class ParsedSheetCache:
+    """an on-disk cache of parsed sheets, kept in t2wml_settings.cache_folder (the cache is off when it isn't set),
+    so that loading the same sheet again doesn't parse the data file again.
+
+    entries are keyed by the data file's path, size and modification time, the sheet name, and the loader that parsed
+    it (sheets streamed by stream_xlsx_sheet can differ from pandas', eg in trailing empty columns),
+    so editing the file invalidates its entries. each sheet is stored as three files:
+    the cell values as one UTF-8 buffer (.data), an int64 .npy array of where each cell starts in it
+    (row by row, with the end of the last cell at the end), and a small .json with the shape, written last.
+    only sheets where every value is a string are cached.
+
+    Args:
+        max_bytes (int): the maximum total size of the cache files. when it's exceeded, the least recently used entries are deleted
+
+    Attributes:
+        hits (int): number of sheets read from the cache
+        misses (int): number of lookups that weren't
+    """
+    def __init__(self, max_bytes=2*1024**3):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def folder():
+        if not t2wml_settings.cache_folder:
+            return None
+        return os.path.join(t2wml_settings.cache_folder, "sheets")
+
+    @staticmethod
+    def key(file_path, sheet_name, loader="pandas"):
+        """the cache key for a sheet in a data file, or None if the file doesn't exist"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        identity = [FORMAT_VERSION, str(Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns, sheet_name, loader]
+        return sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+    def paths(self, key):
+        """the (meta, offsets, data) file paths of an entry"""
+        base = os.path.join(self.folder(), key)
+        return base+".json", base+".offsets.npy", base+".data"
+
+    def get_arrays(self, file_path, sheet_name, mmap=False, loader="pandas"):
+        """returns (shape, offsets, data) for a cached sheet, or None. with mmap, the arrays are memory-mapped from the files"""
+        if self.folder() is None:
+            return None
+        key = self.key(file_path, sheet_name, loader)
+        if key is None:
+            return None
+        meta_path, offsets_path, data_path = self.paths(key)
+        try:
+            with open(meta_path, 'r', encoding="utf-8") as f:
+                meta = json.load(f)
+            offsets = np.load(offsets_path, mmap_mode="r" if mmap else None)
+            if mmap and os.path.getsize(data_path):
+                data = np.memmap(data_path, dtype=np.uint8, mode="r")
+            else:
+                with open(data_path, 'rb') as f:
+                    data = np.frombuffer(f.read(), dtype=np.uint8)
+        except (OSError, ValueError): #missing, partly deleted, or unreadable, the same as a miss
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(meta_path) #for least recently used eviction
+        except OSError:
+            pass
+        return tuple(meta["shape"]), offsets, data
+
+    def get(self, file_path, sheet_name):
+        """returns the cached sheet as a DataFrame (like PandasLoader.load_sheet), or None"""
+        arrays = self.get_arrays(file_path, sheet_name)
+        if arrays is None:
+            return None
+        shape, offsets, data = arrays
+        return pd.DataFrame(decode_cells(offsets, data).reshape(shape))
+
+    def put(self, file_path, sheet_name, df):
+        if self.folder() is None:
+            return
+        values = df.values
+        if not all(isinstance(value, str) for value in values.flat):
+            return
+        offsets, data = encode_cells(values.ravel())
+        self.put_arrays(file_path, sheet_name, values.shape, offsets, data)
+
+    def put_arrays(self, file_path, sheet_name, shape, offsets, data, loader="pandas"):
+        """add a sheet that is already encoded the way encode_cells does it (eg by stream_xlsx_sheet)"""
+        folder = self.folder()
+        if folder is None:
+            return
+        key = self.key(file_path, sheet_name, loader)
+        if key is None:
+            return
+        meta_path, offsets_path, data_path = self.paths(key)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            self._write(data_path, lambda f: f.write(data))
+            self._write(offsets_path, lambda f: np.save(f, offsets))
+            self._write(meta_path, lambda f: f.write(json.dumps(dict(shape=list(shape))).encode('utf-8')))
+            self.evict()
+        except OSError: #the cache is an optimization, not being able to write it isn't an error
+            pass
+
+    @staticmethod
+    def _write(path, write):
+        #write to a temporary file first, so other processes never read a partly written file
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            write(f)
+            temp_path = f.name
+        os.replace(temp_path, path)
+
+    def evict(self):
+        """delete the least recently used entries until the cache is no larger than max_bytes"""
+        folder = self.folder()
+        if folder is None or not os.path.isdir(folder):
+            return
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(folder):
+                if not name.endswith(".json"):
+                    continue
+                paths = self.paths(name[:-len(".json")])
+                try:
+                    size = sum(os.path.getsize(path) for path in paths)
+                    last_used = os.path.getmtime(paths[0])
+                except OSError:
+                    continue
+                entries.append((last_used, size, paths))
+                total += size
+            for last_used, size, paths in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+
+    def clear(self):
+        """delete all the cached sheets"""
+        max_bytes, self.max_bytes = self.max_bytes, -1
+        try:
+            self.evict()
+        finally:
+            self.max_bytes = max_bytes
+
+
+parsed_sheet_cache = ParsedSheetCache()
+
+
+def encode_cells(values):
+    """returns (offsets, data) for a 1d array of strings: data is all the strings encoded as UTF-8, one after the other,
+    and string i is data[offsets[i]:offsets[i+1]]"""
+    encoded = [value.encode('utf-8', 'surrogatepass') for value in values]
+    offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def decode_cells(offsets, data):
+    """the inverse of encode_cells, returns an object array of the strings"""
+    data = np.asarray(data, dtype=np.uint8)
+    count = len(offsets)-1
+    values = np.empty(count, dtype=object)
+    if not count:
+        return values
+    if not (data == 0).any():
+        #put a \0 after each cell and split the decoded text on it, which is much faster than slicing each cell
+        with_separators = np.zeros(len(data)+count, dtype=np.uint8)
+        is_data = np.ones(len(with_separators), dtype=bool)
+        is_data[offsets[1:]+np.arange(count)] = False
+        with_separators[is_data] = data
+        values[:] = with_separators[:-1].tobytes().decode('utf-8', 'surrogatepass').split("\0")
+        return values
+    data = data.tobytes()
+    values[:] = [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return values
@@ -1,6 +1,9 @@
 from pathlib import Path
 import pandas as pd
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.spreadsheets.sheet_cache import parsed_sheet_cache
+from t2wml.spreadsheets.compact_values import CompactValues
+from t2wml.spreadsheets.xlsx_streaming import stream_xlsx_sheet
 
 def post_process_data(data):
     return data
@@ -21,8 +24,13 @@ class PandasLoader:
     #@basic_debug
     def load_sheet(self, sheet_name):
         """
-        returns a single sheet's data frame
+        returns a single sheet's data frame.
+        if t2wml_settings.cache_folder is set, parsed sheets are cached there (see ParsedSheetCache)
         """
+        cache_name = sheet_name if self.is_excel else None #other files only have one sheet
+        data = parsed_sheet_cache.get(self.file_path, cache_name)
+        if data is not None:
+            return post_process_data(data)
         if self.is_excel:
             data = pd.read_excel(
                 self.file_path, sheet_name=sheet_name, **self.pd_args)     
@@ -33,8 +41,34 @@ class PandasLoader:
                 data = pd.read_csv(self.file_path, sep="\t", **self.pd_args)
             else: #attempt to parse type using csv sniffer
                 data = pd.read_table(self.file_path, sep=None, **self.pd_args)
+        parsed_sheet_cache.put(self.file_path, cache_name, data)
         return post_process_data(data)
     
+    def load_compact_values(self, sheet_name):
+        """
+        returns a single sheet's values as CompactValues.
+        xlsx files are read one row at a time (see stream_xlsx_sheet), instead of loading the whole workbook.
+        if t2wml_settings.cache_folder is set, they are memory-mapped from the parsed sheet cache
+        """
+        cache_name = sheet_name if self.is_excel else None
+        #streamed sheets are cached apart from the ones load_sheet reads with pandas
+        loader = "stream_xlsx" if self.file_extension == ".xlsx" else "pandas"
+        arrays = parsed_sheet_cache.get_arrays(self.file_path, cache_name, mmap=True, loader=loader)
+        if arrays is not None:
+            return CompactValues(*arrays)
+        if self.file_extension == ".xlsx":
+            values = stream_xlsx_sheet(self.file_path, sheet_name)
+            if not values.has_non_string_cells: #sheets with error cells (which aren't strings) aren't cached
+                parsed_sheet_cache.put_arrays(self.file_path, cache_name, values.shape, values.offsets, values.data,
+                                              loader=loader)
+        else:
+            values = None
+            data = self.load_sheet(sheet_name) #this also adds it to the cache
+        arrays = parsed_sheet_cache.get_arrays(self.file_path, cache_name, mmap=True, loader=loader)
+        if arrays is not None:
+            return CompactValues(*arrays)
+        return values if values is not None else CompactValues.from_array(data.values)
+
     @property
     def non_excel_sheet_name(self):
         return Path(self.file_path).name
@@ -63,8 +97,9 @@ class PandasLoader:
     #@basic_debug
     def get_sheet_names(self):
         if self.is_excel:
-            xl = pd.ExcelFile(self.file_path)
-            return xl.sheet_names
+            #only reads the workbook's list of sheets, not their contents
+            with pd.ExcelFile(self.file_path) as xl:
+                return xl.sheet_names
         else:
             return [self.non_excel_sheet_name]
     
@@ -0,0 +1,82 @@
+from array import array
+import numpy as np
+import pandas as pd
+from t2wml.spreadsheets.compact_values import CompactValues
+
+#pandas.read_excel only trims trailing empty columns since pandas 1.3, before that every row is padded to the widest
+#row (counting the empty, eg formatted, cells openpyxl reads) up to the last row with data
+TRIM_EMPTY_COLUMNS = tuple(int(part) for part in pd.__version__.split(".")[:2]) >= (1, 3)
+
+
+def cell_text(cell):
+    """the value of an openpyxl cell as a string, the same as pandas.read_excel with dtype=str and na_filter=False.
+    error cells are NaN, as in pandas"""
+    value = cell.value
+    if value is None:
+        return ""
+    data_type = cell.data_type
+    if data_type == "e":
+        return np.nan
+    if data_type == "n":
+        as_int = int(value)
+        if as_int == value:
+            return str(as_int)
+        return str(float(value))
+    return str(value)
+
+
+def stream_xlsx_sheet(file_path, sheet_name=None):
+    """read a sheet of an xlsx file into CompactValues, one row at a time, using openpyxl's read-only mode.
+    only the text of the non-empty cells is kept while reading, so memory use doesn't depend on how many empty cells
+    the file has. the sheet has the same shape as pandas.read_excel gives: trailing empty rows are dropped, and
+    trailing empty columns are too on pandas>=1.3 (eg formatting that reaches column XFD doesn't add empty columns).
+
+    Args:
+        file_path (str): location of the xlsx file
+        sheet_name (str, optional): the sheet to read. Defaults to None, the first sheet.
+
+    Returns:
+        CompactValues: the sheet's values
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        sheet.reset_dimensions() #the dimensions saved in the file can't be trusted
+        rows, cols, lengths = array('q'), array('q'), array('q')
+        data = bytearray()
+        other_values = {} #(row, col): value, for cells that aren't strings
+        n_rows = n_cols = 0
+        max_width = 0 #the widest row so far, including empty cells
+        for row_number, row in enumerate(sheet.rows):
+            max_width = max(max_width, len(row))
+            for col_number, cell in enumerate(row):
+                if cell.value is None:
+                    continue
+                text = cell_text(cell)
+                if isinstance(text, str):
+                    if not text:
+                        continue
+                    encoded = text.encode('utf-8', 'surrogatepass')
+                    rows.append(row_number)
+                    cols.append(col_number)
+                    lengths.append(len(encoded))
+                    data += encoded
+                else:
+                    other_values[(row_number, col_number)] = text
+                n_rows = row_number+1
+                if TRIM_EMPTY_COLUMNS:
+                    n_cols = max(n_cols, col_number+1)
+                else:
+                    n_cols = max_width
+    finally:
+        workbook.close()
+
+    cell_lengths = np.zeros(n_rows*n_cols, dtype=np.int64)
+    cell_lengths[np.frombuffer(rows, dtype=np.int64)*n_cols+np.frombuffer(cols, dtype=np.int64)] = np.frombuffer(lengths, dtype=np.int64)
+    offsets = np.zeros(n_rows*n_cols+1, dtype=np.int64)
+    np.cumsum(cell_lengths, out=offsets[1:])
+    values = CompactValues((n_rows, n_cols), offsets, np.frombuffer(data, dtype=np.uint8))
+    for (row, col), value in other_values.items():
+        values[row, col] = value
+    return values
@@ -1,11 +1,26 @@
 # bindings represents information used by classes/functions available in the t2wml parser
-# This class is HIGHLY PROBLEMATIC for multi-user systems. It should be combined with T2WMLSettings, 
-# and some method of passing along both to the parser without using a global function needs to be implemented
+# the values themselves are stored in the current ExecutionContext (see execution_context.py), together with the settings,
+# so that mappings running at the same time in different threads or asyncio tasks don't overwrite each other's sheet and item table
+
+from t2wml.utils.execution_context import get_execution_context
+
 
 class BindingsClass:
-    def __init__(self):
-        self.item_table = None
-        self.excel_sheet = None
+    @property
+    def item_table(self):
+        return get_execution_context().item_table
+
+    @item_table.setter
+    def item_table(self, item_table):
+        get_execution_context().item_table = item_table
+
+    @property
+    def excel_sheet(self):
+        return get_execution_context().excel_sheet
+
+    @excel_sheet.setter
+    def excel_sheet(self, sheet):
+        get_execution_context().excel_sheet = sheet
 
 
 bindings = BindingsClass()
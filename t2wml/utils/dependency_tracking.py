@@ -0,0 +1,74 @@
+# records which sheet cells are read while a statement is evaluated.
+# recording is only active inside a recording() block (eg in a MappingSession), otherwise the record_ functions return immediately.
+# the current recorder is kept in a contextvar, so each thread and asyncio task records separately.
+
+import contextvars
+from t2wml.utils.execution_context import context_variable
+
+_current_recorder = contextvars.ContextVar("t2wml_dependency_recorder", default=None)
+
+
+class DependencyRecorder:
+    """collects the (0-indexed, non-negative) cells and rectangular ranges read from a sheet
+
+    Args:
+        row_len (int): number of rows in the sheet, for normalizing negative indices
+        col_len (int): number of columns in the sheet, for normalizing negative indices
+
+    Attributes:
+        cells (set): (col, row) tuples
+        ranges (list): (col_start, col_stop, row_start, row_stop) tuples, stops are exclusive
+    """
+    def __init__(self, row_len, col_len):
+        self.row_len = row_len
+        self.col_len = col_len
+        self.cells = set()
+        self.ranges = []
+
+    def add_cell(self, col, row):
+        if -self.col_len <= col < self.col_len and -self.row_len <= row < self.row_len:
+            self.cells.add((col % self.col_len, row % self.row_len))
+
+    def add_range(self, cols, rows):
+        """cols and rows are each either an int or a slice, the same as when indexing the sheet"""
+        col_start, col_stop = self._bounds(cols, self.col_len)
+        row_start, row_stop = self._bounds(rows, self.row_len)
+        if col_start < col_stop and row_start < row_stop:
+            self.ranges.append((col_start, col_stop, row_start, row_stop))
+
+    @staticmethod
+    def _bounds(index, length):
+        if isinstance(index, slice):
+            indices = range(*index.indices(length))
+            if not len(indices):
+                return 0, 0
+            return min(indices), max(indices)+1
+        if -length <= index < length:
+            index = index % length
+            return index, index+1
+        return 0, 0
+
+    def merge(self, other):
+        self.cells.update(other.cells)
+        self.ranges.extend(other.ranges)
+
+
+def get_recorder():
+    return _current_recorder.get()
+
+
+def recording(recorder):
+    """record reads inside the with block to recorder (None to not record) instead of the current recorder"""
+    return context_variable(_current_recorder, recorder)
+
+
+def record_cell_read(col, row):
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.add_cell(col, row)
+
+
+def record_range_read(cols, rows):
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.add_range(cols, rows)
@@ -0,0 +1,102 @@
+# the execution context holds everything the t2wml parser and statement creation read "globally":
+# the sheet and item table being used (bindings) and the settings.
+# the current context is stored in a contextvar, so different threads and asyncio tasks can each run with their own.
+# code that never sets a context uses a single process-wide default context, which behaves like the old global bindings and settings.
+
+import contextvars
+from contextlib import contextmanager
+
+
+class ExecutionContext:
+    """holds the bindings and settings used while creating statements
+
+    Args:
+        sheet (Sheet, optional): the sheet being evaluated
+        item_table (ItemTable, optional): the item table used to look up items
+        settings (T2WMLSettings, optional): the settings to use. Defaults to a new T2WMLSettings instance.
+
+    """
+    def __init__(self, sheet=None, item_table=None, settings=None):
+        self.excel_sheet = sheet
+        self.item_table = item_table
+        self._settings = settings
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            from t2wml.settings import T2WMLSettings  # avoid circular import, t2wml.settings uses this module
+            self._settings = T2WMLSettings()
+        return self._settings
+
+    @settings.setter
+    def settings(self, settings):
+        self._settings = settings
+
+    def child(self):
+        """a new context with empty bindings, sharing this context's settings"""
+        return ExecutionContext(settings=self.settings)
+
+
+default_context = ExecutionContext()
+_current_context = contextvars.ContextVar("t2wml_execution_context", default=default_context)
+
+
+def get_execution_context():
+    return _current_context.get()
+
+
+def set_execution_context(context):
+    """sets the context for the current thread/task, returns a token that can be used to reset it"""
+    return _current_context.set(context)
+
+
+def reset_execution_context(token):
+    _current_context.reset(token)
+
+
+@contextmanager
+def execution_context(context=None):
+    """run the code inside the with block in context (by default, a child of the current context)
+
+    Example:
+        with execution_context(ExecutionContext(settings=my_settings)):
+            kg = KnowledgeGraph.generate(yaml_mapper, sheet, wikifier)
+    """
+    if context is None:
+        context = get_execution_context().child()
+    token = set_execution_context(context)
+    try:
+        yield context
+    finally:
+        reset_execution_context(token)
+
+
+@contextmanager
+def context_variable(variable, value):
+    """set the contextvar variable to value inside the with block. for state that's swapped for a block of code
+    (eg the property type table), which can't be assigned to the execution context: outside of execution_context
+    blocks that's the process-wide default context, shared by all threads"""
+    token = variable.set(value)
+    try:
+        yield value
+    finally:
+        try:
+            variable.reset(token)
+        except ValueError:
+            pass #left from a different context (eg a generator closed elsewhere), where variable was never set
+
+
+def iterate_in_context(iterator, context=None):
+    """advances iterator (eg a generator) inside its own copy of the contextvars, with context (by default,
+    a child of the current context) as the execution context. unlike a with block around the loop,
+    this doesn't leak the context into the caller's code between items"""
+    if context is None:
+        context = get_execution_context().child()
+    variables = contextvars.copy_context()
+    variables.run(set_execution_context, context)
+    while True:
+        try:
+            item = variables.run(next, iterator)
+        except StopIteration:
+            return
+        yield item
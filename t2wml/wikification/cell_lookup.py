@@ -0,0 +1,332 @@
+from bisect import bisect_left
+from collections.abc import ItemsView, MutableMapping
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+MAX_COLUMN = 2**31
+MAX_ROW = 2**32
+MIN_MERGE = 2**16 #new entries are kept in a dict until there are this many (or a quarter of the sorted entries)
+
+
+class StringPool:
+    """interns strings as integer ids, so each distinct string is stored once"""
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def id(self, string):
+        """the id of string, adding it if it isn't in the pool yet"""
+        try:
+            return self.ids[string]
+        except KeyError:
+            self.ids[string] = len(self.strings)
+            self.strings.append(string)
+            return self.ids[string]
+
+    def find(self, string):
+        """the id of string, or None if it isn't in the pool"""
+        return self.ids.get(string)
+
+    def __getitem__(self, id):
+        return self.strings[id]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getstate__(self):
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.strings = strings
+        self.ids = {string: id for id, string in enumerate(strings)}
+
+
+class CellLookup(MutableMapping):
+    """a mapping of (col, row, value): item, the same as the dict ItemTable used to keep for each context,
+    stored compactly: values and items are interned in a StringPool, and the entries are kept in sorted numpy arrays
+    (an int64 for the col and row, and int32 ids of the value and item), 16 bytes per entry instead of a tuple,
+    a dict entry and str objects. entries are found with a binary search.
+
+    new entries are added to a small dict, which is merged into the arrays once it is large enough.
+    entries whose col/row aren't non-negative ints or whose value or item isn't a string are kept in a regular dict.
+    iteration is in order of column, row and value (not insertion order).
+
+    Args:
+        strings (StringPool, optional): the pool for interning values and items. sharing one between the lookups of
+                                        all contexts stores strings that appear in several contexts once. Defaults to a new pool.
+    """
+    def __init__(self, strings=None):
+        self.strings = strings if strings is not None else StringPool()
+        self._set_arrays(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+        self._new = {} #(position << 32) | value id: item id, for entries that aren't in the arrays
+        self._other = {} #(col, row, value): item, for entries that can't be stored in the arrays
+        self._count = 0 #entries in the arrays and _new
+
+    @staticmethod
+    def _position(key):
+        #returns (position, value) if the key can be stored in the arrays, otherwise None
+        try:
+            col, row, value = key
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(value, str) or isinstance(col, bool) or isinstance(row, bool):
+            return None
+        if not isinstance(col, (int, np.integer)) or not isinstance(row, (int, np.integer)):
+            return None
+        col, row = int(col), int(row)
+        if not (0 <= col < MAX_COLUMN and 0 <= row < MAX_ROW):
+            return None
+        return (col << 32) | row, value
+
+    def _set_arrays(self, positions, values, items):
+        self._positions = positions #col << 32 | row, sorted
+        self._values = values #sorted within each position
+        self._items = items #-1 for deleted entries
+        #reading single entries through memoryviews gives python ints, which is much faster than numpy scalars
+        self._position_view = memoryview(positions)
+        self._value_view = memoryview(values)
+        self._item_view = memoryview(items)
+
+    def _find(self, position, value_id):
+        #the index of the entry in the arrays, or None
+        positions, values = self._position_view, self._value_view
+        index = bisect_left(positions, position)
+        while index < len(positions) and positions[index] == position:
+            if values[index] == value_id:
+                return index
+            index += 1
+        return None
+
+    def __getitem__(self, key):
+        if self._other:
+            try:
+                return self._other[key]
+            except (KeyError, TypeError):
+                pass
+        encoded = self._position(key)
+        if encoded is None:
+            raise KeyError(key)
+        position, value = encoded
+        value_id = self.strings.find(value)
+        if value_id is None:
+            raise KeyError(key)
+        item_id = self._new.get((position << 32) | value_id)
+        if item_id is None:
+            index = self._find(position, value_id)
+            if index is None:
+                raise KeyError(key)
+            item_id = self._item_view[index]
+            if item_id < 0:
+                raise KeyError(key)
+        return self.strings[item_id]
+
+    def __setitem__(self, key, item):
+        encoded = self._position(key)
+        if encoded is None or not isinstance(item, str):
+            if encoded is not None:
+                self._delete(*encoded)
+            self._other[key] = item
+            return
+        if self._other:
+            self._other.pop(key, None)
+        position, value = encoded
+        value_id, item_id = self.strings.id(value), self.strings.id(item)
+        index = self._find(position, value_id)
+        if index is not None:
+            if self._item_view[index] < 0:
+                self._count += 1
+            self._item_view[index] = item_id
+            return
+        new_key = (position << 32) | value_id
+        if new_key not in self._new:
+            self._count += 1
+        self._new[new_key] = item_id
+        if len(self._new) >= max(MIN_MERGE, len(self._positions)//4):
+            self._merge()
+
+    def _delete(self, position, value):
+        #delete an entry from the arrays or _new, returns whether there was one
+        value_id = self.strings.find(value)
+        if value_id is None:
+            return False
+        if self._new.pop((position << 32) | value_id, None) is not None:
+            self._count -= 1
+            return True
+        index = self._find(position, value_id)
+        if index is None or self._item_view[index] < 0:
+            return False
+        self._item_view[index] = -1
+        self._count -= 1
+        return True
+
+    def __delitem__(self, key):
+        if self._other and key in self._other:
+            del self._other[key]
+            return
+        encoded = self._position(key)
+        if encoded is None or not self._delete(*encoded):
+            raise KeyError(key)
+
+    def _merge(self):
+        #move the new entries into the arrays, and drop deleted entries
+        self._set_arrays(*self._merged_arrays())
+        self._new = {}
+
+    def _merged_arrays(self):
+        #(positions, values, items) of the entries in the arrays and _new, sorted, without deleted entries
+        if not self._new and not (self._items < 0).any():
+            return self._positions, self._values, self._items
+        keep = self._items >= 0
+        positions, values, items = self._positions[keep], self._values[keep], self._items[keep]
+        if self._new:
+            #the keys of _new don't fit in 64 bits, so they're split back into the position and value id here
+            count = len(self._new)
+            new_positions = np.fromiter((key >> 32 for key in self._new), dtype=np.int64, count=count)
+            new_values = np.fromiter((key & 0xFFFFFFFF for key in self._new), dtype=np.int32, count=count)
+            new_items = np.fromiter(self._new.values(), dtype=np.int32, count=count)
+            positions = np.concatenate([positions, new_positions])
+            values = np.concatenate([values, new_values])
+            items = np.concatenate([items, new_items])
+        order = np.lexsort((values, positions))
+        return positions[order], values[order], items[order]
+
+    def update_arrays(self, columns, rows, values, items, replace=True):
+        """add many (column, row, value): item entries at once, from equal-length arrays, which is much faster than
+        adding them one at a time. like updating from a dict of the entries: of entries with the same key the
+        last one is added, and with replace=False an entry that is already there is kept"""
+        columns = np.asarray(columns, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.asarray(values, dtype=object)
+        items = np.asarray(items, dtype=object)
+        fits = (columns >= 0).all() and (columns < MAX_COLUMN).all() and (rows >= 0).all() and (rows < MAX_ROW).all()
+        all_strings = infer_dtype(values, skipna=False) in ("string", "empty") and infer_dtype(items, skipna=False) in ("string", "empty")
+        if self._other or not fits or not all_strings:
+            #entries outside the arrays are involved, which one wins is simplest to get right one at a time
+            for key, item in dict(zip(zip(columns.tolist(), rows.tolist(), values), items)).items():
+                if replace or key not in self:
+                    self[key] = item
+            return
+        if not len(columns):
+            return
+        positions = (columns << 32) | rows
+        value_ids = self._intern(values)
+        item_ids = self._intern(items)
+        #of the new entries with the same key, keep the last one (lexsort is stable, so they stay in order)
+        order = np.lexsort((value_ids, positions))
+        positions, value_ids, item_ids = positions[order], value_ids[order], item_ids[order]
+        last = np.ones(len(positions), dtype=bool)
+        last[:-1] = (positions[1:] != positions[:-1]) | (value_ids[1:] != value_ids[:-1])
+        positions, value_ids, item_ids = positions[last], value_ids[last], item_ids[last]
+
+        self._merge()
+        if not len(self._positions):
+            self._set_arrays(positions, value_ids, item_ids)
+            self._count = len(positions)
+            return
+        #existing entries first, then new ones. for keys in both, keep the one that wins
+        all_positions = np.concatenate([self._positions, positions])
+        all_values = np.concatenate([self._values, value_ids])
+        all_items = np.concatenate([self._items, item_ids])
+        order = np.lexsort((all_values, all_positions))
+        all_positions, all_values, all_items = all_positions[order], all_values[order], all_items[order]
+        duplicate = np.zeros(len(all_positions), dtype=bool) #the first of two entries with the same key
+        duplicate[:-1] = (all_positions[1:] == all_positions[:-1]) & (all_values[1:] == all_values[:-1])
+        if replace:
+            keep = ~duplicate
+        else:
+            keep = np.ones(len(all_positions), dtype=bool)
+            keep[1:] = ~duplicate[:-1]
+        self._set_arrays(all_positions[keep], all_values[keep], all_items[keep])
+        self._count = len(self._positions)
+
+    def _intern(self, strings):
+        #the ids of an array of strings in the pool, interning each distinct string once
+        codes, uniques = pd.factorize(strings)
+        ids = np.fromiter((self.strings.id(string) for string in uniques), dtype=np.int32, count=len(uniques))
+        return ids[codes]
+
+    def __len__(self):
+        return self._count + len(self._other)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_position_view", "_value_view", "_item_view"): #memoryviews can't be pickled
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_arrays(self._positions, self._values, self._items)
+
+    def __iter__(self):
+        positions, values, _ = self._merged_arrays()
+        strings = self.strings
+        for position, value_id in zip(positions.tolist(), values.tolist()):
+            yield (position >> 32, position & 0xFFFFFFFF, strings[value_id])
+        yield from list(self._other)
+
+    def items(self):
+        return CellLookupItems(self)
+
+    def _iter_items(self):
+        #all the entries, decoded from the arrays in bulk rather than looked up one key at a time
+        positions, values, items = self._merged_arrays()
+        strings = self.strings
+        for position, value_id, item_id in zip(positions.tolist(), values.tolist(), items.tolist()):
+            yield (position >> 32, position & 0xFFFFFFFF, strings[value_id]), strings[item_id]
+        yield from list(self._other.items())
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __repr__(self):
+        return "CellLookup({})".format(dict(self.items()))
+
+
+class CellLookupItems(ItemsView):
+    """the items view of a CellLookup, iterating over the arrays in bulk"""
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class LookupTable(dict):
+    """context: CellLookup. like a defaultdict, indexing a context that isn't there adds an empty CellLookup for it.
+    all the contexts share one StringPool
+
+    Args:
+        lookup_table (dict, optional): context: {(col, row, value): item} to start with
+    """
+    def __init__(self, lookup_table=None):
+        super().__init__()
+        self.strings = StringPool()
+        for context, lookup in (lookup_table or {}).items():
+            self[context] = lookup
+
+    def __missing__(self, context):
+        lookup = CellLookup(self.strings)
+        super().__setitem__(context, lookup)
+        return lookup
+
+    def __setitem__(self, context, lookup):
+        if not isinstance(lookup, CellLookup) or lookup.strings is not self.strings:
+            entries = lookup
+            lookup = CellLookup(self.strings)
+            lookup.update(entries)
+        super().__setitem__(context, lookup)
+
+    def __reduce__(self):
+        return _restore_lookup_table, (self.strings, dict(self))
+
+
+def _restore_lookup_table(strings, lookups):
+    #for unpickling, the lookups already use strings
+    lookup_table = LookupTable()
+    lookup_table.strings = strings
+    for context, lookup in lookups.items():
+        dict.__setitem__(lookup_table, context, lookup)
+    return lookup_table
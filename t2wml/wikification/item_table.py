@@ -1,26 +1,104 @@
 import json
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 from t2wml.utils.t2wml_exceptions import ItemNotFoundException
 from t2wml.utils.debug_logging import basic_debug
+from t2wml.wikification.cell_lookup import LookupTable
 
 
 class ItemTable:
+    """looks up the item of a cell in layers: an item for the exact cell (col, row, value),
+    then a value rule for the cell's row (None, row, value), then one for its column (col, None, value),
+    and then a value rule for the whole sheet (None, None, value).
+    a value that's wikified the same way everywhere only needs one rule, instead of an entry for every cell it's in.
+
+    Args:
+        lookup_table (dict, optional): context: {(col, row, value): item}, where col and/or row can be None for value rules
+    """
     def __init__(self, lookup_table = None):
-        lookup_table = lookup_table or {}
-        self.lookup_table = defaultdict(dict, lookup_table)
+        #context: CellLookup, a compact mapping of (col, row, value): item
+        self.lookup_table = LookupTable()
+        #context: {(col or None, row or None, value): item}
+        self.value_rules = defaultdict(dict)
+        for context, entries in (lookup_table or {}).items():
+            for (column, row, value), item in entries.items():
+                self.set_item(context, column, row, value, item)
+
+    def entries(self, context, column, row):
+        """the mapping (col, row, value): item that an entry for column and row belongs in, for context"""
+        if column is None or row is None:
+            return self.value_rules[context]
+        return self.lookup_table[context]
+
+    def set_item(self, context, column, row, value, item, replace=True):
+        """add an entry, or a value rule if column and/or row is None. with replace=False, an existing entry is kept"""
+        if not replace and self.has_item(context, column, row, value):
+            return
+        self.entries(context, column, row)[(column, row, value)] = item
+
+    def delete_item(self, context, column, row, value):
+        entries = self.value_rules if column is None or row is None else self.lookup_table
+        if context in entries:
+            entries[context].pop((column, row, value), None)
+
+    def items(self, context):
+        """the ((col, row, value), item) entries and value rules of context"""
+        yield from self.lookup_table.get(context, {}).items()
+        yield from self.value_rules.get(context, {}).items()
+
+    def add_entries(self, contexts, columns, rows, values, items, replace=True):
+        """add many entries at once, from equal-length arrays (see wikifier_columns). columns and rows are floats,
+        NaN for value rules. the same as update_from_dict with a dict of the entries (the last of entries with the
+        same key is added), but the entries for exact cells are added to each context's CellLookup in one go"""
+        for context, indices in _context_groups(contexts):
+            cells = ~(np.isnan(columns[indices]) | np.isnan(rows[indices]))
+            cell_indices = indices[cells]
+            if len(cell_indices):
+                self.lookup_table[context].update_arrays(columns[cell_indices].astype(np.int64), rows[cell_indices].astype(np.int64),
+                                                         values[cell_indices], items[cell_indices], replace)
+            rule_indices = indices[~cells]
+            rules = zip([_optional_index(column) for column in columns[rule_indices].tolist()],
+                        [_optional_index(row) for row in rows[rule_indices].tolist()],
+                        values[rule_indices])
+            for (column, row, value), item in dict(zip(rules, items[rule_indices])).items():
+                self.set_item(context, column, row, value, item, replace)
+
+    def commit(self):
+        """write any pending changes, for item tables that are stored outside of memory (see SQLiteItemTable)"""
+        pass
+
+    def has_item(self, context, column, row, value):
+        """whether there is an entry for exactly (column, row, value), not counting the value rules that would apply to it"""
+        if column is None or row is None:
+            entries = self.value_rules.get(context, {})
+        else:
+            entries = self.lookup_table.get(context, {})
+        return (column, row, value) in entries
+
+    def contexts(self):
+        return list(dict.fromkeys(list(self.lookup_table)+list(self.value_rules)))
 
     def lookup_func(self, context, column, row, value):
         lookup = self.lookup_table.get(context)
-        if not lookup:
+        rules = self.value_rules.get(context)
+        if not lookup and not rules:
             raise ItemNotFoundException(
                 "Search for cell item failed. (No values defined for context: {})".format(context))
 
         key = (column, row, value)
-        try:
-            return lookup[key]
-        except KeyError:
-             raise ItemNotFoundException(str(key)+ " not found")
+        if lookup:
+            try:
+                return lookup[key]
+            except KeyError:
+                pass
+        if rules:
+            for rule in ((None, row, value), (column, None, value), (None, None, value)):
+                try:
+                    return rules[rule]
+                except KeyError:
+                    pass
+        raise ItemNotFoundException(str(key)+ " not found")
 
     def get_item(self, column:int, row:int, sheet=None, context:str='', value=None):
         if value is None:
@@ -34,7 +112,7 @@ class ItemTable:
     def get_cell_info(self, column, row, sheet):
         """used to serialize the table"""
         value = str(sheet[row, column])
-        for context in self.lookup_table:
+        for context in self.contexts():
             item = self.get_item(column, row, sheet, context=context, value=value)
             if item:
                 return item, context, value
@@ -60,21 +138,30 @@ class Wikifier:
             for col in range(col1, col2+1):
                 if sheet:
                     value = sheet[row, col]
-                self.lookup_table.get(context).pop((col, row, value), None)
+                self.item_table.delete_item(context, col, row, value)
     
     def add_or_replace(self, replace, context, col, row, value, item):
-        if not replace:
-            if (col, row, value) in self.lookup_table.get(context, {}):
-                return
-        self.lookup_table[context][(col, row, value)] = item
+        #col and/or row None add a value rule, see ItemTable
+        self.item_table.set_item(context, col, row, value, item, replace)
 
 
     
     def add_wikification(self, item, selection, value, context:str='', replace=True):
+        """selection is ((row1, col1), (row2, col2)), 0-indexed, or None to wikify value everywhere in the sheet"""
+        if selection is None:
+            self.add_value_rule(item, value, context, replace=replace)
+            return
         (row1, col1), (row2, col2) = selection
         for row in range(row1, row2+1):
             for col in range(col1, col2+1):
                 self.add_or_replace(replace, context, col, row, value, item)
+
+    def add_value_rule(self, item, value, context:str='', row=None, column=None, replace=True):
+        """wikify value as item in every cell of the sheet, or of one (0-indexed) row or column.
+        items added for exact cells take precedence over rules, and row and column rules over rules for the whole sheet"""
+        if row is not None and column is not None:
+            raise ValueError("a value rule can apply to a row or a column, not both. use add_wikification for single cells")
+        self.add_or_replace(replace, context, column, row, value, item)
     
 
     def update_from_dict(self, wiki_dict, replace=True):
@@ -88,8 +175,7 @@ class Wikifier:
                     self.add_or_replace(replace, context, col, row, value, item)
     
     def add_dataframe(self, df, replace=True): #TODO: replace all instances
-        wiki_dict=convert_old_df_to_dict(df)
-        self.update_from_dict(wiki_dict, replace)
+        self.item_table.add_entries(*wikifier_columns(df), replace=replace)
 
     def add_file(self, filepath, replace=True): #TODO: replace?
         df = pd.read_csv(filepath)
@@ -99,14 +185,11 @@ class Wikifier:
     def load_from_file(cls, filepath):
         with open(filepath, 'r', encoding="utf-8") as f:
             itemized_dict = json.load(f)
-            lookup_table=dict()
-            for context in itemized_dict:
-                try:
-                    arr = itemized_dict[context]
-                    lookup_table[context]={tuple(entry[0]): entry[1] for entry in arr}
-                except Exception as e:
-                    raise e
-        return cls(lookup_table, filepath)
+        wikifier = cls(filepath=filepath)
+        for context in itemized_dict:
+            for (col, row, value), item in itemized_dict[context]:
+                wikifier.item_table.set_item(context, col, row, value, item)
+        return wikifier
     
     def save_to_file(self, filepath=None):
         if not filepath:
@@ -114,15 +197,52 @@ class Wikifier:
         if not filepath:
             return
         with open(filepath, 'w', encoding="utf-8") as f:
-            itemized_dict = {key: list(self.lookup_table[key].items()) for key in self.lookup_table}
+            itemized_dict = {context: list(self.item_table.items(context)) for context in self.item_table.contexts()}
             f.write(json.dumps(itemized_dict))
 
 
-def convert_old_wikifier_to_new(wikifier_file, sheet):
-    """compatibility for versions older than 0.5.0"""
+class SheetValueIndex:
+    """the positions of every value in a sheet, so the cells that have a value are found without scanning the whole sheet
+
+    Args:
+        sheet (Sheet): the sheet to index
+    """
+    def __init__(self, sheet):
+        values = np.asarray(sheet[:, :], dtype=object)
+        self.col_len = values.shape[1]
+        codes, uniques = pd.factorize(values.ravel()) #empty (NaN/None) cells have code -1, and are never found
+        self._codes = {value: code for code, value in enumerate(uniques)}
+        self._order = np.argsort(codes, kind="stable")
+        self._bounds = np.searchsorted(codes[self._order], np.arange(len(uniques)+1))
+
+    def positions(self, value, row=None, column=None):
+        """the (row, column) of each cell whose value is value, optionally only in row or in column, row by row"""
+        code = self._codes.get(value)
+        if code is None:
+            return []
+        cells = self._order[self._bounds[code]:self._bounds[code+1]]
+        rows, columns = cells // self.col_len, cells % self.col_len
+        if row is not None:
+            columns, rows = columns[rows == row], rows[rows == row]
+        if column is not None:
+            rows, columns = rows[columns == column], columns[columns == column]
+        return list(zip(rows.tolist(), columns.tolist()))
+
+
+def read_old_wikifier(wikifier_file):
+    """read a wikifier csv from versions older than 0.5.0, for convert_old_wikifier_to_new"""
     df = pd.read_csv(wikifier_file)
     df = df.fillna('')
     df = df.replace(r'^\s+$', '', regex=True)
+    return df
+
+
+def convert_old_wikifier_to_new(wikifier_file, sheet, value_index=None):
+    """compatibility for versions older than 0.5.0.
+    wikifier_file can also be a dataframe from read_old_wikifier, to read the file once when converting it for several sheets.
+    the cells that rows without a row and/or column apply to are found with a SheetValueIndex of the sheet
+    (built the first time it's needed, unless one is passed as value_index), so the sheet isn't scanned for every row"""
+    df = wikifier_file if isinstance(wikifier_file, pd.DataFrame) else read_old_wikifier(wikifier_file)
     new_rows=[]
     columns=['row', 'column', 'value', 'context', 'item', "sheet", "file"]
     for entry in df.itertuples():
@@ -153,25 +273,12 @@ def convert_old_wikifier_to_new(wikifier_file, sheet):
                 except:
                     pass #print("row+col outside of sheet bounds, skipping")
                 continue
-            
-            if (column=="" and row==""):
-                for r in range(sheet.row_len):
-                    for c in range(sheet.col_len):
-                        if sheet[r, c] == value:
-                            new_rows.append([r, c, value, context, item, sheet.name, sheet.data_file_name])
-                continue
-            
-            if row!="":
-                for c in range(sheet.col_len):
-                    if sheet[row, c] ==  value:
-                        new_rows.append([row, c, value, context, item, sheet.name, sheet.data_file_name])
-                continue
 
-            if column!="":
-                for r in range(sheet.row_len):
-                    if sheet[r, column] ==  value:
-                        new_rows.append([r, column, value, context, item, sheet.name, sheet.data_file_name])
-                continue
+            if value_index is None:
+                value_index = SheetValueIndex(sheet)
+            #a row or column outside of the sheet has no cells, the same as for rows without a value
+            for r, c in value_index.positions(value, row=row if row!="" else None, column=column if column!="" else None):
+                new_rows.append([r, c, value, context, item, sheet.name, sheet.data_file_name])
 
 
     new_df = pd.DataFrame(new_rows, columns=columns)
@@ -179,17 +286,70 @@ def convert_old_wikifier_to_new(wikifier_file, sheet):
     return new_wiki_dict
             
     
+def _optional_index(index):
+    #an empty row or column (NaN when read from a csv) is None
+    if index is None or (isinstance(index, float) and index != index) or str(index).strip() == "":
+        return None
+    return int(index)
+
+
+def _index_column(series):
+    #the column or row column of a wikifier dataframe as floats, NaN where it's empty (see _optional_index)
+    if series.dtype == object:
+        series = series.where(series.astype(str).str.strip() != "")
+    return pd.to_numeric(series).to_numpy(dtype=float)
+
+
+def _context_name(context):
+    context = context or ""
+    if str(context) == "nan":
+        context = ""
+    return context
+
+
+def _context_groups(contexts):
+    #(context, indices of its entries), for each context in order of appearance
+    codes, uniques = pd.factorize(contexts)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques)+1))
+    for code, context in enumerate(uniques):
+        yield context, order[bounds[code]:bounds[code+1]]
+
+
+def wikifier_columns(df):
+    """the entries of a wikifier dataframe (with column, row, value, context and item columns), converted a column
+    at a time the same way convert_old_df_to_dict converts each row.
+
+    Returns:
+        tuple: equal-length arrays (contexts, columns, rows, values, items), where columns and rows are floats,
+               NaN where they're empty (for value rules)
+    """
+    columns = _index_column(df["column"])
+    rows = _index_column(df["row"])
+    raw_values = df["value"]
+    values = raw_values.astype(str).to_numpy(dtype=object)
+    is_rule = np.isnan(columns) | np.isnan(rows)
+    if is_rule.any():
+        stripped = pd.Series(values[is_rule]).str.strip()
+        if (raw_values[is_rule].isna().to_numpy() | stripped.isin(["", "nan"]).to_numpy()).any():
+            raise ValueError("a value is needed for rows that leave the column or row unspecified")
+    codes, uniques = pd.factorize(df["context"])
+    names = np.empty(len(uniques)+1, dtype=object)
+    names[:] = [_context_name(context) for context in uniques]+[""] #code -1 is for NaN
+    contexts = names[codes]
+    items = df["item"].to_numpy(dtype=object)
+    return contexts, columns, rows, values, items
+
+
 def convert_old_df_to_dict(df): 
-    """compatiblity with versions older than 0.6.1"""
+    """compatiblity with versions older than 0.6.1.
+    rows with an empty column and/or row become value rules (see ItemTable), with None for the empty column/row"""
+    contexts, columns, rows, values, items = wikifier_columns(df)
     wiki_dict=defaultdict(dict)
-    for entry in df.itertuples():
-        column = int(entry.column)
-        row = int(entry.row)
-        value = str(entry.value)
-        context = entry.context or ""
-        if str(context) == "nan":
-            context=""
-        item = entry.item
-        wiki_dict[context][(column, row, value)] = item
+    for context, indices in _context_groups(contexts):
+        keys = zip([_optional_index(column) for column in columns[indices].tolist()],
+                   [_optional_index(row) for row in rows[indices].tolist()],
+                   values[indices])
+        wiki_dict[context] = dict(zip(keys, items[indices]))
     return wiki_dict
 
@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+from t2wml.utils.t2wml_exceptions import ItemNotFoundException
+from t2wml.wikification.item_table import ItemTable, Wikifier
+
+BATCH_SIZE = 10000 #changes are written in batches of this many
+
+ANY = -1 #stored in the col/row columns for value rules (None in the api)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wikification (
+    context TEXT NOT NULL,
+    value TEXT NOT NULL,
+    col INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    item TEXT,
+    PRIMARY KEY (context, value, col, row)
+) WITHOUT ROWID
+"""
+
+#the exact cell first, then the rules for its row, its column and the whole sheet, see ItemTable
+LOOKUP = "SELECT col, row, item FROM wikification WHERE context=? AND value=? AND col IN (?, -1) AND row IN (?, -1)"
+
+
+def _stored_index(index):
+    if index is None:
+        return ANY
+    index = int(index)
+    if index < 0:
+        raise ValueError("columns and rows stored in a SQLiteItemTable must be non-negative, not {}".format(index))
+    return index
+
+
+def _api_index(index):
+    return None if index == ANY else index
+
+
+class SQLiteItemTable(ItemTable):
+    """an ItemTable stored in a SQLite file, with the same layers of lookups (exact cells, then value rules).
+    entries are indexed by (context, value, col, row), so lookups and edits don't depend on the size of the table.
+    changes are written in batches, and committed with commit() (which Wikifier.save_to_file calls).
+
+    the same file can be read by several processes at once. a pickled SQLiteItemTable (eg sent to worker processes)
+    opens the file read-only, and sees what was committed before it was pickled.
+
+    Args:
+        db_path (str): location of the SQLite file, it's created if it doesn't exist
+        read_only (bool, optional): open the file read-only. Defaults to False.
+    """
+    def __init__(self, db_path, read_only=False):
+        self.db_path = str(db_path)
+        self.read_only = read_only
+        self._connection = None
+        self._pid = None
+        self._pending = [] #(replace, rows) batches of changes that weren't written yet
+        self._pending_count = 0
+        self._contexts = None
+        self._connect()
+
+    def _connect(self):
+        #sqlite connections can't be shared with forked processes, each process opens its own
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        if self._pid is not None and self._pid != os.getpid():
+            self._pending, self._pending_count = [], 0 #changes the parent process didn't write belong to it
+        if self.read_only:
+            self._connection = sqlite3.connect(Path(self.db_path).resolve().as_uri()+"?mode=ro", uri=True)
+        else:
+            self._connection = sqlite3.connect(self.db_path)
+            self._connection.execute("PRAGMA journal_mode=WAL") #readers in other processes don't block the writer
+            self._connection.execute(SCHEMA)
+            self._connection.commit()
+        self._pid = os.getpid()
+        return self._connection
+
+    def _execute(self, sql, parameters=()):
+        self._flush()
+        return self._connect().execute(sql, parameters)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        connection = self._connect()
+        for replace, rows in self._pending:
+            verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+            connection.executemany(verb+" INTO wikification (context, value, col, row, item) VALUES (?, ?, ?, ?, ?)", rows)
+        self._pending, self._pending_count = [], 0
+
+    def set_item(self, context, column, row, value, item, replace=True):
+        if self.read_only:
+            raise ValueError("can't add items to a read-only SQLiteItemTable")
+        entry = (context, value, _stored_index(column), _stored_index(row), item)
+        if self._pending and self._pending[-1][0] == replace:
+            self._pending[-1][1].append(entry)
+        else:
+            self._pending.append((replace, [entry]))
+        self._pending_count += 1
+        if self._pending_count >= BATCH_SIZE:
+            self._flush()
+        self._contexts = None
+
+    def add_entries(self, contexts, columns, rows, values, items, replace=True):
+        #the entries are written in batches anyway
+        entries = {}
+        for context, column, row, value, item in zip(contexts, columns.tolist(), rows.tolist(), values, items):
+            entries[(context, None if column != column else column, None if row != row else row, value)] = item
+        for (context, column, row, value), item in entries.items():
+            self.set_item(context, column, row, value, item, replace)
+
+    def delete_item(self, context, column, row, value):
+        self._execute("DELETE FROM wikification WHERE context=? AND value=? AND col=? AND row=?",
+                      (context, value, _stored_index(column), _stored_index(row)))
+        self._contexts = None
+
+    def has_item(self, context, column, row, value):
+        cursor = self._execute("SELECT 1 FROM wikification WHERE context=? AND value=? AND col=? AND row=?",
+                               (context, value, _stored_index(column), _stored_index(row)))
+        return cursor.fetchone() is not None
+
+    def contexts(self):
+        if self._contexts is None:
+            self._contexts = [context for (context,) in self._execute("SELECT DISTINCT context FROM wikification")]
+        return list(self._contexts)
+
+    def items(self, context):
+        cursor = self._execute("SELECT col, row, value, item FROM wikification WHERE context=? ORDER BY col=-1, row=-1, col, row, value", (context,))
+        for col, row, value, item in cursor:
+            yield (_api_index(col), _api_index(row), value), item
+
+    def lookup_func(self, context, column, row, value):
+        if self._contexts is None:
+            self.contexts()
+        if context not in self._contexts:
+            raise ItemNotFoundException(
+                "Search for cell item failed. (No values defined for context: {})".format(context))
+        key = (column, row, value)
+        found = {}
+        for found_col, found_row, item in self._execute(LOOKUP, (context, value, int(column), int(row))):
+            found[(found_col == ANY, found_row == ANY)] = item
+        for layer in ((False, False), (True, False), (False, True), (True, True)):
+            if layer in found:
+                return found[layer]
+        raise ItemNotFoundException(str(key)+ " not found")
+
+    def commit(self):
+        if self.read_only:
+            return
+        self._flush()
+        self._connect().commit()
+
+    def close(self):
+        self.commit()
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __getstate__(self):
+        self.commit()
+        return dict(db_path=self.db_path)
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"], read_only=True)
+
+
+class SQLiteWikifier(Wikifier):
+    """a Wikifier whose item table is stored in a SQLite file (see SQLiteItemTable), instead of in memory and saved as json.
+    adding entries only writes those entries, and save_to_file commits them, rather than rewriting the whole file.
+
+    Args:
+        db_path (str): location of the SQLite file, it's created if it doesn't exist
+        read_only (bool, optional): open the file read-only. Defaults to False.
+    """
+    def __init__(self, db_path, read_only=False):
+        self.item_table = SQLiteItemTable(db_path, read_only)
+        self.filepath = str(db_path)
+
+    @property
+    def lookup_table(self):
+        raise AttributeError("a SQLiteWikifier's entries are stored in its database, use item_table.items(context)")
+
+    @classmethod
+    def load_from_file(cls, filepath):
+        return cls(filepath)
+
+    def save_to_file(self, filepath=None):
+        """commits the changes to the database. with a different filepath, saves the entries there as json, like Wikifier"""
+        self.item_table.commit()
+        if filepath and Path(filepath).resolve() != Path(self.filepath).resolve():
+            super().save_to_file(filepath)
+
+    def import_file(self, filepath, replace=True):
+        """add the entries of a json file saved by Wikifier.save_to_file"""
+        with open(filepath, 'r', encoding="utf-8") as f:
+            self.update_from_dict(json.load(f), replace)
@@ -1,4 +1,5 @@
 from collections import defaultdict
+import contextvars
 import json
 import csv
 from pathlib import Path
@@ -7,6 +8,7 @@ from SPARQLWrapper.SPARQLExceptions import QueryBadFormed
 from t2wml.utils import t2wml_exceptions as T2WMLExceptions
 from t2wml.wikification.wikidata_provider import DictionaryProvider
 from t2wml.settings import t2wml_settings
+from t2wml.utils.execution_context import context_variable
 from t2wml.utils.debug_logging import basic_debug
 
 
@@ -24,20 +26,91 @@ def get_provider():
         t2wml_settings.wikidata_provider = wikidata_provider
     return wikidata_provider
 
+
+_current_property_types = contextvars.ContextVar("t2wml_property_types", default=None) #see property_type_table
+
+
 #@basic_debug
 def get_property_type(prop):
+    """returns the (lowercase) type of the property, from the current PropertyTypeTable if there is one,
+    otherwise from the provider"""
+    table = _current_property_types.get()
+    if table is not None:
+        return table.get(prop)
+    return get_property_type_from_provider(get_provider(), prop)
+
+
+def get_property_type_from_provider(provider, prop):
     try:
-        provider = get_provider()
         prop_type = provider.get_property_type(prop)
-        if prop_type == "Property Not Found":
-            raise T2WMLExceptions.UnsupportedPropertyType("Property "+prop+" not found")
-        return str(prop_type).lower()
     except QueryBadFormed:
         raise T2WMLExceptions.UnsupportedPropertyType(
             "The value given for property is not a valid property:" + str(prop))
     except ValueError:
         raise T2WMLExceptions.UnsupportedPropertyType(
             "Property not found:" + str(prop))
+    return normalize_property_type(prop, prop_type)
+
+
+def normalize_property_type(prop, prop_type):
+    if prop_type == "Property Not Found":
+        raise T2WMLExceptions.UnsupportedPropertyType("Property "+prop+" not found")
+    return str(prop_type).lower()
+
+
+class PropertyTypeTable:
+    """the property types resolved during a single run (eg one get_statements call), so each property
+    is looked up in the provider once, instead of once for every statement and qualifier that uses it.
+    failed lookups are remembered too, and raise the same error again.
+
+    Args:
+        provider (WikidataProvider, optional): Defaults to the current provider
+    """
+    def __init__(self, provider=None):
+        if provider is None:
+            provider = get_provider()
+        self.provider = provider
+        self.types = {} # property: type, or the exception raised when looking it up
+
+    def prefetch(self, properties):
+        """look up many properties at once, if the provider supports it (with get_property_types). anything that isn't
+        found is left to be looked up (and fail) one at a time in get"""
+        properties = [prop for prop in set(properties) if isinstance(prop, str) and prop and prop not in self.types]
+        get_property_types = getattr(self.provider, "get_property_types", None)
+        if not properties or get_property_types is None:
+            return
+        try:
+            found = get_property_types(properties)
+        except Exception: #the per-property lookup will raise the appropriate error
+            return
+        for prop, prop_type in found.items():
+            try:
+                self.types[prop] = normalize_property_type(prop, prop_type)
+            except T2WMLExceptions.UnsupportedPropertyType as e:
+                self.types[prop] = e
+
+    def get(self, prop):
+        try:
+            prop_type = self.types[prop]
+        except KeyError:
+            try:
+                prop_type = get_property_type_from_provider(self.provider, prop)
+            except Exception as e:
+                prop_type = e
+            self.types[prop] = prop_type
+        except TypeError: #unhashable, eg a list
+            return get_property_type_from_provider(self.provider, prop)
+        if isinstance(prop_type, Exception):
+            raise prop_type.with_traceback(None)
+        return prop_type
+
+
+def property_type_table(table=None):
+    """use table (by default, a new PropertyTypeTable) for get_property_type inside the with block.
+    the table is kept in a contextvar, so each thread and asyncio task has its own"""
+    if table is None:
+        table = PropertyTypeTable()
+    return context_variable(_current_property_types, table)
 
 
 def validate_id(node_id):
@@ -66,10 +66,7 @@ class SparqlProvider(WikidataProvider):
                     }}
                 }}
                 """.format(wpid=wikidata_property)
-        sparql = SPARQLWrapper(self.sparql_endpoint, agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36')
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
+        results = self.run_sparql_query(query)
         try:
             results_0=results["results"]["bindings"][0]
             data_type = results_0["type"]["value"].split("#")[1]
@@ -80,6 +77,38 @@ class SparqlProvider(WikidataProvider):
             return failure_dict
         return dict(data_type=data_type, label=label, description=description)
 
+    def query_wikidata_for_property_types(self, wikidata_properties):
+        """the same as query_wikidata_for_property_type, for many properties with a single query.
+        returns a dict of property: property args, only for the properties that were found"""
+        query = """SELECT ?property ?label ?desc ?type
+                WHERE 
+                {{
+                VALUES ?property {{ {wpids} }}
+                ?property wikibase:propertyType ?type.
+                SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en".
+                        ?property rdfs:label         ?label.
+                        ?property schema:description   ?desc.
+                    }}
+                }}
+                """.format(wpids=" ".join("wd:"+wikidata_property for wikidata_property in wikidata_properties))
+        results = self.run_sparql_query(query)
+        found = {}
+        for result in results["results"]["bindings"]:
+            wikidata_property = result["property"]["value"].split("/")[-1]
+            found[wikidata_property] = dict(data_type=result["type"]["value"].split("#")[1],
+                                            label=result.get("label", {}).get("value", ""),
+                                            description=result.get("desc", {}).get("value", ""))
+        for wikidata_property in wikidata_properties:
+            if wikidata_property not in found:
+                self.failed_sparql_queries.add(wikidata_property)
+        return found
+
+    def run_sparql_query(self, query):
+        sparql = SPARQLWrapper(self.sparql_endpoint, agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36')
+        sparql.setQuery(query)
+        sparql.setReturnFormat(JSON)
+        return sparql.query().convert()
+
     #@basic_debug
     def get_property_type(self, wikidata_id: str):
         property_args = self.cache.get(wikidata_id, False)
@@ -91,6 +120,24 @@ class SparqlProvider(WikidataProvider):
             raise ValueError("Property "+wikidata_id+" not found")
         return data_type
     
+    def get_property_types(self, wikidata_properties, *args, **kwargs):
+        """returns a dict of property: data type for the properties that have one,
+        with a single sparql query for all the properties that aren't cached yet"""
+        types = {}
+        to_query = []
+        for wikidata_property in wikidata_properties:
+            property_args = self.cache.get(wikidata_property, False)
+            if property_args:
+                if property_args["data_type"] != "Property Not Found":
+                    types[wikidata_property] = property_args["data_type"]
+            elif wikidata_property[1:].isdigit() and wikidata_property not in self.failed_sparql_queries:
+                to_query.append(wikidata_property)
+        if to_query:
+            for wikidata_property, property_args in self.query_wikidata_for_property_types(to_query).items():
+                self.save_entry(wikidata_property, **property_args)
+                types[wikidata_property] = property_args["data_type"]
+        return types
+
     def get_entity(self, id, *args, **kwargs):
         property_type=self.get_property_type(id) #trigger caching so we can just check cache
         return self.cache[id]
@@ -123,6 +170,18 @@ class FallbackSparql(SparqlProvider):
             data_type = super().get_property_type(wikidata_property)
         return data_type
 
+    def get_property_types(self, wikidata_properties, *args, **kwargs):
+        types = {}
+        remaining = []
+        for wikidata_property in wikidata_properties:
+            try:
+                types[wikidata_property] = self.try_get_property_type(wikidata_property, *args, **kwargs)
+            except Exception:
+                remaining.append(wikidata_property)
+        if remaining and self.sparql_endpoint != "DO NOT QUERY":
+            types.update(super().get_property_types(remaining))
+        return types
+
     def try_get_property_type(self, wikidata_property, *args, **kwargs):
         raise NotImplementedError
 
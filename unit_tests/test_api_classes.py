@@ -35,6 +35,167 @@ class ClassesTest(unittest.TestCase):
         assert new_wf.item_table.get_item(0, 3, sheet) == "Q967"
         assert new_wf.item_table.get_item(0, 5, sheet) == "Q99"
 
+    def test_cell_lookup(self):
+        import pickle
+        from unittest import mock
+        from t2wml.api import Wikifier
+        from t2wml.wikification import cell_lookup
+        from t2wml.wikification.cell_lookup import CellLookup
+        with mock.patch.object(cell_lookup, "MIN_MERGE", 2): #merge new entries into the arrays often
+            entries = {}
+            lookup = CellLookup()
+            for index in range(50):
+                key = (index % 3, index // 3, "value {}".format(index % 4))
+                entries[key] = lookup[key] = "Q{}".format(index % 5)
+            lookup[(-1, 2, "negative")] = entries[(-1, 2, "negative")] = "Q1" #kept outside the arrays
+            lookup[(1, 1, "not a string")] = entries[(1, 1, "not a string")] = None
+            del lookup[(0, 0, "value 0")], entries[(0, 0, "value 0")]
+            lookup[(2, 0, "value 2")] = entries[(2, 0, "value 2")] = "Q99"
+            assert len(lookup) == len(entries)
+            pending = dict(lookup._new), lookup._items.copy()
+            items = lookup.items()
+            assert dict(items) == entries and dict(items) == entries and len(items) == len(entries)
+            assert items == entries.items() and ((2, 0, "value 2"), "Q99") in items
+            assert set(lookup) == set(entries)
+            assert lookup._new == pending[0] and (lookup._items == pending[1]).all() #reading doesn't merge
+            assert (0, 0, "value 0") not in lookup and lookup.get((0, 5, "value 3")) == "Q0"
+            assert dict(pickle.loads(pickle.dumps(lookup)).items()) == entries
+            assert len(lookup.strings) == 4+5+1 #each distinct value and item once ("negative" is kept outside the arrays)
+
+        wikifier = Wikifier()
+        wikifier.add_wikification("Q5", ((0, 0), (9, 1)), "Comoros")
+        wikifier.add_wikification("Q6", ((0, 0), (0, 0)), "Comoros", context="other")
+        assert wikifier.item_table.get_item(1, 9, value="Comoros") == "Q5"
+        assert wikifier.item_table.get_item(0, 0, value="Comoros", context="other") == "Q6"
+        assert wikifier.item_table.get_item(2, 0, value="Comoros") is None
+        assert wikifier.lookup_table[""].strings is wikifier.lookup_table["other"].strings
+
+    def test_value_rules(self):
+        import tempfile
+        from t2wml.api import Wikifier
+        wikifier = Wikifier()
+        wikifier.add_dataframe(pd.DataFrame.from_dict({"column": [None, 1, None, 1], "row": [None, None, 2, 2],
+                                                       "value": ["Comoros"]*4, "item": ["Q1", "Q2", "Q3", "Q4"],
+                                                       "context": [""]*4}))
+        item_table = wikifier.item_table
+        assert item_table.get_item(5, 5, value="Comoros") == "Q1" #sheet-wide
+        assert item_table.get_item(1, 5, value="Comoros") == "Q2" #column
+        assert item_table.get_item(5, 2, value="Comoros") == "Q3" #row, before column
+        assert item_table.get_item(1, 2, value="Comoros") == "Q4" #exact cell
+        assert item_table.get_item(1, 2, value="Burundi") is None
+        assert len(wikifier.lookup_table[""]) == 1 and len(item_table.value_rules[""]) == 3
+
+        wikifier.add_wikification("Q5", None, "Burundi", context="other")
+        wikifier.add_value_rule("Q6", "Burundi", context="other", row=3, replace=False)
+        wikifier.add_value_rule("Q7", "Burundi", context="other", replace=False) #there's already a rule
+        assert item_table.get_item(0, 0, value="Burundi", context="other") == "Q5"
+        assert item_table.get_item(0, 3, value="Burundi", context="other") == "Q6"
+
+        with tempfile.TemporaryDirectory() as folder:
+            wikifier.save_to_file(os.path.join(folder, "wikifier.json"))
+            loaded = Wikifier.load_from_file(os.path.join(folder, "wikifier.json"))
+        assert loaded.item_table.value_rules == item_table.value_rules
+        assert dict(loaded.lookup_table[""].items()) == {(1, 2, "Comoros"): "Q4"}
+
+        #old wikifier files that only have values can be loaded directly
+        wikifier = Wikifier()
+        wikifier.add_file(os.path.join(unit_test_folder, "homicide", "wikifier_general.csv"))
+        assert wikifier.item_table.get_item(3, 40, value="Burundi") == "Q967"
+
+    def test_bulk_wikifier_dataframe(self):
+        from t2wml.api import Wikifier
+        from t2wml.wikification.item_table import convert_old_df_to_dict
+        df = pd.DataFrame.from_dict({"column": [0, 1, "", 1, 0, 2.0], "row": [0, 1, 3, None, 0, "4"],
+                                     "value": ["a", "b", "c", 1, "a", "e"], "item": ["Q1", "Q2", "Q3", "Q4", "Q5", None],
+                                     "context": ["", None, "", "other", "", "other"]})
+        wikifier = Wikifier()
+        wikifier.add_wikification("Q0", ((0, 0), (0, 0)), "a")
+        wikifier.add_wikification("Q0", ((1, 1), (1, 1)), "b")
+        wikifier.add_dataframe(df, replace=False)
+        #the same as adding a dict of the dataframe's entries one at a time
+        expected = Wikifier()
+        expected.add_wikification("Q0", ((0, 0), (0, 0)), "a")
+        expected.add_wikification("Q0", ((1, 1), (1, 1)), "b")
+        expected.update_from_dict(convert_old_df_to_dict(df), replace=False)
+        for context in ("", "other"):
+            assert dict(wikifier.item_table.items(context)) == dict(expected.item_table.items(context))
+        item_table = wikifier.item_table
+        assert item_table.get_item(0, 0, value="a") == "Q0" and item_table.get_item(1, 1, value="b") == "Q0"
+        assert item_table.get_item(7, 3, value="c") == "Q3"
+        assert item_table.get_item(1, 8, value="1", context="other") == "Q4"
+        assert item_table.has_item("other", 2, 4, "e")
+
+        wikifier.add_dataframe(df)
+        assert item_table.get_item(0, 0, value="a") == "Q5" #the last entry for a cell is added
+
+    def test_old_wikifier_conversion(self):
+        import tempfile
+        from io import StringIO
+        from t2wml.api import Project, Wikifier
+        from t2wml.wikification.item_table import convert_old_wikifier_to_new, read_old_wikifier
+        data = "a,b,a\nb,a,c\na,c,b\n"
+        sheet = Sheet.load_sheet_from_csv_string(data, data_file_path="data.csv", sheet_name="data.csv", header=None)
+        #a row outside of the sheet has no cells
+        wikifier_csv = "row,column,value,context,item\n,,a,,Q1\n1,,c,,Q2\n,2,b,,Q3\n2,1,,,Q4\n,,missing,,Q5\n7,,a,,Q6\n"
+        expected = {"": {(0, 0, "a"): "Q1", (2, 0, "a"): "Q1", (1, 1, "a"): "Q1", (0, 2, "a"): "Q1",
+                         (2, 1, "c"): "Q2", (2, 2, "b"): "Q3", (1, 2, "c"): "Q4"}}
+        wiki_dict = convert_old_wikifier_to_new(StringIO(wikifier_csv), sheet)
+        assert {context: dict(entries) for context, entries in wiki_dict.items()} == expected
+        df = read_old_wikifier(StringIO(wikifier_csv))
+        assert convert_old_wikifier_to_new(df, sheet) == wiki_dict
+
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, "data.csv"), "w") as f:
+                f.write(data)
+            with open(os.path.join(folder, "wikifier.csv"), "w") as f:
+                f.write(wikifier_csv)
+            project = Project(folder)
+            project.add_data_file("data.csv")
+            project.add_old_style_wikifier_to_project(os.path.join(folder, "wikifier.csv"))
+            wikifier = Wikifier.load_from_file(project.get_wikifier_file("data.csv")[0])
+            assert dict(wikifier.item_table.items("")) == expected[""]
+
+    def test_sqlite_wikifier(self):
+        import pickle
+        import tempfile
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet, SQLiteWikifier
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        sheet = Sheet(os.path.join(test_folder, "homicide_report_total_and_sex.xlsx"), "table-1a")
+        ym = YamlMapper(os.path.join(test_folder, "t2wml", "table-1a.yaml"))
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "wikifier.sqlite")
+            wf = Wikifier()
+            sqlite_wf = SQLiteWikifier(db_path)
+            for wikifier in [wf, sqlite_wf]:
+                wikifier.add_file(os.path.join(test_folder, "wikifier_general.csv")) #value rules
+                wikifier.add_file(os.path.join(test_folder, "wikifier_general.csvtable-1a.csv"))
+                wikifier.add_wikification("Q1", ((5, 0), (5, 2)), "Burundi", context="other")
+                wikifier.add_value_rule("Q2", "Burundi", context="other", column=1, replace=False)
+                wikifier.delete_wikification([[1, 5], [1, 5]], value="Burundi", context="other")
+            sqlite_wf.save_to_file()
+            for column, row, context in [(0, 5, "other"), (1, 5, "other"), (1, 7, "other"), (3, 40, ""), (1, 7, "missing")]:
+                assert sqlite_wf.item_table.get_item(column, row, value="Burundi", context=context) == \
+                    wf.item_table.get_item(column, row, value="Burundi", context=context)
+            expected = KnowledgeGraph.generate(ym, sheet, wf)
+            assert KnowledgeGraph.generate(ym, sheet, sqlite_wf).statements == expected.statements
+            assert KnowledgeGraph.generate(ym, sheet, sqlite_wf, workers=2).statements == expected.statements
+
+            #the data is kept in the database, and other processes get a read-only copy
+            reopened = SQLiteWikifier(db_path, read_only=True)
+            assert sorted(reopened.item_table.contexts()) == ["", "other"]
+            assert sorted(reopened.item_table.items("other"), key=str) == sorted(wf.item_table.items("other"), key=str)
+            unpickled = pickle.loads(pickle.dumps(sqlite_wf.item_table))
+            assert unpickled.read_only and unpickled.get_item(0, 5, value="Burundi", context="other") == "Q1"
+            with self.assertRaises(ValueError):
+                reopened.add_value_rule("Q3", "Comoros")
+
+            #saving to another file saves json, the same as Wikifier
+            sqlite_wf.save_to_file(os.path.join(folder, "wikifier.json"))
+            loaded = Wikifier.load_from_file(os.path.join(folder, "wikifier.json"))
+            assert loaded.item_table.value_rules == wf.item_table.value_rules
+            for item_table in [sqlite_wf.item_table, reopened.item_table, unpickled]:
+                item_table.close()
+
 
     def test_custom_statement_mapper(self):
         from t2wml.mapping.statement_mapper import StatementMapper
@@ -96,6 +257,620 @@ class ClassesTest(unittest.TestCase):
         wf.add_file(w_file)
         kg = KnowledgeGraph.generate(ym, sheet, wf)
 
+    def test_parallel_statements(self):
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        data_file = os.path.join(test_folder, "homicide_report_total_and_sex.xlsx")
+        yaml_file = os.path.join(test_folder, "t2wml", "table-1a.yaml")
+        w_file = os.path.join(test_folder, "wikifier_general.csvtable-1a.csv")
+
+        sheet = Sheet(data_file, "table-1a")
+        ym = YamlMapper(yaml_file)
+        wf = Wikifier()
+        wf.add_file(w_file)
+        serial_kg = KnowledgeGraph.generate(ym, sheet, wf)
+        parallel_kg = KnowledgeGraph.generate(ym, sheet, wf, workers=2)
+        assert list(parallel_kg.statements) == list(serial_kg.statements)
+        assert parallel_kg.statements == serial_kg.statements
+        assert parallel_kg.errors == serial_kg.errors
+
+    def test_vectorized_evaluation(self):
+        import tempfile
+        import threading
+        from t2wml.utils.execution_context import execution_context
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.wikification.utility_functions import add_entities_from_file
+        add_entities_from_file(os.path.join(unit_test_folder, "error-catching", "homicide_properties.tsv"))
+        test_cases = [("belgium-regex", "Belgium.csv", "Belgium.yaml", "wikifier.csv"),
+                      ("error-catching", "input_1.csv", "error.yaml", "wikifier_1.csv")]
+        for folder, data_file, yaml_file, w_file in test_cases:
+            test_folder = os.path.join(unit_test_folder, folder)
+            sheet = Sheet(os.path.join(test_folder, data_file), data_file)
+            ym = YamlMapper(os.path.join(test_folder, yaml_file))
+            wf = Wikifier()
+            wf.add_file(os.path.join(test_folder, w_file))
+            vectorized_kg = KnowledgeGraph.generate(ym, sheet, wf)
+            ym.prepare_cells = lambda *args, **kwargs: None  # evaluate every cell with eval
+            per_cell_kg = KnowledgeGraph.generate(ym, sheet, wf)
+            assert vectorized_kg.statements == per_cell_kg.statements
+            assert vectorized_kg.errors == per_cell_kg.errors
+
+        #threads sharing a mapper each evaluate with the template they prepared
+        yaml_str = """statementMapping:
+  region:
+      range: B2:C3
+  template:
+    subject: =value[A, $row]
+    property: P4153
+    value: =value[$col, $row]
+"""
+        sheets = [Sheet.load_sheet_from_csv_string("name,a,b\nx,{0}1,{0}2\ny,{0}3,{0}4".format(index), header=None)
+                  for index in range(2)]
+        with tempfile.TemporaryDirectory() as folder:
+            yaml_file = os.path.join(folder, "threads.yaml")
+            with open(yaml_file, 'w') as f:
+                f.write(yaml_str)
+            ym = YamlMapper(yaml_file)
+        expected = [KnowledgeGraph.generate(ym, sheet, Wikifier()).statements for sheet in sheets]
+        results = [None, None]
+        prepared, done = [threading.Event(), threading.Event()], [threading.Event(), threading.Event()]
+
+        def run(index):
+            other = 1-index
+            if index:
+                prepared[other].wait()
+            with execution_context():
+                statements = ym.iter_statements(sheets[index], Wikifier())
+                first_result = next(statements) #the first batch is prepared
+                prepared[index].set()
+                #the first thread evaluates the rest of its batch after the second thread has prepared its own
+                (prepared if index == 0 else done)[other].wait()
+                results[index] = {cell: statement for cell, statement, errors in [first_result] + list(statements)}
+                done[index].set()
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == expected
+
+    def test_memoized_evaluation(self):
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.input_processing.yaml_parsing import TemplateParser
+        from t2wml.wikification.utility_functions import add_entities_from_file
+        parser = TemplateParser({})
+        for code_str, dependency in [("=value[A, $row]", "row"), ("=item[$col, 3]", "col"),
+                                     ("=concat(value[$col, 1], $sheet, sep='-')", "col"),
+                                     ("=value[$col, $row-$n]", "cell"), ("=value[$qcol, 2]", "cell"),
+                                     ("=value[B, $end]", "constant"), ("=value[A, $row-$n]", "row")]:
+            assert parser.get_code_replacement(code_str).dependency == dependency
+        homicide_folder = os.path.join(unit_test_folder, "homicide")
+        add_entities_from_file(os.path.join(homicide_folder, "homicide_properties.tsv"))
+        for sheet_name in ["table-1a", "table-2b", "table-10a"]:
+            sheet = Sheet(os.path.join(homicide_folder, "homicide_report_total_and_sex.xlsx"), sheet_name)
+            ym = YamlMapper(os.path.join(homicide_folder, "t2wml", sheet_name+".yaml"))
+            wf = Wikifier()
+            wf.add_file(os.path.join(homicide_folder, "wikifier_general.csv"+sheet_name+".csv"))
+            memoized_kg = KnowledgeGraph.generate(ym, sheet, wf)
+            ym.prepare_cells = lambda *args, **kwargs: None
+            per_cell_kg = KnowledgeGraph.generate(ym, sheet, wf)
+            assert memoized_kg.statements == per_cell_kg.statements
+            assert memoized_kg.errors == per_cell_kg.errors
+
+    def test_property_type_table(self):
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet, t2wml_settings
+        from t2wml.utils.execution_context import execution_context, ExecutionContext
+        from t2wml.wikification.wikidata_provider import DictionaryProvider
+        from t2wml.wikification.utility_functions import add_entities_from_file
+
+        class CountingProvider(DictionaryProvider):
+            def __init__(self):
+                super().__init__({}, sparql_endpoint="DO NOT QUERY")
+                self.lookups = []
+                self.batches = []
+
+            def get_property_type(self, wikidata_property, *args, **kwargs):
+                self.lookups.append(wikidata_property)
+                return super().get_property_type(wikidata_property)
+
+            def get_property_types(self, wikidata_properties, *args, **kwargs):
+                self.batches.append(sorted(wikidata_properties))
+                return super().get_property_types(wikidata_properties)
+
+        homicide_folder = os.path.join(unit_test_folder, "homicide")
+        sheet = Sheet(os.path.join(homicide_folder, "homicide_report_total_and_sex.xlsx"), "table-1a")
+        ym = YamlMapper(os.path.join(homicide_folder, "t2wml", "table-1a.yaml"))
+        wf = Wikifier()
+        wf.add_file(os.path.join(homicide_folder, "wikifier_general.csvtable-1a.csv"))
+        add_entities_from_file(os.path.join(homicide_folder, "homicide_properties.tsv"))
+        expected = KnowledgeGraph.generate(ym, sheet, wf)
+        with execution_context(ExecutionContext()):
+            provider = CountingProvider()
+            t2wml_settings.wikidata_provider = provider
+            add_entities_from_file(os.path.join(homicide_folder, "homicide_properties.tsv"))
+            provider.cache.update({"P585": {"data_type": "Time"}, "P6001": {"data_type": "WikibaseItem"},
+                                   "P123": {"data_type": "WikibaseItem"}})
+            kg = KnowledgeGraph.generate(ym, sheet, wf)
+            assert provider.batches == [["P100024", "P123", "P585", "P6001"]]
+            assert provider.lookups == []
+            kg.get_output("tsv")
+            assert provider.lookups == ["P100024", "P585", "P6001", "P123"]  # once each, not once per statement
+        assert kg.statements == expected.statements
+        assert kg.errors == expected.errors
+
+        #threads entering and leaving tables out of order don't leave one installed
+        import threading
+        from t2wml.wikification import utility_functions
+        from t2wml.wikification.utility_functions import property_type_table
+        a_entered, b_entered, a_left = threading.Event(), threading.Event(), threading.Event()
+        seen = {}
+        def thread_a():
+            with property_type_table() as table:
+                a_entered.set()
+                b_entered.wait(5)
+                seen["a"] = utility_functions._current_property_types.get() is table
+            a_left.set()
+        def thread_b():
+            a_entered.wait(5)
+            with property_type_table() as table:
+                b_entered.set()
+                a_left.wait(5)
+                seen["b"] = utility_functions._current_property_types.get() is table
+            seen["b after"] = utility_functions._current_property_types.get()
+        threads = [threading.Thread(target=thread_a), threading.Thread(target=thread_b)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert seen == {"a": True, "b": True, "b after": None}
+        assert utility_functions._current_property_types.get() is None
+
+    def test_compiled_qualifier_regions(self):
+        import tempfile
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.input_processing.region import CompiledRegion
+        from t2wml.input_processing.yaml_parsing import TemplateParser
+        from t2wml.utils.bindings import update_bindings
+        yaml_str = """statementMapping:
+  region:
+      range: B2:D4
+  template:
+    subject: =value[A, $row]
+    property: P4153
+    value: =value[$col, $row]
+    qualifier:
+      - property: P5428
+        region:
+          left: =$col+1
+          right: E
+          top: =$row
+          bottom: =$row
+        value: =value[$qcol, $qrow]
+      - property: P2719
+        region:
+          range: B1:E1
+        value: =value[$qcol, $qrow]
+"""
+        sheet = Sheet.load_sheet_from_csv_string("name,a,b,c,d\nx,1,2,3,4\ny,5,6,7,8\nz,9,10,11,12", header=None)
+        with tempfile.TemporaryDirectory() as folder:
+            yaml_file = os.path.join(folder, "qualifier_regions.yaml")
+            with open(yaml_file, 'w') as f:
+                f.write(yaml_str)
+            ym = YamlMapper(yaml_file)
+            kg = KnowledgeGraph.generate(ym, sheet, Wikifier())
+        row_region, constant_region = [q["region"] for q in ym.template.eval_template["qualifier"]]
+        assert isinstance(row_region, CompiledRegion) and row_region.variables == ("t_var_row", "t_var_col")
+        assert constant_region.variables == ()
+        assert len(kg.statements) == 9
+        for (col, row), statement in kg.statements.items():
+            row_values = [q["value"] for q in statement["qualifier"] if q["property"] == "P5428"]
+            assert row_values == [str(sheet[row, c]) for c in range(col+1, 5)]
+            header_values = [q["value"] for q in statement["qualifier"] if q["property"] == "P2719"]
+            assert header_values == ["a", "b", "c", "d"]
+
+        #regions that use item[] aren't cached, the item table can be edited in place
+        wf = Wikifier()
+        update_bindings(item_table=wf.item_table, sheet=sheet)
+        item_region = TemplateParser({"region": {"left": '=2+(item[$col, 1] == "Q1")', "right": "E", "top": 1, "bottom": 1}}).eval_template["region"]
+        item_region = CompiledRegion(item_region)
+        context = {"t_var_row": 2, "t_var_col": 2}
+        assert not item_region.cacheable and [col for col, row in item_region.instantiate(context)] == [2, 3, 4, 5]
+        wf.add_dataframe(pd.DataFrame.from_dict({"column": [1], "row": [0], "value": ["a"], "item": ["Q1"], "context": [""]}))
+        assert [col for col, row in item_region.instantiate(context)] == [3, 4, 5]
+
+    def test_region_cache(self):
+        from t2wml.api import Sheet
+        from t2wml.input_processing.region import YamlRegion, region_cache, clear_region_cache
+        from t2wml.utils.bindings import update_bindings
+        from t2wml.wikification.item_table import ItemTable
+        from t2wml.utils.execution_context import execution_context
+        yaml_data = {"left": "A", "right": "B", "top": 1, "bottom": "=$end",
+                     "skip_rows": ['=value[A, $row] == "x"']}
+        short_sheet = Sheet.load_sheet_from_csv_string("a,b\n1,2", header=None)
+        long_sheet = Sheet.load_sheet_from_csv_string("a,b\nx,2\n3,4", header=None)
+        clear_region_cache()
+        hits, misses = region_cache.hits, region_cache.misses
+
+        def counts():
+            return region_cache.hits-hits, region_cache.misses-misses
+
+        def rows(sheet):
+            update_bindings(sheet=sheet, item_table=None)
+            return list(YamlRegion(yaml_data).index_dict)
+
+        with execution_context():
+            assert rows(short_sheet) == [1, 2]
+            assert rows(long_sheet) == [1, 3]
+            assert counts() == (0, 2)
+            assert rows(short_sheet) == [1, 2]
+            assert rows(long_sheet) == [1, 3]
+            assert counts() == (2, 2)
+            self.addCleanup(setattr, region_cache, "maxsize", region_cache.maxsize)
+            region_cache.maxsize = 2
+            long_sheet.set_value(1, 0, "y")
+            assert rows(long_sheet) == [1, 2, 3]
+            assert counts() == (2, 3) and len(region_cache) == 2
+            assert rows(short_sheet) == [1, 2]  # the least recently used entry was dropped
+            assert counts() == (2, 4)
+
+            # regions that use item[] depend on the wikifier, and aren't cached
+            item_table = ItemTable()
+            item_yaml = {"left": "A", "right": "B", "top": 1, "bottom": 3, "skip_rows": ['=item[A, $row] == "Q1"']}
+            update_bindings(sheet=long_sheet, item_table=item_table)
+            assert list(YamlRegion(item_yaml).index_dict) == [1, 2, 3]
+            item_table.set_item("", 0, 2, "3", "Q1")
+            assert list(YamlRegion(item_yaml).index_dict) == [1, 2]
+            assert counts() == (2, 4)
+
+    def test_compact_region(self):
+        from t2wml.api import Sheet
+        from t2wml.input_processing.region import YamlRegion
+        from t2wml.utils.bindings import update_bindings
+        from t2wml.utils.execution_context import execution_context
+        with execution_context():
+            update_bindings(sheet=Sheet.load_sheet_from_csv_string("a,b", header=None), item_table=None)
+            region = YamlRegion({"range": "A1:ZZ1000000", "skip_rows": [5, 7], "skip_cells": ["B3"]})
+            assert len(region) == 702*999998-1
+            assert region.last_row == 1000000
+            assert (3, 9) in region and (2, 3) not in region and (1, 5) not in region
+            assert list(region.iter_rows(4, 6))[:2] == [(1, 4), (2, 4)] and len(list(region.iter_rows(4, 6))) == 702*2
+
+            region = YamlRegion({"columns": [3, 1, 3], "rows": [4, 2], "skip_cells": ["A2"], "cells": ["E2", "B9"]})
+            assert dict(region.index_dict.items()) == {4: [3, 1, 3], 2: [3, 3, 5], 9: [2]}
+            assert list(region) == [(3, 4), (1, 4), (3, 4), (3, 2), (3, 2), (5, 2), (2, 9)]
+            assert list(region.iter_rows(1, 5)) == [(3, 2), (3, 2), (5, 2), (3, 4), (1, 4), (3, 4)]
+            assert len(region) == 7 and region.last_row == 9
+
+    def test_vectorized_region_predicates(self):
+        from unittest import mock
+        from t2wml.api import Sheet
+        from t2wml.input_processing.region import YamlRegion
+        from t2wml.parsing.vectorized_evaluation import VectorizedPredicate
+        from t2wml.utils.bindings import update_bindings
+        from t2wml.utils.execution_context import execution_context
+        sheet = Sheet.load_sheet_from_csv_string("a,,abc,x\n,bc, ,x\nab,c,,\n1,abc,b,x", header=None)
+        col, row, cell = ("t_var_col",), ("t_var_row",), ("t_var_col", "t_var_row")
+        arguments = [("columns", '=value[$col, 1] != "" -> $col', col),
+                     ("columns", '=(contains(value[$col, 4], "b") or value[$col, 1] == "a") -> $col', col),
+                     ("rows", '=not value[A, $row] -> $row', row),
+                     ("rows", '=(starts_with(value[C, $row], "a") or not value[B, $row] and value[D, $row] == "x") -> $row', row),
+                     ("cells", '=ends_with(value[$col, $row], "c") -> ($col, $row)', cell),
+                     ("skip_cells", '=value[$col, $row] != "x" and not value[$col, $row] -> ($col, $row)', cell),
+                     ("skip_cells", '=value[$col, $row] == 1 -> ($col, $row)', cell)]
+        with execution_context():
+            update_bindings(sheet=sheet, item_table=None)
+            for key, argument, variables in arguments:
+                yaml_data = {"range": "A1:D4", key: [argument]}
+                code = YamlRegion(yaml_data, use_cache=False).get_code_replacement(argument)
+                assert VectorizedPredicate.create(code.code_str, variables) is not None
+                vectorized = list(YamlRegion(yaml_data, use_cache=False))
+                with mock.patch.object(VectorizedPredicate, "create", return_value=None):
+                    assert vectorized == list(YamlRegion(yaml_data, use_cache=False))
+
+    def test_concurrent_generate(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.wikification.utility_functions import add_entities_from_file
+        add_entities_from_file(os.path.join(unit_test_folder, "homicide", "homicide_properties.tsv"))
+        homicide_folder = os.path.join(unit_test_folder, "homicide")
+        test_cases = []
+        for sheet_name in ["table-1a", "table-1b", "table-2a", "table-2b"]:
+            test_cases.append((os.path.join(homicide_folder, "homicide_report_total_and_sex.xlsx"), sheet_name,
+                               os.path.join(homicide_folder, "t2wml", sheet_name+".yaml"),
+                               os.path.join(homicide_folder, "wikifier_general.csv"+sheet_name+".csv")))
+
+        def generate(test_case):
+            data_file, sheet_name, yaml_file, w_file = test_case
+            wf = Wikifier()
+            wf.add_file(w_file)
+            kg = KnowledgeGraph.generate(YamlMapper(yaml_file), Sheet(data_file, sheet_name), wf)
+            return kg.statements, kg.errors
+
+        serial_results = [generate(test_case) for test_case in test_cases]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            concurrent_results = list(executor.map(generate, test_cases*2))
+        assert concurrent_results == serial_results*2
+
+    def test_stream_statements(self):
+        import json
+        import tempfile
+        from unittest import mock
+        from t2wml.outputs import kgtk
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.wikification.utility_functions import add_entities_from_file
+        from t2wml.utils.t2wml_exceptions import FileTypeNotSupportedException
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        add_entities_from_file(os.path.join(test_folder, "homicide_properties.tsv"))
+        sheet = Sheet(os.path.join(test_folder, "homicide_report_total_and_sex.xlsx"), "table-1a")
+        ym = YamlMapper(os.path.join(test_folder, "t2wml", "table-1a.yaml"))
+        wf = Wikifier()
+        wf.add_file(os.path.join(test_folder, "wikifier_general.csvtable-1a.csv"))
+        kg = KnowledgeGraph.generate(ym, sheet, wf)
+
+        streamed_statements = {}
+        streamed_errors = {}
+        for cell, statement, errors in KnowledgeGraph.iter_statements(ym, sheet, wf):
+            if statement is not None:
+                streamed_statements[cell] = statement
+            if errors:
+                streamed_errors[cell] = errors
+        assert list(streamed_statements) == list(kg.statements)
+        assert streamed_statements == kg.statements
+        assert streamed_errors == dict(kg.errors)
+
+        with tempfile.TemporaryDirectory() as folder:
+            output_file = os.path.join(folder, "test_stream.tsv")
+            errors = KnowledgeGraph.stream_to_file(ym, sheet, wf, output_file, "tsv")
+            with open(output_file, 'r', encoding="utf-8") as f:
+                assert f.read() == kg.get_output("tsv")
+            assert errors == dict(kg.errors)
+
+            output_file = os.path.join(folder, "test_stream.jsonl")
+            KnowledgeGraph.stream_to_file(ym, sheet, wf, output_file, "jsonl")
+            with open(output_file, 'r', encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+            assert {line["cell"]: line["statement"] for line in lines} == json.loads(kg.get_output("json"))
+
+            #statements that can't be converted to kgtk are reported as errors
+            failing_cell = list(kg.statements)[0]
+            convert = kgtk.add_statement_kgtk_rows
+            def failing_convert(rows, cell, statement, *args):
+                if cell == failing_cell:
+                    raise ValueError("can't convert")
+                convert(rows, cell, statement, *args)
+            with mock.patch.object(kgtk, "add_statement_kgtk_rows", failing_convert):
+                errors = KnowledgeGraph.stream_to_file(ym, sheet, wf, os.path.join(folder, "test_stream.tsv"), "tsv")
+            assert errors[failing_cell][-1]["message"] == "can't convert"
+
+            #an unsupported filetype is rejected before the output file is opened
+            with self.assertRaises(FileTypeNotSupportedException):
+                KnowledgeGraph.stream_to_file(ym, sheet, wf, output_file, "xml")
+            with open(output_file, 'r', encoding="utf-8") as f:
+                assert len(f.read().splitlines()) == len(lines)
+
+    def test_mapping_session(self):
+        import tempfile
+        from t2wml.api import KnowledgeGraph, YamlMapper, Wikifier, Sheet
+        from t2wml.mapping.session import MappingSession
+        from t2wml.wikification.utility_functions import add_entities_from_file
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        add_entities_from_file(os.path.join(test_folder, "homicide_properties.tsv"))
+        yaml_file = os.path.join(test_folder, "t2wml", "table-10a.yaml")
+        sheet = Sheet(os.path.join(test_folder, "homicide_report_total_and_sex.xlsx"), "table-10a")
+        wf = Wikifier()
+        wf.add_file(os.path.join(test_folder, "wikifier_general.csvtable-10a.csv"))
+        session = MappingSession(YamlMapper(yaml_file), sheet, wf)
+
+        def check():
+            kg = KnowledgeGraph.generate(YamlMapper(yaml_file), sheet, wf)
+            assert list(session.statements) == list(kg.statements)
+            assert session.statements == kg.statements
+            assert session.errors == dict(kg.errors)
+        check()
+
+        edits = [{(0, 5): ""}, {(0, 5): "Burundi"}, {(1, 6): "12", (2, 7): "abc"}, {(0, 4): ""}, {(3, 3): ""}]
+        for edit in edits:
+            reevaluated = session.update_cells(edit)
+            assert len(reevaluated) < len(session.region)
+            check()
+
+        wf.add_dataframe(pd.DataFrame.from_dict({"column": [0], "row": [5], "value": ["Burundi"], "item": ["Q99"], "context": [""]}))
+        session.update_wikifier([(0, 5)])
+        check()
+
+        #a qualifier region that depends on the wikifier
+        yaml_str = """statementMapping:
+  region:
+      range: B2:C3
+  template:
+    subject: =value[A, $row]
+    property: P4153
+    value: =value[$col, $row]
+    qualifier:
+      - property: P2719
+        region:
+          left: =2+(item[B, 1] == "Q1")
+          right: D
+          top: 1
+          bottom: 1
+        value: =value[$qcol, $qrow]
+"""
+        sheet = Sheet.load_sheet_from_csv_string("name,a,b,c\nx,1,2,3\ny,4,5,6", header=None)
+        wf = Wikifier()
+        with tempfile.TemporaryDirectory() as folder:
+            yaml_file = os.path.join(folder, "item_region.yaml")
+            with open(yaml_file, 'w') as f:
+                f.write(yaml_str)
+            session = MappingSession(YamlMapper(yaml_file), sheet, wf)
+            check()
+            wf.add_dataframe(pd.DataFrame.from_dict({"column": [1], "row": [0], "value": ["a"], "item": ["Q1"], "context": [""]}))
+            session.update_wikifier([(1, 0)])
+            check()
+        for statement in session.statements.values():
+            assert [q["value"] for q in statement["qualifier"]] == ["b", "c"]
+
+    def test_n_lookup(self):
+        from t2wml.utils.bindings import update_bindings
+        from t2wml.input_processing.yaml_parsing import TemplateParser
+        from t2wml.parsing.t2wml_parsing import iter_on_n, iter_on_n_for_code
+        from t2wml.utils.t2wml_exceptions import CellOutsideofBoundsException
+        data = [["a", "", "b", None],
+                ["", "  ", "", "c"],
+                [None, "d", "", ""],
+                ["e", "", "", "f"],
+                ["", "", "g", ""]]
+        sheet = Sheet("test.csv", "test.csv", data=pd.DataFrame(data))
+        update_bindings(sheet=sheet, item_table=None)
+        expressions = ["=value[A, $row-$n]", "=value[B, $row+$n]", "=value[$col-$n, $row]", "=value[$col+$n+1, $row-2]",
+                       "=value[C, -$n]", "=value[A, $row-$n] != \"\" -> value[A, $row-$n]"]
+
+        def evaluate(function):
+            try:
+                result = function()
+            except CellOutsideofBoundsException:
+                return "out of bounds"
+            if result is None:
+                return None
+            return result.col, result.row, result.value
+
+        for expression in expressions:
+            code = TemplateParser({"value": expression}).eval_template["value"]
+            assert code.n_lookup is not None
+            for col in range(1, 6):
+                for row in range(1, 7):
+                    context = {"t_var_row": row, "t_var_col": col}
+                    assert evaluate(lambda: iter_on_n_for_code(code, context)) == evaluate(lambda: iter_on_n(code.code, context))
+
+    def test_lazy_spreadsheet_file(self):
+        from unittest import mock
+        from t2wml.api import SpreadsheetFile
+        from t2wml.spreadsheets.utilities import PandasLoader
+        data_file = os.path.join(unit_test_folder, "homicide", "homicide_report_total_and_sex.xlsx")
+        with mock.patch.object(PandasLoader, "load_sheet", autospec=True, side_effect=PandasLoader.load_sheet) as load_sheet:
+            spreadsheet_file = SpreadsheetFile(data_file)
+            assert len(spreadsheet_file) > 2 and "table-1a" in spreadsheet_file and "table-x" not in spreadsheet_file
+            assert load_sheet.call_count == 0
+            sheet = spreadsheet_file["table-1a"]
+            assert spreadsheet_file["table-1a"] is sheet and load_sheet.call_count == 1
+
+            spreadsheet_file = SpreadsheetFile(data_file, max_loaded_sheets=1)
+            sheet = spreadsheet_file["table-1a"]
+            spreadsheet_file["table-1b"]
+            assert spreadsheet_file["table-1a"] is not sheet and load_sheet.call_count == 4
+            assert spreadsheet_file["table-1a"].raw_data.equals(sheet.raw_data)
+
+    def test_parsed_sheet_cache(self):
+        import tempfile
+        from t2wml.api import Sheet
+        from t2wml.settings import T2WMLSettings
+        from t2wml.spreadsheets.sheet_cache import parsed_sheet_cache
+        from t2wml.utils.execution_context import ExecutionContext, execution_context
+        with tempfile.TemporaryDirectory() as folder:
+            settings = T2WMLSettings()
+            settings.cache_folder = os.path.join(folder, "cache")
+            data_file = os.path.join(folder, "data.csv")
+            with open(data_file, 'w', encoding="utf-8") as f:
+                f.write("a,schön,\n1,😊,x\n")
+            with execution_context(ExecutionContext(settings=settings)):
+                hits = parsed_sheet_cache.hits
+                parsed = Sheet(data_file, "data.csv")
+                cached = Sheet(data_file, "data.csv")
+                assert parsed_sheet_cache.hits == hits+1
+                assert cached.raw_data.equals(parsed.raw_data)
+                assert cached.raw_data.values.tolist() == [["a", "schön", ""], ["1", "😊", "x"]]
+
+                with open(data_file, 'w', encoding="utf-8") as f:
+                    f.write("b,c\n")
+                assert Sheet(data_file, "data.csv").raw_data.values.tolist() == [["b", "c"]]
+                assert parsed_sheet_cache.hits == hits+1
+                assert len(os.listdir(parsed_sheet_cache.folder())) == 6
+
+                max_bytes, parsed_sheet_cache.max_bytes = parsed_sheet_cache.max_bytes, 0
+                parsed_sheet_cache.evict()
+                parsed_sheet_cache.max_bytes = max_bytes
+                assert os.listdir(parsed_sheet_cache.folder()) == []
+
+    def test_compact_sheet(self):
+        import pickle
+        import tempfile
+        import numpy as np
+        from t2wml.api import Sheet
+        from t2wml.settings import T2WMLSettings
+        from t2wml.spreadsheets.compact_values import CompactValues
+        from t2wml.spreadsheets.non_empty_index import is_non_empty
+        from t2wml.spreadsheets.sheet_cache import parsed_sheet_cache
+        from t2wml.utils.execution_context import ExecutionContext, execution_context
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        data_file = os.path.join(test_folder, "homicide_report_total_and_sex.xlsx")
+        sheet = Sheet(data_file, "table-1a")
+        with tempfile.TemporaryDirectory() as folder:
+            settings = T2WMLSettings()
+            settings.cache_folder = folder
+            with execution_context(ExecutionContext(settings=settings)):
+                compact = Sheet(data_file, "table-1a", compact=True)
+                assert compact.is_compact and not sheet.is_compact
+                assert isinstance(compact._data_values.data, np.memmap)
+                #the streamed sheet is cached apart from the one pandas reads, so a regular sheet loads pandas' data
+                assert parsed_sheet_cache.get_arrays(data_file, "table-1a") is None
+                assert Sheet(data_file, "table-1a").raw_data.values.tolist() == sheet.raw_data.values.tolist()
+                values = sheet._data_values
+                assert (compact.row_len, compact.col_len) == (sheet.row_len, sheet.col_len)
+                assert compact[3, 1] == values[3, 1]
+                assert compact[2:7, 0:3].tolist() == values[2:7, 0:3].tolist()
+                assert compact[1:4, 2].tolist() == values[1:4, 2].tolist()
+                rows, cols = np.array([0, 5, -1]), np.array([1, 2, 0])
+                assert compact[rows, cols].tolist() == values[rows, cols].tolist()
+                #the fingerprint and the non-empty cells are calculated from the buffers, without creating the dataframe
+                fingerprint = compact.fingerprint
+                assert (compact.non_empty_index.non_empty == sheet.non_empty_index.non_empty).all()
+                assert compact._raw_data is None
+
+                #pickling memory-mapped values only pickles the paths of the files
+                assert len(pickle.dumps(compact._data_values)) < 1000
+                assert pickle.loads(pickle.dumps(compact._data_values)).to_array().tolist() == values.tolist()
+
+                compact.set_value(3, 1, "edited")
+                assert compact.fingerprint != fingerprint
+                assert compact[3, 1] == "edited" and compact.raw_data.iat[3, 1] == "edited"
+
+        in_memory = CompactValues.from_array(np.array([["a", "😊"], [None, "b"]], dtype=object))
+        assert in_memory[1, 0] is None and in_memory[0, 1] == "😊"
+        assert pickle.loads(pickle.dumps(in_memory)).to_array().tolist() == [["a", "😊"], [None, "b"]]
+        assert in_memory.has_non_string_cells
+        whitespace = CompactValues.from_array(np.array([["", " \t"], ["\xa0", "\u2003x"], ["\x1c", "é "]], dtype=object))
+        assert whitespace.non_empty(is_non_empty).tolist() == [[False, False], [False, True], [False, True]]
+        assert not whitespace.has_non_string_cells
+
+    def test_streaming_xlsx(self):
+        import tempfile
+        import openpyxl
+        from openpyxl.styles import Font
+        from t2wml.api import Sheet
+        from t2wml.spreadsheets import xlsx_streaming
+        from t2wml.spreadsheets.xlsx_streaming import stream_xlsx_sheet
+        test_folder = os.path.join(unit_test_folder, "homicide")
+        data_file = os.path.join(test_folder, "homicide_report_total_and_sex.xlsx")
+        for sheet_name in ["table-1a", "table-10a"]:
+            values = stream_xlsx_sheet(data_file, sheet_name)
+            assert values.to_array().tolist() == Sheet(data_file, sheet_name).raw_data.values.tolist()
+            assert Sheet(data_file, sheet_name, compact=True)._data_values.to_array().tolist() == values.to_array().tolist()
+
+        with tempfile.TemporaryDirectory() as folder:
+            data_file = os.path.join(folder, "formatted.xlsx")
+            workbook = openpyxl.Workbook()
+            worksheet = workbook.active
+            worksheet.append(["a", 1, 2.5])
+            worksheet.append([None, "schön", None])
+            worksheet.cell(row=1, column=5000).font = Font(bold=True) #formatting far outside the data
+            worksheet.cell(row=900, column=2).font = Font(bold=True)
+            workbook.save(data_file)
+            values = stream_xlsx_sheet(data_file)
+            assert values.to_array().tolist() == pd.read_excel(data_file, dtype=str, header=None, na_filter=False).values.tolist()
+            assert values.to_array()[:, :3].tolist() == [["a", "1", "2.5"], ["", "schön", ""]]
+            if xlsx_streaming.TRIM_EMPTY_COLUMNS:
+                assert values.shape == (2, 3)
+
 class ProjectTest(unittest.TestCase):
     def test_project_asingle(self):
         from t2wml.api import Project
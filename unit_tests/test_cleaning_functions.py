@@ -99,6 +99,102 @@ class TestDataFrame(unittest.TestCase):
         assert cleaned.iloc[2, 8]=="QWERTYUIOP"
         assert cleaned.iloc[3, 4]=="00forpadding"
 
+    def test_vectorized_cleaning(self):
+        import numpy as np
+        from t2wml.input_processing.clean_yaml_parsing import apply_cleaning_functions, compose, create_lambda
+        values = ["  1,234.5 ", "abc  def", "", None, "12.5$", "x\t y", "שלום 7", "1e5", "-.5", "nan", "10 20", "ab_c😊"]
+        function_lists = [[("strip_whitespace", {}), ("change_case", {"case": "title"})],
+                          [("strip_whitespace", {"where": "everywhere"}), ("make_numeric", {})],
+                          [("make_numeric", {"decimal": ","}), ("pad", {"length": 8, "pad_text": "0"})],
+                          [("replace_regex", {"to_replace": r"(\d)", "replacement": r"<\1>", "count": 1}), ("truncate", {"length": 6})],
+                          [("normalize_whitespace", {"tab": True}), ("remove_numbers", {"where": "start_and_end"})],
+                          [("remove_letters", {}), ("fill_empty", {"replacement": "EMPTY"})],
+                          [("make_alphanumeric", {}), ("make_ascii", {}), ("pad", {"length": 7, "pad_text": "xo", "where": "end"})],
+                          [("change_case", {"case": "unknown"}), ("make_ascii", {"translate": True})]]
+        for functions in function_lists:
+            composed = compose(*[create_lambda(name, **kwargs) for name, kwargs in functions])
+            vectorized = apply_cleaning_functions(np.array(values, dtype=object), functions)
+            assert list(vectorized) == [composed(value) for value in values]
+
+    def test_factorized_cleaning(self):
+        import numpy as np
+        from unittest import mock
+        from t2wml.input_processing.clean_yaml_parsing import apply_cleaning_functions
+        from t2wml.parsing.cleaning_functions import cleaning_functions_dict
+        calls = []
+        def counting_ftfy(input):
+            calls.append(input)
+            return ftfy(input)
+        values = np.array(["schÃ¶n", "Burundi", None, 1, "1"]*100, dtype=object)
+        with mock.patch.dict(cleaning_functions_dict, ftfy=counting_ftfy):
+            cleaned = apply_cleaning_functions(values, [("ftfy", {}), ("make_ascii", {"translate": True})])
+        assert sorted(calls) == ["1", "Burundi", "schÃ¶n"]
+        assert list(cleaned) == ["schon", "Burundi", None, "1", "1"]*100
+
+    def test_cleaned_data_cache(self):
+        import tempfile
+        from unittest import mock
+        from t2wml.api import Sheet
+        from t2wml.input_processing import clean_yaml_parsing
+        import numpy as np
+        from t2wml.input_processing.clean_yaml_parsing import cleaned_data_cache, clear_cleaned_data_cache, get_cleaned_columns, \
+            cleaned_data_cache_key, encode_columns, decode_columns
+        from t2wml.settings import T2WMLSettings
+        from t2wml.utils.execution_context import ExecutionContext, execution_context
+        mapping = [{"region": {"range": "A1:B2"}, "functions": [{"change_case": {"case": "upper"}}]}]
+        sheet = Sheet.load_sheet_from_csv_string("a,b\nc,d", header=None)
+        same_sheet = Sheet.load_sheet_from_csv_string("a,b\nc,d", header=None)
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.object(clean_yaml_parsing, "DFCleaner", wraps=clean_yaml_parsing.DFCleaner) as cleaner:
+            settings = T2WMLSettings()
+            settings.cache_folder = folder
+            with execution_context(ExecutionContext(settings=settings)):
+                clear_cleaned_data_cache()
+                cleaned = get_cleaned_dataframe(sheet, mapping)
+                assert get_cleaned_columns(same_sheet, mapping) is get_cleaned_columns(sheet, mapping)
+                assert cleaner.call_count == 1
+                clear_cleaned_data_cache()
+                disk_hits = cleaned_data_cache.disk_hits
+                assert get_cleaned_dataframe(same_sheet, mapping).equals(cleaned)
+                assert cleaner.call_count == 1 and cleaned_data_cache.disk_hits == disk_hits+1
+                assert os.listdir(os.path.join(folder, "cleaned_data")) == [cleaned_data_cache_key(sheet, mapping)+".npz"]
+                assert get_cleaned_dataframe(sheet, [{"region": {"range": "A1:B2"}, "functions": ["ftfy"]}]).iloc[0, 0] == "a"
+                same_sheet.set_value(0, 0, "x")
+                assert get_cleaned_dataframe(same_sheet, mapping).iloc[0, 0] == "X"
+                assert cleaner.call_count == 3
+            clear_cleaned_data_cache()
+        #saved without pickle, None values survive and other values aren't saved
+        columns = {2: np.array(["a", None, "ü"], dtype=object), 0: np.array(["", "b", None], dtype=object)}
+        restored = decode_columns(**encode_columns(columns))
+        assert list(restored) == [2, 0] and all(list(restored[col]) == list(columns[col]) for col in columns)
+        assert decode_columns(**encode_columns({})) == {}
+        assert encode_columns({0: np.array(["a", 1.5], dtype=object)}) is None
+
+    def test_cleaned_overlay(self):
+        import numpy as np
+        from t2wml.api import Sheet
+        from t2wml.input_processing.clean_yaml_parsing import get_cleaned_columns
+        from t2wml.spreadsheets.cleaned_values import CleanedValues
+        csv = "a,b,c\n d ,e,f\ng, h ,i"
+        mapping = [{"region": {"range": "A1:A3"}, "functions": ["strip_whitespace", {"change_case": {"case": "upper"}}]},
+                   {"region": {"cells": ["B3"]}, "functions": ["strip_whitespace"]}]
+        sheet = Sheet.load_sheet_from_csv_string(csv, header=None)
+        full_sheet = Sheet.load_sheet_from_csv_string(csv, header=None)
+        full_sheet.cleaned_data = get_cleaned_dataframe(full_sheet, mapping)
+        sheet.set_cleaned_columns(get_cleaned_columns(sheet, mapping))
+        values = sheet._data_values
+        assert isinstance(values, CleanedValues) and sorted(values.columns) == [0, 1]
+        expected = full_sheet._data_values
+        assert values.shape == expected.shape == (3, 3)
+        assert [sheet[row, col] for row in range(3) for col in range(3)] == list(expected.flat)
+        assert (values[0:2, 0:3] == expected[0:2, 0:3]).all() and (values[1, 0:2] == expected[1, 0:2]).all()
+        rows, cols = np.array([2, 1, 0]), np.array([-3, 1, 2])
+        assert (values[rows, cols] == expected[rows, cols]).all()
+        assert (sheet.non_empty_index.non_empty == full_sheet.non_empty_index.non_empty).all()
+        assert sheet.fingerprint == full_sheet.fingerprint
+        assert sheet.cleaned_data.equals(full_sheet.cleaned_data)
+        assert sheet.raw_data.iloc[1, 0] == " d "
+
 
 
     